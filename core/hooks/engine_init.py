@@ -0,0 +1,33 @@
+# Copyright (c) 2018 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Hook that gets executed every time an engine has been fully initialized.
+"""
+
+import os
+import sys
+
+from tank import Hook
+
+
+class EngineInit(Hook):
+
+    def execute(self, engine, **kwargs):
+        """
+        Prefetches the Software -> rez package registry of the project in the
+        background, so that launches and farm submissions don't wait on it.
+        """
+        hooks_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'hooks')
+        if hooks_path not in sys.path:
+            sys.path.append(hooks_path)
+        import software_registry
+
+        software_registry.prefetch(engine.sgtk, engine.context.project)
@@ -17,11 +17,18 @@ This hook is executed to launch the applications.
 import os
 import re
 import sys
+import json
+import shlex
+import hashlib
 import subprocess
 import platform
 import tank
 import sgtk
 
+sys.path.append(os.path.dirname(__file__))
+import software_registry
+import launch_server
+
 #rez append 
 #sys.path.append("/westworld/inhouse/rez/lib/python2.7/site-packages/rez-2.23.1-py2.7.egg")
 
@@ -37,6 +44,11 @@ ENGINES = {
     'tk-unreal' : 'unreal'
 }
 
+# resolved rez contexts (.rxt) reused between launches while the package
+# repositories they were resolved from are unchanged
+REZ_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sgtk_rez_cache')
+# location of the rez module, found once per machine
+REZ_ROOT_CACHE_FILE = os.path.join(REZ_CACHE_DIR, 'rez_root')
 
 
 class AppLaunch(tank.Hook):
@@ -69,12 +81,11 @@ class AppLaunch(tank.Hook):
         app_name = ENGINES[engine_name]
         context = self.tank.context_from_path(self.tank.project_path)
         project = context.project
-        sg = self.tank.shotgun
         system = sys.platform
         
         adapter = get_adapter(platform.system())
         
-        packages = get_rez_packages(sg,app_name,version,system,project)
+        packages = get_rez_packages(self.tank,app_name,version,system,project)
 
         try:
             import rez as _
@@ -93,45 +104,103 @@ class AppLaunch(tank.Hook):
             command = adapter.get_command(app_path, app_args)
             return_code = os.system(command)
             return {'command': command, 'return_code': return_code}
-        context = resolved_context.ResolvedContext(packages)
+
+        if launch_server.is_enabled():
+            argv = adapter.get_launch_argv(app_args, app_name)
+            try:
+                result = launch_server.launch(packages, argv, dict(os.environ, USE_SHOTGUN="OK"))
+                self.logger.debug('Launched %s through the launch server in %.1f ms (pid %s)'
+                                  % (argv[0], result['spawn_ms'], result['pid']))
+                return {'command': ' '.join(argv), 'return_code': 0}
+            except Exception as err:
+                self.logger.warning('The launch server could not launch %s, launching directly: %s'
+                                    % (argv[0], err))
+
+        context = get_resolved_context(packages)
         return adapter.execute(context, app_args,app_name)
         
 
 
-def get_rez_packages(sg,app_name,version,system,project):
+def get_rez_packages(tk,app_name,version,system,project):
     
-    if system == "linux2":
-        filter_dict = [['code','is',app_name.title()+" "+version],
-                       ['projects','in',project]
-                      ]
-        packages = sg.find("Software",filter_dict,['sg_rez'])
-        if packages : 
-            packages =  packages[0]['sg_rez']
-        else:
-            filter_dict = [['code','is',app_name.title()+" "+version],
-                        ['projects','is',None] ]
-            packages = sg.find("Software",filter_dict,['sg_rez'])
-            packages =  packages[0]['sg_rez']
-
-    else:
-        filter_dict = [['code','is',app_name.title()+" "+version],
-                       ['projects','in',project]
-                      ]
-        packages = sg.find("Software",filter_dict,['sg_win_rez'])
-        if packages : 
-            packages =  packages[0]['sg_win_rez']
-        else:
-            filter_dict = [['code','is',app_name.title()+" "+version],
-                        ['projects','is',None] ]
-            packages = sg.find("Software",filter_dict,['sg_win_rez'])
-            packages =  packages[0]['sg_win_rez']
-
-    if packages:
-        packages = [ x for x in packages.split(",")] 
-    else:
-        packages = None
-        
-    return packages
+    registry = software_registry.get_registry(tk, project)
+    return registry.get_packages(app_name.title()+" "+version, system)
+
+
+def get_package_timestamps(families):
+    """
+    Modification times of the package repositories and of the family
+    directories in them. Releasing a new version of a package changes the
+    time of its family directory.
+    """
+    from rez.config import config
+
+    timestamps = {}
+    for repository in config.packages_path:
+        paths = [repository] + [os.path.join(repository, family) for family in families]
+        for path in paths:
+            try:
+                timestamps[path] = os.stat(path).st_mtime
+            except OSError:
+                timestamps[path] = None
+    return timestamps
+
+
+def get_resolve_cache_path(packages):
+    from rez.config import config
+
+    key = json.dumps([packages, platform.system(), platform.machine(), config.packages_path])
+    return os.path.join(REZ_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def get_cached_context_state(packages):
+    """
+    Returns the metadata of the cached context of packages while it is
+    current, as a string which changes whenever the context is resolved
+    again. None if there is no current cached context.
+    """
+    try:
+        with open(get_resolve_cache_path(packages) + '.json') as f:
+            state = f.read()
+        metadata = json.loads(state)
+    except (IOError, OSError, ValueError):
+        return None
+    if get_package_timestamps(metadata['families']) != metadata['timestamps']:
+        return None
+    return state
+
+
+def get_resolved_context(packages):
+    """
+    Returns the ResolvedContext of packages, loaded from the launch cache when
+    none of the package families involved changed since it was resolved.
+    """
+    from rez import resolved_context
+    from rez.utils.formatting import PackageRequest
+
+    cache_path = get_resolve_cache_path(packages)
+    try:
+        if get_cached_context_state(packages) is not None:
+            return resolved_context.ResolvedContext.load(cache_path + '.rxt')
+    except Exception:
+        # a cached context which can't be read any more
+        pass
+
+    context = resolved_context.ResolvedContext(packages)
+    if context.success:
+        families = set(PackageRequest(x.strip()).name for x in packages)
+        families.update(x.name for x in context.resolved_packages)
+        families = sorted(families)
+        try:
+            if not os.path.isdir(REZ_CACHE_DIR):
+                os.makedirs(REZ_CACHE_DIR)
+            context.save(cache_path + '.rxt')
+            with open(cache_path + '.json', 'w') as f:
+                json.dump({'families': families,
+                           'timestamps': get_package_timestamps(families)}, f)
+        except (IOError, OSError):
+            pass
+    return context
 
 
 class BaseAdapter(object):
@@ -139,6 +208,8 @@ class BaseAdapter(object):
 
     shell_type = 'bash'
 
+    rez_module_root = None
+
     @staticmethod
     def get_command(path, args):
 
@@ -152,17 +223,49 @@ class BaseAdapter(object):
     @classmethod
     def get_rez_module_root(cls):
 
+        # memoized for the process, and in REZ_ROOT_CACHE_FILE while the path exists
+        if BaseAdapter.rez_module_root:
+            return BaseAdapter.rez_module_root
+        try:
+            with open(REZ_ROOT_CACHE_FILE) as f:
+                module_path = f.read().strip()
+            if os.path.isdir(module_path):
+                BaseAdapter.rez_module_root = module_path
+                return module_path
+        except (IOError, OSError):
+            pass
+
         command = cls.get_rez_root_command()
         module_path, stderr = subprocess.Popen(
             command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True).communicate()
 
         module_path = module_path.strip()
+        if isinstance(module_path, bytes):
+            module_path = module_path.decode('utf-8')
 
         if not stderr and module_path:
+            BaseAdapter.rez_module_root = module_path
+            try:
+                if not os.path.isdir(REZ_CACHE_DIR):
+                    os.makedirs(REZ_CACHE_DIR)
+                with open(REZ_ROOT_CACHE_FILE, 'w') as f:
+                    f.write(module_path)
+            except (IOError, OSError):
+                pass
             return module_path
 
         return ''
 
+    @staticmethod
+    def get_launch_argv(args, command):
+        """
+        The command line used by the launch server, which starts applications
+        directly rather than through a terminal
+        """
+        if command == "unreal":
+            command = "UE4Editor"
+        return [command] + shlex.split(args or '')
+
     @classmethod
     def execute(cls, context, args,command):
         
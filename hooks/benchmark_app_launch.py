@@ -0,0 +1,63 @@
+"""
+Cold and warm launch resolve times of the app_launch rez cache.
+
+    python benchmark_app_launch.py [--runs N] package [package ...]
+
+e.g. python benchmark_app_launch.py maya-2022 mtoa
+Needs the Toolkit core (sgtk) importable, as app_launch imports it. rez is
+located through get_rez_module_root when it isn't importable.
+
+cold : no memoized rez root and no cached context, as on a first launch
+warm : the rez root and the resolved context are reused from the cache
+"""
+
+import os
+import sys
+import time
+import argparse
+import platform
+
+import app_launch
+
+
+def clear_cache(packages):
+    app_launch.BaseAdapter.rez_module_root = None
+    paths = [app_launch.REZ_ROOT_CACHE_FILE]
+    cache_path = app_launch.get_resolve_cache_path(packages)
+    paths += [cache_path + '.rxt', cache_path + '.json']
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def launch_resolve(adapter, packages):
+    start = time.time()
+    adapter.get_rez_module_root()
+    root_time = time.time() - start
+    app_launch.get_resolved_context(packages)
+    return root_time, time.time() - start - root_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app_launch rez cache benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('packages', nargs='+')
+    args = parser.parse_args()
+
+    adapter = app_launch.get_adapter(platform.system())
+    try:
+        import rez as _
+    except ImportError:
+        sys.path.append(adapter.get_rez_module_root())
+
+    for run in range(args.runs):
+        clear_cache(args.packages)
+        root_time, resolve_time = launch_resolve(adapter, args.packages)
+        print('cold  rez root %8.3fs  resolve %8.3fs' % (root_time, resolve_time))
+    for run in range(args.runs):
+        root_time, resolve_time = launch_resolve(adapter, args.packages)
+        print('warm  rez root %8.3fs  resolve %8.3fs' % (root_time, resolve_time))
+
+
+if __name__ == '__main__':
+    main()
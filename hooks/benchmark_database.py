@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+'''
+Rows per second of the time log tables for a studio day of events.
+
+    python benchmark_database.py [--dsn DSN] [--artists N] [--operations N]
+
+With --dsn, runs against a local Postgres in a scratch timelog_benchmark
+schema, dropped afterwards, comparing :
+    formatted   str.format statements, one commit per row (the old path)
+    prepared    prepared statements, one commit per row
+    batch       prepared statements with execute_batch, one commit
+    copy        COPY FROM STDIN, one commit (logs and timelogs)
+
+Without --dsn, an SQLite stand-in compares formatted statements committed
+per row with parameterized executemany.
+'''
+
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+SCHEMA = 'timelog_benchmark'
+
+TABLES = (
+    '''CREATE TABLE logs ( user_id text, tool text, project text, shot_name text, file_name text,
+                           operation text, os text, operation_type text, log_time timestamp )''',
+    '''CREATE TABLE user_info ( user_id text PRIMARY KEY, user_status text, department text,
+                                shot_name text, log_time timestamp )''',
+    '''CREATE TABLE timelogs ( date timestamp, user_id text, tool text, project text, shot_name text,
+                               file_name text, work_time text )''',
+)
+
+
+def studio_day( artists, operations ):
+    '''
+    Returns the log, status and timelog rows of a day : every artist opens and
+    saves operations files, in time order
+    '''
+    random.seed( 0 )
+    start     = datetime( 2024, 1, 1, 9 )
+    log_rows  = []
+    status_rows = []
+    work_rows = []
+    for operation_no in range( operations ):
+        for artist_no in range( artists ):
+            user_id   = 'artist{0:03d}'.format( artist_no )
+            shot_name = 'SH{0:04d}'.format( random.randint( 0, 500 ) )
+            file_name = '{0}_v{1:03d}.ma'.format( shot_name, operation_no )
+            log_time  = ( start + timedelta( seconds = operation_no * 900 + artist_no ) ).strftime( '%Y-%m-%d %H:%M:%S' )
+            operation = 'OPEN' if operation_no % 2 == 0 else 'SAVE'
+            log_data  = [ user_id, 'maya', 'benchmark', shot_name, file_name, operation, 'Linux' ]
+            log_rows.append( ( log_data, log_time ) )
+            status_rows.append( ( [ user_id, 'WORKING' if operation == 'OPEN' else 'RESTING', 'anim', shot_name ], log_time ) )
+            if operation == 'SAVE':
+                work_rows.append( ( log_data, [ '0:15:0' ], log_time ) )
+    return log_rows, status_rows, work_rows
+
+
+def formatted_log_sql( log_data, log_time ):
+    operation_type = 'START' if log_data[5] in ( 'OPEN', 'NEW_FILE' ) else 'END'
+    return '''
+        INSERT INTO
+            logs ( user_id, tool, project, shot_name, file_name, operation, os, operation_type, log_time )
+        VALUES
+            ( '{0}', '{1}', '{2}', '{3}', '{4}', '{5}', '{6}', '{7}', '{8}' );
+    '''.format( *( list( log_data ) + [ operation_type, log_time ] ) )
+
+
+def formatted_status_sql( user_data, log_time ):
+    return '''
+        INSERT INTO
+            user_info ( user_id, user_status, department, shot_name, log_time )
+        VALUES
+            ( '{0}', '{1}', '{2}', '{3}', '{4}' )
+        ON CONFLICT
+            ( user_id )
+        DO
+        UPDATE
+        SET
+            user_status = '{1}',
+            department  = '{2}',
+            shot_name   = '{3}',
+            log_time    = '{4}'
+    '''.format( *( list( user_data ) + [ log_time ] ) )
+
+
+def formatted_work_time_sql( log_data, timelog_data, log_time ):
+    return '''
+        INSERT INTO
+            timelogs ( date, user_id, tool, project, shot_name, file_name, work_time )
+        VALUES
+            ( '{0}', '{1}', '{2}', '{3}', '{4}', '{5}', '{6}' );
+    '''.format( log_time, log_data[0], log_data[1], log_data[2], log_data[3], log_data[4], timelog_data[0] )
+
+
+def report( method, table, num_rows, elapsed ):
+    print( '{0:<10} {1:<10} {2:8d} rows {3:8.2f}s {4:12.0f} rows/sec'.format(
+        method, table, num_rows, elapsed, num_rows / elapsed if elapsed else float( 'inf' ) ) )
+
+
+def timed( func ):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def benchmark_postgres( dsn, log_rows, status_rows, work_rows ):
+    import psycopg2
+    import psycopg2.extensions
+    import database_manager
+
+    admin = psycopg2.connect( dsn )
+    cursor = admin.cursor()
+    cursor.execute( 'DROP SCHEMA IF EXISTS {0} CASCADE'.format( SCHEMA ) )
+    cursor.execute( 'CREATE SCHEMA {0}'.format( SCHEMA ) )
+    cursor.execute( 'SET search_path TO {0}'.format( SCHEMA ) )
+    for sql in TABLES:
+        cursor.execute( sql )
+    admin.commit()
+
+    def truncate( ):
+        cursor.execute( 'TRUNCATE logs, user_info, timelogs' )
+        admin.commit()
+
+    try:
+        DB = database_manager.Databases( psycopg2.extensions.make_dsn( dsn, options = '-c search_path={0}'.format( SCHEMA ) ) )
+        tables = (
+            ( 'logs',      log_rows,    lambda row: formatted_log_sql( *row ),       lambda row: DB.set_log_data_sql( *row ),
+                           lambda row: DB.get_log_data_params( *row ),               database_manager.EXECUTE_LOG_SQL,
+                           database_manager.LOG_COLUMNS ),
+            ( 'user_info', status_rows, lambda row: formatted_status_sql( *row ),    lambda row: DB.set_status_sql( *row ),
+                           lambda row: DB.get_status_params( *row ),                 database_manager.EXECUTE_STATUS_SQL,
+                           None ),
+            ( 'timelogs',  work_rows,   lambda row: formatted_work_time_sql( *row ), lambda row: DB.set_work_time_data_sql( *row ),
+                           lambda row: DB.get_work_time_data_params( *row ),         database_manager.EXECUTE_WORK_TIME_SQL,
+                           database_manager.WORK_TIME_COLUMNS ),
+        )
+        for table, rows, formatted, prepared, params, execute_sql, columns in tables:
+            truncate()
+            report( 'formatted', table, len( rows ), timed( lambda: [ DB.insert_DB( formatted( row ) ) for row in rows ] ) )
+            truncate()
+            report( 'prepared', table, len( rows ), timed( lambda: [ DB.insert_DB( *prepared( row ) ) for row in rows ] ) )
+            truncate()
+            report( 'batch', table, len( rows ), timed( lambda: DB.insert_many( execute_sql, [ params( row ) for row in rows ] ) ) )
+            if columns:
+                truncate()
+                report( 'copy', table, len( rows ), timed( lambda: DB.copy_rows( table, columns, [ params( row ) for row in rows ] ) ) )
+    finally:
+        cursor.execute( 'DROP SCHEMA IF EXISTS {0} CASCADE'.format( SCHEMA ) )
+        admin.commit()
+        admin.close()
+
+
+def benchmark_sqlite( log_rows, status_rows, work_rows ):
+    print( 'SQLite stand-in' )
+    handle, path = tempfile.mkstemp( suffix = '.db' )
+    os.close( handle )
+    try:
+        db = sqlite3.connect( path )
+        for sql in TABLES:
+            db.execute( sql )
+        db.commit()
+        tables = (
+            ( 'logs',      log_rows,    lambda row: formatted_log_sql( *row ),
+              'INSERT INTO logs VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? )',
+              lambda row: tuple( row[0] ) + ( 'START' if row[0][5] == 'OPEN' else 'END', row[1] ) ),
+            ( 'user_info', status_rows, lambda row: formatted_status_sql( *row ),
+              '''INSERT INTO user_info VALUES ( ?, ?, ?, ?, ? ) ON CONFLICT ( user_id ) DO UPDATE SET
+                 user_status = excluded.user_status, department = excluded.department,
+                 shot_name = excluded.shot_name, log_time = excluded.log_time''',
+              lambda row: tuple( row[0] ) + ( row[1], ) ),
+            ( 'timelogs',  work_rows,   lambda row: formatted_work_time_sql( *row ),
+              'INSERT INTO timelogs VALUES ( ?, ?, ?, ?, ?, ?, ? )',
+              lambda row: ( row[2], ) + tuple( row[0][:5] ) + ( row[1][0], ) ),
+        )
+        for table, rows, formatted, sql, params in tables:
+            db.execute( 'DELETE FROM {0}'.format( table ) )
+            db.commit()
+
+            def per_row( ):
+                for row in rows:
+                    db.execute( formatted( row ) )
+                    db.commit()
+            report( 'formatted', table, len( rows ), timed( per_row ) )
+
+            db.execute( 'DELETE FROM {0}'.format( table ) )
+            db.commit()
+
+            def batch( ):
+                db.executemany( sql, [ params( row ) for row in rows ] )
+                db.commit()
+            report( 'batch', table, len( rows ), timed( batch ) )
+        db.close()
+    finally:
+        os.remove( path )
+
+
+def main( ):
+    parser = argparse.ArgumentParser( description = 'Time log database benchmark' )
+    parser.add_argument( '--dsn', type = str, default = None )
+    parser.add_argument( '--artists', type = int, default = 300 )
+    parser.add_argument( '--operations', type = int, default = 40 )
+    args = parser.parse_args()
+
+    log_rows, status_rows, work_rows = studio_day( args.artists, args.operations )
+    if args.dsn:
+        benchmark_postgres( args.dsn, log_rows, status_rows, work_rows )
+    else:
+        benchmark_sqlite( log_rows, status_rows, work_rows )
+
+
+if __name__ == '__main__':
+    main( )
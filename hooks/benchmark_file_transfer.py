@@ -0,0 +1,72 @@
+"""
+Throughput of each file_transfer strategy between two folders.
+
+    python benchmark_file_transfer.py [--files N] [--size MB] [--workers N] source_dir dest_dir
+
+e.g. python benchmark_file_transfer.py /show/work/tmp /show/pub/tmp
+Writes N files of the given size in source_dir, transfers them to dest_dir
+with each strategy alone, without fallback, and removes them. A strategy
+which isn't supported between the two folders is reported as such.
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import file_transfer
+
+
+def create_files(folder, count, size):
+    paths = []
+    block = os.urandom(1024 * 1024)
+    for index in range(count):
+        path = os.path.join(folder, 'bench.%04d.bin' % index)
+        with open(path, 'wb') as f:
+            for _ in range(size):
+                f.write(block)
+        paths.append(path)
+    return paths
+
+
+def run_strategy(strategy, sources, dest_dir, workers):
+    pairs = [(x, os.path.join(dest_dir, os.path.basename(x))) for x in sources]
+    start = time.time()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        list(pool.map(lambda x: file_transfer.transfer_file(x[0], x[1], [strategy]), pairs))
+    finally:
+        pool.shutdown()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='file_transfer strategy benchmark')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=64, help='size of each file in MB')
+    parser.add_argument('--workers', type=int, default=file_transfer.COPY_WORKERS)
+    parser.add_argument('source_dir')
+    parser.add_argument('dest_dir')
+    args = parser.parse_args()
+
+    source_dir = tempfile.mkdtemp(prefix='bench_src_', dir=args.source_dir)
+    try:
+        sources = create_files(source_dir, args.files, args.size)
+        total_mb = args.files * args.size
+        for strategy in file_transfer.STRATEGIES:
+            dest_dir = tempfile.mkdtemp(prefix='bench_dst_', dir=args.dest_dir)
+            try:
+                elapsed = run_strategy(strategy, sources, dest_dir, args.workers)
+                print('%-9s %8.3fs %10.1f MB/s' % (strategy, elapsed, total_mb / max(elapsed, 1e-6)))
+            except (IOError, OSError, file_transfer.CopyError) as err:
+                print('%-9s not supported : %s' % (strategy, err))
+            finally:
+                shutil.rmtree(dest_dir)
+    finally:
+        shutil.rmtree(source_dir)
+
+
+if __name__ == '__main__':
+    main()
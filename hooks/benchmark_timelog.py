@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+Per operation latency of the time log clients.
+
+    python benchmark_timelog.py <user_id> [iterations] [--write]
+
+Times get_user_info and now through each available client : one rez-env
+subprocess per call, the local time log server and, when psycopg2 and
+shotgun_api3 are importable, the in process client. With --write, also
+times log and set_status, which insert rows for user_id in the time log
+database.
+'''
+
+import sys
+import time
+import platform
+
+import timelog_client
+
+
+def percentile( values, fraction ):
+    values = sorted( values )
+    return values[ min( len( values ) - 1, int( len( values ) * fraction ) ) ]
+
+
+def time_op( func, iterations ):
+    latencies = []
+    for i in range( iterations ):
+        start = time.time()
+        func()
+        latencies.append( ( time.time() - start ) * 1000.0 )
+    return latencies
+
+
+def get_clients( ):
+    clients = [ ( 'subprocess', timelog_client.SubprocessTimeLogClient( ) ) ]
+    if platform.system() != 'Windows':
+        clients.append( ( 'server', timelog_client.SocketTimeLogClient( ) ) )
+    try:
+        clients.append( ( 'in process', timelog_client.InProcessTimeLogClient( ) ) )
+    except ImportError as err:
+        print( 'in process client unavailable : {0}'.format( err ) )
+    return clients
+
+
+def main( ):
+    args       = [ x for x in sys.argv[1:] if x != '--write' ]
+    write      = '--write' in sys.argv
+    if not args:
+        raise SystemExit( __doc__ )
+    user_id    = args[0]
+    iterations = int( args[1] ) if len( args ) > 1 else 20
+
+    log_data   = [ user_id, 'benchmark', 'benchmark', 'benchmark', 'benchmark', 'OPEN', platform.system() ]
+    user_data  = [ user_id, 'RESTING', 'benchmark', 'benchmark' ]
+
+    for name, client in get_clients( ):
+        ops = [ ( 'get_user_info', lambda: client.get_user_info( user_id ) ),
+                ( 'now',           lambda: client.now() ) ]
+        if write:
+            ops += [ ( 'log',        lambda: client.log( log_data ) ),
+                     ( 'set_status', lambda: client.set_status( user_data ) ) ]
+        # the first call includes starting the server or opening the connection
+        start = time.time()
+        client.now()
+        print( '{0:<12} first call {1:9.1f} ms'.format( name, ( time.time() - start ) * 1000.0 ) )
+        for op_name, func in ops:
+            latencies = time_op( func, iterations )
+            print( '{0:<12} {1:<14} mean {2:9.1f} ms  p50 {3:9.1f} ms  p95 {4:9.1f} ms'.format(
+                name, op_name, sum( latencies ) / len( latencies ),
+                percentile( latencies, 0.5 ), percentile( latencies, 0.95 ) ) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -1,8 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import os
+import csv
 import sys
+import json
+import time
+import sqlite3
 import psycopg2
+import threading
 import argparse
+from datetime import datetime
+from psycopg2.extras import execute_batch
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
 
 import shotgun_api3
 
@@ -28,25 +46,189 @@ USERSTATUS      =    1
 DEPARTMENT      =    2
 SHOTNAME        =    3
 
+TIME_FORMAT     =    '%Y-%m-%d %H:%M:%S'
+
+# Statements prepared on each connection. A NULL log time is the time of the insert.
+# A status older than the stored one, replayed from a spool, is ignored
+PREPARED_STATEMENTS = (
+    ( 'insert_log', '''
+        INSERT INTO
+            logs ( user_id, tool, project, shot_name, file_name, operation, os, operation_type, log_time )
+        VALUES
+            ( $1, $2, $3, $4, $5, $6, $7, $8, COALESCE( $9, current_timestamp ) )
+    ''' ),
+    ( 'upsert_status', '''
+        INSERT INTO
+            user_info ( user_id, user_status, department, shot_name, log_time )
+        VALUES
+            ( $1, $2, $3, $4, COALESCE( $5, current_timestamp ) )
+        ON CONFLICT
+            ( user_id )
+        DO
+        UPDATE
+        SET
+            user_status = EXCLUDED.user_status,
+            department  = EXCLUDED.department,
+            shot_name   = EXCLUDED.shot_name,
+            log_time    = EXCLUDED.log_time
+        WHERE
+            user_info.log_time <= EXCLUDED.log_time
+    ''' ),
+    ( 'insert_timelog', '''
+        INSERT INTO
+            timelogs ( date, user_id, tool, project, shot_name, file_name, work_time )
+        VALUES
+            ( COALESCE( $1, current_timestamp ), $2, $3, $4, $5, $6, $7 )
+    ''' ),
+)
+EXECUTE_LOG_SQL       = 'EXECUTE insert_log ( %s, %s, %s, %s, %s, %s, %s, %s, %s::timestamptz )'
+EXECUTE_STATUS_SQL    = 'EXECUTE upsert_status ( %s, %s, %s, %s, %s::timestamptz )'
+EXECUTE_WORK_TIME_SQL = 'EXECUTE insert_timelog ( %s::timestamptz, %s, %s, %s, %s, %s, %s )'
+
+LOG_COLUMNS       = ( 'user_id', 'tool', 'project', 'shot_name', 'file_name', 'operation', 'os', 'operation_type', 'log_time' )
+WORK_TIME_COLUMNS = ( 'date', 'user_id', 'tool', 'project', 'shot_name', 'file_name', 'work_time' )
+# batches with at least this many timed log or timelog rows are ingested with COPY
+COPY_MIN_ROWS     = 50
+
+# ShotGrid entities resolved for the timelogs are cached in a local sqlite file
+ENTITY_CACHE_PATH = os.path.join( os.path.expanduser( '~' ), '.sgtk_timelog_entities.db' )
+USER_TTL          = 12 * 3600
+PROJECT_TTL       = 12 * 3600
+LINK_TTL          = 3600
+# entities not found are looked up again sooner, they may just have been created
+MISSING_TTL       = 600
+
+# Operations served to the time log clients
+SERVICE_OPS     =    ( 'get_user_info', 'now', 'log', 'set_status', 'record_worktime', 'write_batch' )
+
+class EntityCache():
+    '''
+    ShotGrid entities by key, with a time to live, persisted in a sqlite file
+    so that they survive restarts. Keys are tuples such as ( 'HumanUser', login )
+    '''
+    def __init__( self, path = ENTITY_CACHE_PATH ):
+        self.lock = threading.Lock()
+        self.db   = sqlite3.connect( path, timeout = 10, check_same_thread = False )
+        self.db.execute( '''
+                            CREATE TABLE IF NOT EXISTS
+                                entities ( key TEXT PRIMARY KEY, entity TEXT, expires REAL )
+                        ''' )
+        self.db.commit()
+
+    def get_key( self, key ):
+        return json.dumps( list( key ) )
+
+    def get( self, key ):
+        '''
+        Returns ( True, entity ) for a valid cached entity, which can be None
+        for an entity not found, or ( False, None )
+        '''
+        with self.lock:
+            row = self.db.execute( 'SELECT entity, expires FROM entities WHERE key = ?', ( self.get_key( key ), ) ).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, json.loads( row[0] )
+
+    def set( self, key, entity, ttl ):
+        with self.lock:
+            self.db.execute( 'INSERT OR REPLACE INTO entities VALUES ( ?, ?, ? )',
+                             ( self.get_key( key ), json.dumps( entity ), time.time() + ttl ) )
+            self.db.commit()
+
+    def resolve( self, key, find, ttl ):
+        found, entity = self.get( key )
+        if not found:
+            entity = find()
+            self.set( key, entity, ttl if entity else MISSING_TTL )
+        return entity
+
+    def invalidate( self, key = None ):
+        '''
+        Removes key from the cache, or every entity if key is None
+        '''
+        with self.lock:
+            if key is None:
+                self.db.execute( 'DELETE FROM entities' )
+            else:
+                self.db.execute( 'DELETE FROM entities WHERE key = ?', ( self.get_key( key ), ) )
+            self.db.commit()
+
+
+def find_link( project, code ):
+    '''
+    Returns the Asset, or else the Shot, named code in project.
+    Asset and Shot are separate entity types, so they are found through their
+    tasks in a single query. Entities without tasks are looked up directly
+    '''
+    tasks = SG.find( 'Task', [ [ 'project', 'is', project ],
+                               { 'filter_operator': 'any',
+                                 'filters': [ [ 'entity.Asset.code', 'is', code ],
+                                              [ 'entity.Shot.code', 'is', code ] ] } ],
+                     [ 'entity' ] )
+    entities = [ task[ 'entity' ] for task in tasks if task[ 'entity' ] ]
+    for entity_type in ( 'Asset', 'Shot' ):
+        for entity in entities:
+            if entity[ 'type' ] == entity_type:
+                return { 'type': entity[ 'type' ], 'id': entity[ 'id' ] }
+    return SG.find_one( 'Asset', [[ 'project', 'is', project ], [ 'code' , 'is', code ]] ) or \
+           SG.find_one( 'Shot', [[ 'project', 'is', project ], [ 'code' , 'is', code ]] )
+
+
 class Databases():
-    def __init__( self ):
-        self.db = psycopg2.connect( host = '10.0.20.7', dbname = 'WorkFilesLogs', user = 'postgres', password = 'postgres', port = 5432 )
+    '''
+    Time log tables. The INSERT/UPSERT statements are prepared once per
+    connection and executed with parameters, the set_*_sql methods return
+    the ( statement, params ) to execute.
+    '''
+    def __init__( self, dsn = None ):
+        if dsn:
+            self.db = psycopg2.connect( dsn, connect_timeout = 10 )
+        else:
+            self.db = psycopg2.connect( host = '10.0.20.7', dbname = 'WorkFilesLogs', user = 'postgres', password = 'postgres', port = 5432, connect_timeout = 10 )
         self.cursor = self.db.cursor()
+        self.entity_cache = None
+        self.prepare()
 
     def __del__( self ):
         self.db.close()
         self.cursor.close()
 
-    def check_DB( self, sql ):
-        self.cursor.execute( sql )
+    def prepare( self ):
+        for name, sql in PREPARED_STATEMENTS:
+            self.cursor.execute( 'PREPARE {0} AS {1}'.format( name, sql ) )
+        self.db.commit()
+
+    def check_DB( self, sql, params = None ):
+        self.cursor.execute( sql, params )
         rows = self.cursor.fetchall()
         return rows
 
-    def insert_DB( self, sql ):
-        self.cursor.execute( sql )
+    def insert_DB( self, sql, params = None ):
+        self.cursor.execute( sql, params )
         self.db.commit()            
 
-    def set_log_data_sql( self, data_list ):
+    def insert_many( self, sql, params_list, commit = True ):
+        # one round trip per page of rows
+        execute_batch( self.cursor, sql, params_list, page_size = 500 )
+        if commit:
+            self.db.commit()
+
+    def copy_rows( self, table, columns, rows, commit = True ):
+        '''
+        Bulk ingest of rows with COPY FROM STDIN, committed once.
+        Every column value has to be given, defaults aren't applied
+        '''
+        data = StringIO()
+        writer = csv.writer( data )
+        for row in rows:
+            writer.writerow( [ '\\N' if value is None else value for value in row ] )
+        data.seek( 0 )
+        sql = "COPY {0} ( {1} ) FROM STDIN WITH ( FORMAT csv, NULL '\\N' )".format( table, ', '.join( columns ) )
+        self.cursor.copy_expert( sql, data )
+        if commit:
+            self.db.commit()
+
+    def get_log_data_params( self, data_list, log_time = None ):
         if data_list[ OPERATION ] == 'OPEN' or data_list[ OPERATION ] == 'NEW_FILE':
             operation_type = 'START'
         elif data_list[ OPERATION ] == 'SAVE' or data_list[ OPERATION ] == 'SAVE_AS':
@@ -60,53 +242,35 @@ class Databases():
         file_name = data_list[ FILENAME ]
         operation = data_list[ OPERATION ]
         sys_os    = data_list[ OS ]
-        log_data_sql =   '''
-                    INSERT INTO 
-                        logs ( user_id, tool, project, shot_name, file_name, operation, os, operation_type, log_time  )
-                    VALUES 
-                        (\'{0}\', \'{1}\', \'{2}\', \'{3}\', \'{4}\', \'{5}\', \'{6}\', \'{7}\', current_timestamp );
-                '''.format( user_id, tool, project, shot_name, file_name, operation, sys_os, operation_type )
-        return log_data_sql
-
-    def set_status_sql( self, data_list ) :
+        # a None log_time is written as current_timestamp
+        return ( user_id, tool, project, shot_name, file_name, operation, sys_os, operation_type, log_time )
+
+    def get_status_params( self, data_list, log_time = None ):
         user_id     = data_list[ USERID ]
         user_status = data_list[ USERSTATUS ]
         department  = data_list[ DEPARTMENT ]
         shot_name   = data_list[ SHOTNAME ]
-        sql =   '''
-                    INSERT INTO 
-                        user_info (  user_id, user_status, department, shot_name, log_time  )
-                    VALUES 
-                        ( \'{0}\', \'{1}\', \'{2}\', \'{3}\', current_timestamp )
-                    ON CONFLICT 
-                        ( user_id ) 
-                    DO
-                    UPDATE
-                    SET
-                        user_status = \'{1}\',
-                        department  = \'{2}\', 
-                        shot_name   = \'{3}\',
-                        log_time    = current_timestamp
-                '''.format( user_id, user_status, department, shot_name )
-        return sql
+        return ( user_id, user_status, department, shot_name, log_time )
 
-    def set_work_time_data_sql( self, data_list, timelog_data ):
+    def get_work_time_data_params( self, data_list, timelog_data, log_time = None ):
         user_id   = data_list[ USERID ]
         tool      = data_list[ TOOL ]
         project   = data_list[ PROJECT ]
         shot_name = data_list[ SHOTNAME ]
         file_name = data_list[ FILENAME ]
         work_time = timelog_data[0]
+        return ( log_time, user_id, tool, project, shot_name, file_name, work_time )
 
-        work_time_data_sql ='''
-                                INSERT INTO 
-                                    timelogs ( date, user_id, tool, project, shot_name, file_name, work_time )
-                                VALUES 
-                                    (current_timestamp, \'{0}\', \'{1}\', \'{2}\', \'{3}\', \'{4}\', \'{5}\' );
-                            '''.format( user_id, tool, project, shot_name, file_name, work_time )
-        return work_time_data_sql
+    def set_log_data_sql( self, data_list, log_time = None ):
+        return EXECUTE_LOG_SQL, self.get_log_data_params( data_list, log_time )
 
-    def create_SG_timelog( self , data_list, timelog_data ):
+    def set_status_sql( self, data_list, log_time = None ) :
+        return EXECUTE_STATUS_SQL, self.get_status_params( data_list, log_time )
+
+    def set_work_time_data_sql( self, data_list, timelog_data, log_time = None ):
+        return EXECUTE_WORK_TIME_SQL, self.get_work_time_data_params( data_list, timelog_data, log_time )
+
+    def get_SG_timelog_data( self , data_list, timelog_data ):
         user_id       = data_list[ USERID ]
         tool          = data_list[ TOOL ]
         project_name  = data_list[ PROJECT ]
@@ -115,14 +279,14 @@ class Databases():
         work_time     = timelog_data[0]
         link          = None
 
-        user    = SG.find_one( 'HumanUser', [[ 'login', 'is', user_id ]])
-        project = SG.find_one( 'Project', [[ 'name', 'is', project_name ]])
-        assets  = SG.find_one( 'Asset', [[ 'project', 'is', project ], [ 'code' , 'is', task_name ]] )
-        shots   = SG.find_one( 'Shot', [[ 'project', 'is', project ], [ 'code' , 'is', task_name ]] )
-        if assets:
-            link = assets
-        elif shots:
-            link = shots
+        cache   = self.get_entity_cache()
+        user    = cache.resolve( ( 'HumanUser', user_id ),
+                                 lambda: SG.find_one( 'HumanUser', [[ 'login', 'is', user_id ]]), USER_TTL )
+        project = cache.resolve( ( 'Project', project_name ),
+                                 lambda: SG.find_one( 'Project', [[ 'name', 'is', project_name ]]), PROJECT_TTL )
+        if project:
+            link = cache.resolve( ( 'Link', project[ 'id' ], task_name ),
+                                  lambda: find_link( project, task_name ), LINK_TTL )
         
         data = {
             'sg_user': user,
@@ -132,17 +296,52 @@ class Databases():
             'sg_link': link,
             'sg_duration': work_time
         }
+        return data
+
+    def get_entity_cache( self ):
+        if self.entity_cache is None:
+            self.entity_cache = EntityCache( )
+        return self.entity_cache
 
-        SG.create( 'CustomEntity09', data )
+    def invalidate_SG_timelog_entities( self, data_list ):
+        # an entity may have been retired or renamed since it was cached
+        cache   = self.get_entity_cache()
+        cache.invalidate( ( 'HumanUser', data_list[ USERID ] ) )
+        found, project = cache.get( ( 'Project', data_list[ PROJECT ] ) )
+        if project:
+            cache.invalidate( ( 'Link', project[ 'id' ], data_list[ SHOTNAME ] ) )
+        cache.invalidate( ( 'Project', data_list[ PROJECT ] ) )
+
+    def create_SG_timelog( self , data_list, timelog_data ):
+        try:
+            SG.create( 'CustomEntity09', self.get_SG_timelog_data( data_list, timelog_data ) )
+        except Exception:
+            self.invalidate_SG_timelog_entities( data_list )
+            raise
+
+    def create_SG_timelogs( self, timelogs ):
+        '''
+        Creates the timelogs of a list of ( data_list, timelog_data ) in a single batch
+        '''
+        requests = [ { 'request_type': 'create',
+                       'entity_type': 'CustomEntity09',
+                       'data': self.get_SG_timelog_data( data_list, timelog_data ) }
+                     for data_list, timelog_data in timelogs ]
+        try:
+            SG.batch( requests )
+        except Exception:
+            for data_list, timelog_data in timelogs:
+                self.invalidate_SG_timelog_entities( data_list )
+            raise
 
     def get_user_info( self, user_id ):
         sql =   '''
                     SELECT
                         * from user_info info
                     WHERE
-                        info.user_id = \'{0}\'
-                '''.format( user_id )
-        return sql
+                        info.user_id = %s
+                '''
+        return sql, ( user_id, )
 
     def get_time_now( self ):
         sql =   '''
@@ -150,6 +349,154 @@ class Databases():
                 '''
         return sql
 
+class TimeLogService():
+    '''
+    Time log operations on a single long-lived database connection.
+    Used in process by the time log client, by the local time log server
+    and by the command line.
+    '''
+    def __init__( self ):
+        self.DB = None
+
+    def connect( self ):
+        if self.DB is None or self.DB.db.closed:
+            self.DB = Databases( )
+        return self.DB
+
+    def run( self, func ):
+        DB = self.connect()
+        try:
+            return func( DB )
+        except psycopg2.Error:
+            if DB.db.closed:
+                # the connection was dropped since the last call, so nothing
+                # was written. Reconnect and try once more
+                self.DB = None
+                return func( self.connect() )
+            DB.db.rollback()
+            raise
+
+    def get_user_info( self, user_id ):
+        rows = self.run( lambda DB: DB.check_DB( *DB.get_user_info( user_id ) ) )
+        if not rows:
+            return None
+        return [ col.strftime( TIME_FORMAT ) if isinstance( col, datetime ) else col for col in rows[0] ]
+
+    def now( self ):
+        rows = self.run( lambda DB: DB.check_DB( DB.get_time_now() ) )
+        return rows[0][0].strftime( TIME_FORMAT )
+
+    def log( self, log_data ):
+        self.run( lambda DB: DB.insert_DB( *DB.set_log_data_sql( log_data ) ) )
+
+    def set_status( self, user_data ):
+        self.run( lambda DB: DB.insert_DB( *DB.set_status_sql( user_data ) ) )
+
+    def record_worktime( self, log_data, work_time ):
+        self.run( lambda DB: DB.insert_DB( *DB.set_work_time_data_sql( log_data, [ work_time ] ) ) )
+        self.DB.create_SG_timelog( log_data, [ work_time ] )
+
+
+    def write_batch( self, events ):
+        '''
+        Writes a list of queued events in one transaction :
+            { 'type': 'log',      'args': [ log_data ],            'time': ... }
+            { 'type': 'status',   'args': [ user_data ],           'time': ... }
+            { 'type': 'worktime', 'args': [ log_data, work_time ], 'time': ... }
+            { 'type': 'sg_timelog', ... }   ShotGrid timelog only
+        Worktime events also create their ShotGrid timelog, in one batch.
+        Returns the events that still have to be written : sg_timelog events
+        for the ShotGrid timelogs that couldn't be created
+        '''
+        for event in events:
+            if event[ 'type' ] not in ( 'log', 'status', 'worktime', 'sg_timelog' ):
+                raise ValueError( 'unknown time log event : {0}'.format( event[ 'type' ] ) )
+        timelogs = [ event for event in events if event[ 'type' ] in ( 'worktime', 'sg_timelog' ) ]
+
+        def insert_batch( DB ):
+            log_rows    = []
+            status_rows = []
+            work_rows   = []
+            for event in events:
+                args     = event[ 'args' ]
+                log_time = event.get( 'time' )
+                if event[ 'type' ] == 'log':
+                    log_rows.append( DB.get_log_data_params( args[0], log_time ) )
+                elif event[ 'type' ] == 'status':
+                    status_rows.append( DB.get_status_params( args[0], log_time ) )
+                elif event[ 'type' ] == 'worktime':
+                    work_rows.append( DB.get_work_time_data_params( args[0], [ args[1] ], log_time ) )
+
+            # one transaction for the whole batch, statuses are upserted in order.
+            # COPY needs every value, so rows without a time are inserted
+            if len( log_rows ) >= COPY_MIN_ROWS and all( row[-1] for row in log_rows ):
+                DB.copy_rows( 'logs', LOG_COLUMNS, log_rows, commit = False )
+            elif log_rows:
+                DB.insert_many( EXECUTE_LOG_SQL, log_rows, commit = False )
+            if status_rows:
+                DB.insert_many( EXECUTE_STATUS_SQL, status_rows, commit = False )
+            if len( work_rows ) >= COPY_MIN_ROWS and all( row[0] for row in work_rows ):
+                DB.copy_rows( 'timelogs', WORK_TIME_COLUMNS, work_rows, commit = False )
+            elif work_rows:
+                DB.insert_many( EXECUTE_WORK_TIME_SQL, work_rows, commit = False )
+            DB.db.commit()
+
+        if any( event[ 'type' ] != 'sg_timelog' for event in events ):
+            self.run( insert_batch )
+
+        if timelogs:
+            try:
+                self.connect().create_SG_timelogs( [ ( event[ 'args' ][0], [ event[ 'args' ][1] ] ) for event in timelogs ] )
+            except Exception:
+                return [ dict( event, type = 'sg_timelog' ) for event in timelogs ]
+        return []
+
+
+class TimeLogRequestHandler( socketserver.StreamRequestHandler ):
+    '''
+    Handles one JSON request per line : {"op": ..., "args": [...]}
+    and answers with {"result": ...} or {"error": ...}
+    '''
+    def handle( self ):
+        for line in self.rfile:
+            try:
+                request = json.loads( line.decode( 'utf-8' ) )
+                if request[ 'op' ] not in SERVICE_OPS:
+                    raise ValueError( 'unknown time log operation : {0}'.format( request[ 'op' ] ) )
+                result   = getattr( self.server.service, request[ 'op' ] )( *request[ 'args' ] )
+                response = { 'result': result }
+            except Exception as err:
+                response = { 'error': str( err ) }
+            self.wfile.write( ( json.dumps( response ) + '\n' ).encode( 'utf-8' ) )
+            self.wfile.flush()
+
+
+def serve( socket_path, idle_timeout ):
+    '''
+    Serves the time log operations on a unix socket until no request
+    has been received for idle_timeout seconds
+    '''
+    if os.path.exists( socket_path ):
+        os.remove( socket_path )
+    server = socketserver.UnixStreamServer( socket_path, TimeLogRequestHandler )
+    os.chmod( socket_path, 0o600 )
+    server.service = TimeLogService( )
+    server.timeout = idle_timeout
+    server.idle    = False
+
+    def handle_timeout( ):
+        server.idle = True
+    server.handle_timeout = handle_timeout
+
+    try:
+        while not server.idle:
+            server.handle_request()
+    finally:
+        server.server_close()
+        if os.path.exists( socket_path ):
+            os.remove( socket_path )
+
+
 def main( ):
     parser = argparse.ArgumentParser( description = 'Stack Data' )
     parser.add_argument( '-now', '--now', action = 'store_true' )
@@ -157,39 +504,40 @@ def main( ):
     parser.add_argument( '-log', '--log_data',  type = str, nargs = 7 )
     parser.add_argument( '-user', '--user_data',  type = str, nargs = 4 )
     parser.add_argument( '-timelog', '--timelog_data', type = str, nargs = 1)
+    parser.add_argument( '-worktime', '--worktime_data', type = str, nargs = 8 )
+    parser.add_argument( '-batch', '--batch_file', type = str, nargs = 1 )
+    parser.add_argument( '-clear_cache', '--clear_cache', action = 'store_true' )
+    parser.add_argument( '-serve', '--serve', type = str, nargs = 1 )
+    parser.add_argument( '-idle', '--idle_timeout', type = float, default = 3600 )
     
     args = parser.parse_args()
-    DB = Databases( )
+    if args.clear_cache:
+        EntityCache( ).invalidate()
+    if args.serve:
+        serve( args.serve[0], args.idle_timeout )
+        return
+
+    service = TimeLogService( )
     if args.now:
-        time_sql  = DB.get_time_now()
-        rows      = DB.check_DB( time_sql )
-        first_row = rows[0]
-        time_now  = first_row[0]
-        string_info = '{0} '.format(time_now.strftime('%Y-%m-%d %H:%M:%S'))
-        print(string_info)
+        print( '{0} '.format( service.now() ) )
     if args.user_id:
-        user_info_sql = DB.get_user_info( args.user_id[0] )
-        rows = DB.check_DB( user_info_sql )
-        if rows :
-            row = rows[0]
-            string_info = ''
-            for col in row:
-                if row.index(col) != 4:
-                    pass
-                else:
-                    col = col.strftime('%Y-%m-%d %H:%M:%S')
-                string_info += '{} '.format(col)
-            print( '{}'.format( string_info ))
+        row = service.get_user_info( args.user_id[0] )
+        if row :
+            print( ''.join( '{} '.format( col ) for col in row ) )
     if args.log_data:
-        log_data_sql = DB.set_log_data_sql( args.log_data )
-        DB.insert_DB( log_data_sql )
+        service.log( args.log_data )
     if args.user_data:
-        status_sql = DB.set_status_sql( args.user_data )
-        DB.insert_DB( status_sql )
+        service.set_status( args.user_data )
     if args.timelog_data:
-        timelog_sql = DB.set_work_time_data_sql( args.log_data, args.timelog_data )
-        DB.insert_DB( timelog_sql )
-        DB.create_SG_timelog( args.log_data, args.timelog_data )
+        service.record_worktime( args.log_data, args.timelog_data[0] )
+    if args.worktime_data:
+        # the log data followed by the work time, without inserting a log row
+        service.record_worktime( args.worktime_data[:7], args.worktime_data[7] )
+    if args.batch_file:
+        # a json list of events, prints the events left to write as json
+        with open( args.batch_file[0] ) as batch_file:
+            events = json.load( batch_file )
+        print( json.dumps( service.write_batch( events ) ) )
 
 if __name__ == '__main__':
     main( )
@@ -3,7 +3,6 @@
 import os
 import sys
 import platform
-import subprocess as sp
 from datetime import datetime
 
 import sgtk
@@ -11,39 +10,33 @@ from sgtk import Hook
 from sgtk import TankError
 from sgtk.platform.qt import QtGui
 
+import timelog_client
+
 class TimeLogManager():
     def __init__( self, user, tool, project_name, shot_name, file_name, operation ):
         self.user       =  user
         self.user_id    =  user.login
         self.file_path  =  os.path.dirname(os.path.realpath(__file__)) 
         self.sys_os     =  platform.system()   
+        self.client     =  timelog_client.get_queue()
         now_str         =  ""  
         now_datetime    =  ""   
         # get user information
-        output          =  self.get_database_data( "id" )
-        lines = output.decode("utf-8")
-        if lines :
-            log_list        = lines.split(" ")
-            user_status     = log_list[1]
-            log_shot        = log_list[3]
-            datetime_str    = "{0} {1}".format(log_list[4], log_list[5])
-            datetime_object = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
+        user_info       =  self.get_database_data( "id" )
+        if user_info :
+            user_status     = user_info[1]
+            log_shot        = user_info[3]
+            datetime_str    = user_info[4]
+            datetime_object = datetime.strptime(datetime_str, timelog_client.TIME_FORMAT)
         else :
             user_status     = "RESTING"
             log_shot        = ""
         # get time now
-        output          =   self.get_database_data( "now" )
-        lines           =   output.decode("utf-8")
+        lines           =   self.get_database_data( "now" )
         if lines : 
             try :
-                log_list        =  lines.split("\n")[0].split(" ")
-                # log_list        =  log_list.split(" ")
-                now_str         =  "{0} {1}".format(log_list[0], log_list[1])
-                now_datetime    =  datetime.strptime(now_str, "%Y-%m-%d %H:%M:%S")
-                # res = QtGui.QMessageBox.information(None,
-                #                                             u"Time data",
-                #                                             "{0} {1} {2}".format( now_str, now_datetime, type(now_datetime) )
-                #                                             )
+                now_str         =  lines
+                now_datetime    =  datetime.strptime(now_str, timelog_client.TIME_FORMAT)
             except :
                 pass
         if not lines and not now_datetime : 
@@ -234,34 +227,23 @@ class TimeLogManager():
         return sg_data
 
     def get_database_data( self, opt ):
-        if opt == 'id':
-            cmd =  'rez-env psycopg2 shotgunapi -- python {0} -id {1}'.format( os.path.join( self.file_path, 'database_manager.py'), self.user_id )
-        elif opt == 'now':
-            cmd =  'rez-env psycopg2 shotgunapi -- python {0} -now'.format( os.path.join( self.file_path, 'database_manager.py') )
-
-        if self.sys_os == 'Windows' :
-            try:
-                output, stderr =  sp.Popen( cmd, stdout = sp.PIPE, stderr = sp.PIPE, shell = False, cwd = self.file_path ).communicate()
-            except Exception as err :
-                pass
-        else :
-            output, stderr =  sp.Popen( cmd, stdout = sp.PIPE, stderr = sp.PIPE, shell = True, cwd = self.file_path ).communicate()
-        return output
+        # the user_info row for 'id', the database time for 'now'.
+        # None if the time log database can't be reached
+        try:
+            if opt == 'id':
+                return self.client.get_user_info( self.user_id )
+            elif opt == 'now':
+                return self.client.now()
+        except Exception as err :
+            return None
 
     def stack_data( self, user_status, tool, project_name, shot_name, file_name, operation, work_time = "" ):
         sg_data     =  self.get_shotgrid_info( )
         department  =  sg_data[ 'department.Department.name' ]
 
-        cmd  = 'rez-env psycopg2 shotgunapi -- python {0} '.format( os.path.join( self.file_path, 'database_manager.py') )
-        cmd += '-log {0} {1} {2} {3} {4} {5} {6} '.format( self.user_id, tool, project_name, shot_name, file_name, operation, self.sys_os )
-        cmd += '-user {0} {1} {2} {3}'.format( self.user_id, user_status, department, shot_name )
-        if work_time:
-            cmd += ' -timelog {0}'.format( work_time )
-        if self.sys_os == 'Windows':
-            try:
-                os.chdir(r'{}'.format( self.file_path ))
-                os.system( cmd )
-            except Exception as err :
-                QtGui.QMessageBox.information(None, "!! Windows os error Ask to Pipeline TD !!", "{}".format( err ))
-        else :
-            os.system( cmd )
\ No newline at end of file
+        log_data    =  [ self.user_id, tool, project_name, shot_name, file_name, operation, self.sys_os ]
+        user_data   =  [ self.user_id, user_status, department, shot_name ]
+        try:
+            self.client.stack( log_data, user_data, work_time )
+        except Exception as err :
+            QtGui.QMessageBox.information(None, "!! TimeLog error Ask to Pipeline TD !!", "{}".format( err ))
\ No newline at end of file
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk file copies for the publish hooks.
+
+bulk_copy copies a list of (source, destination) pairs with a bounded thread
+pool, creating each destination folder once. Copies can be verified with
+xxhash when it is installed, sha1 otherwise.
+
+Each file is transferred with the first strategy of a chain that works
+between the source and destination file systems :
+
+    reflink   copy on write clone (FICLONE), a metadata operation
+    hardlink  a link to the source file, which the publish then shares
+    sendfile  copy in the kernel with os.copy_file_range or os.sendfile
+    copy      copy in user space
+
+The chain starts at the requested strategy, e.g. "reflink" tries all of them
+and "sendfile" only copies. Strategies which are not supported between two
+devices are remembered for the process.
+"""
+
+import os
+import errno
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# concurrent copies, NFS latency bound rather than CPU bound
+COPY_WORKERS = 8
+# bytes per copy_file_range / sendfile call
+CHUNK_SIZE = 64 * 1024 * 1024
+# permissions of the copied files, as sgtk.util.filesystem.copy_file
+FILE_PERMISSIONS = 0o666
+# progress is reported every PROGRESS_STEP files
+PROGRESS_STEP = 100
+
+STRATEGIES = ["reflink", "hardlink", "sendfile", "copy"]
+DEFAULT_STRATEGY = "sendfile"
+# linux ioctl cloning a file, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# (source device, destination device, strategy) not supported
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+
+UNSUPPORTED_ERRNOS = set(
+    getattr(errno, x)
+    for x in ("EXDEV", "ENOSYS", "EINVAL", "ENOTSUP", "EOPNOTSUPP", "ENOTTY", "EPERM", "EMLINK")
+    if hasattr(errno, x)
+)
+
+
+class CopyError(Exception):
+    pass
+
+
+def _kernel_copy(src_file, dst_file, size):
+    """
+    Copies size bytes between the open files in the kernel. Returns False if
+    neither copy_file_range nor sendfile can be used for these files.
+
+    :raises CopyError: If the source ends before size bytes were copied.
+    """
+    copied = 0
+    for name in ("copy_file_range", "sendfile"):
+        function = getattr(os, name, None)
+        if function is None:
+            continue
+        try:
+            while copied < size:
+                if name == "copy_file_range":
+                    count = function(src_file.fileno(), dst_file.fileno(), CHUNK_SIZE)
+                else:
+                    count = function(dst_file.fileno(), src_file.fileno(), copied, CHUNK_SIZE)
+                if not count:
+                    break
+                copied += count
+            if copied != size:
+                raise CopyError(
+                    "Short copy of '%s': %d of %d bytes." % (src_file.name, copied, size)
+                )
+            return True
+        except OSError as err:
+            # not supported between these file systems, try the next one
+            if copied or err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+    return False
+
+
+def copy_data(src, dst, kernel=True):
+    """
+    Copies the content of src to dst, in the kernel when possible and kernel
+    is set.
+    """
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        size = os.fstat(src_file.fileno()).st_size
+        if not kernel or not size or not _kernel_copy(src_file, dst_file, size):
+            shutil.copyfileobj(src_file, dst_file, 1024 * 1024)
+
+
+def reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflinks are not supported on this platform")
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def get_strategies(strategy):
+    """
+    :returns: The fallback chain starting at strategy.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(
+            "Unknown transfer strategy '%s', expected one of %s" % (strategy, STRATEGIES)
+        )
+    return STRATEGIES[STRATEGIES.index(strategy):]
+
+
+def transfer_file(src, dst, strategies, logger=None, fallbacks=None):
+    """
+    Transfers src to dst with the first of strategies supported between their
+    devices. An existing dst is replaced, never written through, as it could
+    be a link to another file.
+
+    :param logger: Logger of the strategy fallbacks.
+    :param list fallbacks: Collects the fallback messages instead of logger,
+        for transfers running off the thread of the logger.
+    :raises CopyError: If src and dst are the same file.
+    :returns: The strategy used.
+    """
+    if os.path.realpath(src) == os.path.realpath(dst):
+        raise CopyError("'%s' and '%s' are the same file." % (src, dst))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(dst) or ".").st_dev)
+
+    for strategy in strategies:
+        if devices + (strategy,) in _unsupported:
+            continue
+        try:
+            if strategy == "reflink":
+                reflink(src, dst)
+                os.chmod(dst, FILE_PERMISSIONS)
+            elif strategy == "hardlink":
+                # the permissions are the source file ones
+                os.link(src, dst)
+            else:
+                copy_data(src, dst, kernel=strategy == "sendfile")
+                os.chmod(dst, FILE_PERMISSIONS)
+            return strategy
+        except CopyError:
+            # never leave a truncated file behind
+            if os.path.lexists(dst):
+                os.remove(dst)
+            raise
+        except (IOError, OSError) as err:
+            if strategy == "copy" or err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            if os.path.lexists(dst):
+                os.remove(dst)
+            with _unsupported_lock:
+                _unsupported.add(devices + (strategy,))
+            message = (
+                "Transfer strategy %s not supported from '%s' to '%s' (%s), "
+                "falling back." % (strategy, src, os.path.dirname(dst), err)
+            )
+            if fallbacks is not None:
+                fallbacks.append(message)
+            elif logger:
+                logger.debug(message)
+    raise CopyError("No transfer strategy left for '%s' to '%s'." % (src, dst))
+
+
+def checksum(path):
+    """
+    :returns: The xxh64 hex digest of the file, sha1 if xxhash is not installed
+    """
+    digest = xxhash.xxh64() if xxhash else hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_file(src, dst, verify=False, strategy=DEFAULT_STRATEGY, logger=None, fallbacks=None):
+    """
+    Copies src to dst with FILE_PERMISSIONS, the destination folder must exist.
+
+    :param bool verify: Compare the checksums of the source and the copy.
+    :param str strategy: The first transfer strategy to try.
+    :param list fallbacks: See transfer_file.
+    :raises CopyError: If the copy differs from the source.
+    :returns: The strategy used.
+    """
+    used = transfer_file(src, dst, get_strategies(strategy), logger, fallbacks)
+    if verify and used != "hardlink" and checksum(src) != checksum(dst):
+        raise CopyError("Copy of '%s' to '%s' differs from the source." % (src, dst))
+    return used
+
+
+def ensure_folders(paths):
+    """
+    Creates the folders of the paths, each once.
+    """
+    for folder in sorted(set(os.path.dirname(x) for x in paths)):
+        if not os.path.isdir(folder):
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(folder, 0o777)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            finally:
+                os.umask(old_umask)
+
+
+def bulk_copy(
+    pairs,
+    workers=COPY_WORKERS,
+    verify=False,
+    progress_callback=None,
+    strategy=DEFAULT_STRATEGY,
+    logger=None,
+):
+    """
+    Copies the (source, destination) pairs concurrently.
+
+    :param int workers: Maximum number of concurrent copies.
+    :param bool verify: Verify each copy with its checksum.
+    :param progress_callback: Called as progress_callback(copied, total) every
+        PROGRESS_STEP files and once all are copied, from the calling thread.
+    :param str strategy: The first transfer strategy to try.
+    :param logger: Logger of the strategy fallbacks, from the calling thread.
+    :raises CopyError: With the pairs that could not be copied, once the
+        others are done.
+    :returns: The number of files transferred by each strategy.
+    """
+    pairs = list(pairs)
+    ensure_folders([dst for src, dst in pairs])
+
+    errors = []
+    copied = 0
+    strategies = {}
+    # the fallbacks of each copy, logged from this thread
+    fallbacks = [[] for x in pairs]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs)))) as executor:
+        futures = dict(
+            (
+                executor.submit(copy_file, src, dst, verify, strategy, None, fallbacks[index]),
+                index,
+            )
+            for index, (src, dst) in enumerate(pairs)
+        )
+        for future in as_completed(futures):
+            index = futures[future]
+            if logger:
+                for message in fallbacks[index]:
+                    logger.debug(message)
+            try:
+                used = future.result()
+                strategies[used] = strategies.get(used, 0) + 1
+            except Exception as err:
+                errors.append("'%s' -> '%s': %s" % (pairs[index] + (err,)))
+                continue
+            copied += 1
+            if progress_callback and (copied % PROGRESS_STEP == 0 or copied == len(pairs)):
+                progress_callback(copied, len(pairs))
+
+    if errors:
+        raise CopyError(
+            "Failed to copy %d of %d files:\n%s" % (len(errors), len(pairs), "\n".join(errors))
+        )
+    return strategies
@@ -0,0 +1,251 @@
+"""
+Launch server for app_launch.
+
+With SGTK_LAUNCH_SERVER=1, AppLaunch sends its launches to a resident
+process which keeps the environments of recently launched package lists
+in memory, ready to use, and spawns the applications directly with
+subprocess.Popen(env=...), without a terminal or a rez shell. The server is
+started on the first launch and exits after LAUNCH_SERVER_IDLE seconds
+without launches. Linux only, other platforms launch directly.
+
+    python launch_server.py --stats
+
+prints the spawn latency percentiles of the running server.
+"""
+
+import os
+import sys
+import json
+import signal
+import time
+import getpass
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'sgtk_launch_%s.sock' % getpass.getuser())
+LAUNCH_SERVER_IDLE = 8 * 3600
+# number of package lists whose environment is kept
+POOL_SIZE = 8
+# the python which runs the server, the launcher's by default
+LAUNCH_SERVER_PYTHON = os.environ.get('SGTK_LAUNCH_SERVER_PYTHON', sys.executable)
+LAUNCH_SERVER_START = 30
+LOG_DIR = os.path.join(tempfile.gettempdir(), 'sgtk_launch_logs_%s' % getpass.getuser())
+
+
+def is_enabled():
+    return os.environ.get('SGTK_LAUNCH_SERVER') == '1' and platform.system() == 'Linux'
+
+
+def merge_environ(resolved_env, base_env, launch_env):
+    """
+    Applies the variables a launch sets on top of the server environment
+    (toolkit bootstrap variables...) to an environment resolved in the server
+    environment. Path lists set by both keep the launch entries first.
+    """
+    env = dict(resolved_env)
+    for key, value in launch_env.items():
+        base_value = base_env.get(key)
+        if value == base_value:
+            continue
+        if base_value is None or resolved_env.get(key, base_value) == base_value:
+            env[key] = value
+        else:
+            base_entries = base_value.split(os.pathsep)
+            extra = [x for x in value.split(os.pathsep) if x not in base_entries]
+            env[key] = os.pathsep.join(extra + [resolved_env[key]])
+    return env
+
+
+def percentiles(values, fractions=(0.5, 0.9, 0.99)):
+    values = sorted(values)
+    if not values:
+        return {}
+    return dict(('p%d' % (x * 100), values[min(len(values) - 1, int(len(values) * x))]) for x in fractions)
+
+
+class EnvironmentPool(object):
+    """
+    Resolved environments by package list, kept while their cached rez
+    context is current
+    """
+
+    def __init__(self, base_env, size=POOL_SIZE):
+        self.base_env = base_env
+        self.size = size
+        self.environments = OrderedDict()
+
+    def get(self, packages):
+        """
+        Returns (environment, True if it came from the pool)
+        """
+        import app_launch
+
+        key = tuple(packages)
+        state = app_launch.get_cached_context_state(packages)
+        entry = self.environments.pop(key, None)
+        if entry is not None and state is not None and entry[0] == state:
+            self.environments[key] = entry
+            return entry[1], True
+
+        context = app_launch.get_resolved_context(packages)
+        if not context.success:
+            raise RuntimeError('could not resolve %s' % ' '.join(packages))
+        env = context.get_environ(parent_environ=self.base_env)
+        self.environments[key] = (app_launch.get_cached_context_state(packages), env)
+        while len(self.environments) > self.size:
+            self.environments.popitem(last=False)
+        return env, False
+
+
+class LaunchRequestHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request per connection :
+        {"op": "launch", "packages": [...], "argv": [...], "env": {...}}
+            -> {"pid": ..., "spawn_ms": ..., "cached": ...}
+        {"op": "stats"} -> {"launches": ..., "cached": ..., "spawn_ms": {"p50": ...}}
+    """
+
+    def handle(self):
+        server = self.server
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            if request['op'] == 'launch':
+                start = time.time()
+                env, cached = server.pool.get(request['packages'])
+                env = merge_environ(env, server.pool.base_env, request['env'])
+                if not os.path.isdir(LOG_DIR):
+                    os.makedirs(LOG_DIR)
+                log_path = os.path.join(LOG_DIR, '%s.log' % os.path.basename(request['argv'][0]))
+                with open(os.devnull) as devnull, open(log_path, 'a') as log_file:
+                    proc = subprocess.Popen(request['argv'], env=env, cwd=env.get('HOME'),
+                                            stdin=devnull, stdout=log_file, stderr=log_file,
+                                            close_fds=True, preexec_fn=os.setsid)
+                spawn_ms = (time.time() - start) * 1000.0
+                server.latencies.append(spawn_ms)
+                server.cached_launches += int(cached)
+                response = {'pid': proc.pid, 'spawn_ms': spawn_ms, 'cached': cached}
+            elif request['op'] == 'stats':
+                response = {'launches': len(server.latencies),
+                            'cached': server.cached_launches,
+                            'spawn_ms': percentiles(server.latencies)}
+            else:
+                raise ValueError('unknown launch server operation: %s' % request['op'])
+        except Exception as err:
+            response = {'error': str(err)}
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+def serve(socket_path=SOCKET_PATH, idle_timeout=LAUNCH_SERVER_IDLE):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.UnixStreamServer(socket_path, LaunchRequestHandler)
+    os.chmod(socket_path, 0o600)
+    server.pool = EnvironmentPool(dict(os.environ))
+    server.latencies = []
+    server.cached_launches = 0
+    server.timeout = idle_timeout
+    server.idle = False
+    # the launched applications are not waited on, don't keep them as zombies
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    def handle_timeout():
+        server.idle = True
+    server.handle_timeout = handle_timeout
+
+    try:
+        while not server.idle:
+            server.handle_request()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def request(message, socket_path=SOCKET_PATH):
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    response = json.loads(data.decode('utf-8'))
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response
+
+
+def is_serving(socket_path=SOCKET_PATH):
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (IOError, OSError):
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def start_server(socket_path=SOCKET_PATH):
+    """
+    Starts the server with the environment and python path of this process
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(x for x in sys.path if x))
+    with open(os.devnull, 'w') as devnull:
+        subprocess.Popen([LAUNCH_SERVER_PYTHON, os.path.abspath(__file__), '--serve', socket_path],
+                         env=env, stdin=devnull, stdout=devnull, stderr=devnull,
+                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                         close_fds=True, preexec_fn=os.setsid)
+    deadline = time.time() + LAUNCH_SERVER_START
+    while time.time() < deadline:
+        if is_serving(socket_path):
+            return
+        time.sleep(0.1)
+    raise RuntimeError('the launch server did not start')
+
+
+def launch(packages, argv, env, socket_path=SOCKET_PATH):
+    """
+    Launches argv in the environment of packages through the launch server,
+    starting it if needed. Returns {"pid": ..., "spawn_ms": ..., "cached": ...}
+    """
+    if not is_serving(socket_path):
+        start_server(socket_path)
+    return request({'op': 'launch', 'packages': list(packages), 'argv': list(argv), 'env': env},
+                   socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app_launch launch server')
+    parser.add_argument('--serve', type=str, default=None)
+    parser.add_argument('--stats', action='store_true')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+    elif args.stats:
+        stats = request({'op': 'stats'})
+        print('%d launches, %d from the environment pool' % (stats['launches'], stats['cached']))
+        for name in sorted(stats['spawn_ms'], key=lambda x: int(x[1:])):
+            print('spawn %-4s %8.1f ms' % (name, stats['spawn_ms'][name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,17 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import re
+import sys
 import pprint
 import traceback
 
 import sgtk
-from sgtk.util.filesystem import copy_file, ensure_folder_exists
+
+sys.path.append(os.path.dirname(__file__))
+import file_transfer
+import publish_pipeline
+import publish_registration
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
@@ -215,6 +221,54 @@ class BasicFilePublishPlugin(HookBaseClass):
                     "extensions that should be associated."
                 ),
             },
+            "Transfer Strategy": {
+                "type": "str",
+                "default": "sendfile",
+                "description": (
+                    "First strategy used to transfer the work files to the "
+                    "publish location, falling back to the next ones: reflink, "
+                    "hardlink, sendfile, copy. Hardlinked publishes share their "
+                    "data with the work files."
+                ),
+            },
+            "Batch Registration": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Register the publishes of the session with one ShotGrid "
+                    "batch call at the start of finalize instead of one call "
+                    "per item during publish. Publishes are then not available "
+                    "to the publish method of subclasses, and as the publisher "
+                    "skips finalize when a publish fails, the files copied for "
+                    "the other items are then left unregistered."
+                ),
+            },
+            "Verify Copies": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Compare the checksum of each file copied to the publish "
+                    "location with its work file."
+                ),
+            },
+            "Background Publish": {
+                "type": "bool",
+                "default": False,
+                "description": (
+                    "Copy the files and register the publish in a background "
+                    "thread while the next items are published. Errors are "
+                    "reported in finalize, and neither the publish files nor "
+                    "the publish are available to the publish method of "
+                    "subclasses."
+                ),
+            },
+            "Publish Workers": {
+                "type": "int",
+                "default": publish_pipeline.PUBLISH_WORKERS,
+                "description": (
+                    "Number of items published concurrently in the background."
+                ),
+            },
         }
 
     @property
@@ -294,17 +348,29 @@ class BasicFilePublishPlugin(HookBaseClass):
         publish_path = self.get_publish_path(settings, item)
         publish_name = self.get_publish_name(settings, item)
 
+        if self._background_publish(settings):
+            publish_pipeline.start_validation(item, settings["Publish Workers"].value)
+
         # ---- check for conflicting publishes of this path with a status
 
         # Note the name, context, and path *must* match the values supplied to
         # register_publish in the publish phase in order for this to return an
         # accurate list of previous publishes of this file.
-        publishes = publisher.util.get_conflicting_publishes(
-            item.context,
-            publish_path,
-            publish_name,
-            filters=["sg_status_list", "is_not", None],
-        )
+        if self._batch_registration(settings):
+            coordinator = publish_registration.start_validation(publisher, item)
+            publishes = coordinator.get_conflicting_publishes(
+                item.context,
+                publish_path,
+                publish_name,
+                requests=self._get_session_publish_requests(item),
+            )
+        else:
+            publishes = publisher.util.get_conflicting_publishes(
+                item.context,
+                publish_path,
+                publish_name,
+                filters=["sg_status_list", "is_not", None],
+            )
 
         if publishes:
 
@@ -389,11 +455,7 @@ class BasicFilePublishPlugin(HookBaseClass):
                 item.parent.properties.sg_publish_data["id"]
             )
 
-        # handle copying of work to publish if templates are in play
-        self._copy_work_to_publish(settings, item)
-
         # arguments for publish registration
-        self.logger.info("Registering publish...")
         publish_data = {
             "tk": publisher.sgtk,
             "context": item.context,
@@ -425,11 +487,62 @@ class BasicFilePublishPlugin(HookBaseClass):
             },
         )
 
+        if self._background_publish(settings):
+            # the copies and the registration don't need the main thread
+            pipeline = publish_pipeline.get_pipeline(
+                item, settings["Publish Workers"].value
+            )
+            pipeline.submit(
+                item,
+                "Publish of %s" % (publish_name,),
+                self._publish_files,
+                settings,
+                item,
+                publish_data,
+                pipeline,
+            )
+            self.logger.info("Publish of %s queued." % (publish_name,))
+            return
+
+        self._publish_files(settings, item, publish_data)
+
+    def _publish_files(self, settings, item, publish_data, pipeline=None, logger=None):
+        """
+        Copies the work files of item to the publish location and registers
+        the publish, or queues it for the batch registration. Runs in a
+        background thread when given the pipeline and its logger.
+
+        :param dict publish_data: The register_publish arguments.
+        :param pipeline: The pipeline running this phase.
+        :param logger: The logger of the phase.
+        """
+        logger = logger or self.logger
+        publisher = self.parent
+
+        # handle copying of work to publish if templates are in play
+        self._copy_work_to_publish(settings, item, logger)
+
+        # the parent item may have been registered in the background as well
+        if pipeline is not None and item.parent:
+            pipeline.wait_for(item.parent)
+        if "sg_publish_data" in item.parent.properties:
+            parent_id = item.parent.properties.sg_publish_data["id"]
+            if parent_id not in publish_data["dependency_ids"]:
+                publish_data["dependency_ids"].append(parent_id)
+
+        if self._batch_registration(settings):
+            # registered with the other publishes of the session in finalize
+            coordinator = publish_registration.get_coordinator(publisher, item)
+            coordinator.defer(item, publish_data)
+            logger.info("Publish queued for registration.")
+            return
+
         # create the publish and stash it in the item properties for other
         # plugins to use.
+        logger.info("Registering publish...")
         item.properties.sg_publish_data = sgtk.util.register_publish(**publish_data)
-        self.logger.info("Publish registered!")
-        self.logger.debug(
+        logger.info("Publish registered!")
+        logger.debug(
             "ShotGrid Publish data...",
             extra={
                 "action_show_more_info": {
@@ -454,6 +567,18 @@ class BasicFilePublishPlugin(HookBaseClass):
         """
 
 
+        publisher = self.parent
+
+        # wait for the background phases of the session, raising the errors
+        # of the ones of item
+        pipeline = publish_pipeline.get_active_pipeline(item)
+        if pipeline is not None:
+            pipeline.wait(item, self.logger)
+
+        # register the publishes of the session queued during publish
+        if self._batch_registration(settings):
+            publish_registration.get_coordinator(publisher, item).flush(self.logger)
+
         # get the data for the publish that was just created in SG
         if 'pub_sg' in settings.keys():
             if not settings['pub_sg'].value :
@@ -462,12 +587,11 @@ class BasicFilePublishPlugin(HookBaseClass):
 
         publish_data = item.properties.sg_publish_data
         
-        publisher = self.parent
-
         # ensure conflicting publishes have their status cleared
-        publisher.util.clear_status_for_conflicting_publishes(
-            item.context, publish_data
-        )
+        if not item.properties.get("sg_publish_conflicts_cleared"):
+            publisher.util.clear_status_for_conflicting_publishes(
+                item.context, publish_data
+            )
 
         self.logger.info("Cleared the status of all previous, conflicting publishes")
 
@@ -755,7 +879,52 @@ class BasicFilePublishPlugin(HookBaseClass):
     ############################################################################
     # protected methods
 
-    def _copy_work_to_publish(self, settings, item):
+    def _batch_registration(self, settings):
+        """
+        True if the publishes are registered by the session coordinator.
+        """
+        if "Batch Registration" not in settings:
+            return False
+        return settings["Batch Registration"].value
+
+    def _background_publish(self, settings):
+        """
+        True if the copies and registration run in the publish pipeline.
+        """
+        if "Background Publish" not in settings:
+            return False
+        return settings["Background Publish"].value
+
+    def _get_session_publish_requests(self, item):
+        """
+        The (context, path, name) of the other items of the session published
+        by this plugin, so that their conflicts are looked up with the ones of
+        item.
+        """
+        requests = []
+        items = [publish_registration.get_root(item)]
+        while items:
+            other = items.pop()
+            items.extend(other.children)
+            if other is item:
+                continue
+            for task in getattr(other, "tasks", []):
+                if task.name != self.name or not getattr(task, "active", True):
+                    continue
+                try:
+                    requests.append(
+                        (
+                            other.context,
+                            self.get_publish_path(task.settings, other),
+                            self.get_publish_name(task.settings, other),
+                        )
+                    )
+                except Exception:
+                    # resolved by its own validation
+                    pass
+        return requests
+
+    def _copy_work_to_publish(self, settings, item, logger=None):
         """
         This method handles copying work file path(s) to a designated publish
         location.
@@ -776,12 +945,14 @@ class BasicFilePublishPlugin(HookBaseClass):
         If the item has "sequence_paths" set, it will attempt to copy all paths
         assuming they meet the required criteria with respect to the templates.
 
+        :param logger: The logger of the publish phase, the plugin's by default.
         """
+        logger = logger or self.logger
 
         # ---- ensure templates are available
         work_template = item.properties.get("work_template")
         if not work_template:
-            self.logger.debug(
+            logger.debug(
                 "No work template set on the item. "
                 "Skipping copy file to publish location."
             )
@@ -789,7 +960,7 @@ class BasicFilePublishPlugin(HookBaseClass):
 
         publish_template = self.get_publish_template(settings, item)
         if not publish_template:
-            self.logger.debug(
+            logger.debug(
                 "No publish template set on the item. "
                 "Skipping copying file to publish location."
             )
@@ -804,52 +975,126 @@ class BasicFilePublishPlugin(HookBaseClass):
         if "sequence_paths" in item.properties:
             work_files = item.properties.get("sequence_paths", [])
             if not work_files:
-                self.logger.warning(
+                logger.warning(
                     "Sequence publish without a list of files. Publishing "
                     "the sequence path in place: %s" % (item.properties.path,)
                 )
                 return
 
-        # ---- copy the work files to the publish location
+        # ---- resolve the publish paths of the work files
 
-        for work_file in work_files:
+        publish_files = self._get_sequence_publish_files(
+            work_template, publish_template, work_files
+        )
+        if publish_files is None:
+            publish_files = []
+            for work_file in work_files:
 
-            if not work_template.validate(work_file):
-                self.logger.warning(
-                    "Work file '%s' did not match work template '%s'. "
-                    "Publishing in place." % (work_file, work_template)
-                )
-                return
+                if not work_template.validate(work_file):
+                    logger.warning(
+                        "Work file '%s' did not match work template '%s'. "
+                        "Publishing in place." % (work_file, work_template)
+                    )
+                    return
 
-            work_fields = work_template.get_fields(work_file)
+                work_fields = work_template.get_fields(work_file)
 
-            missing_keys = publish_template.missing_keys(work_fields)
+                missing_keys = publish_template.missing_keys(work_fields)
 
-            if missing_keys:
-                self.logger.warning(
-                    "Work file '%s' missing keys required for the publish "
-                    "template: %s" % (work_file, missing_keys)
-                )
-                return
+                if missing_keys:
+                    logger.warning(
+                        "Work file '%s' missing keys required for the publish "
+                        "template: %s" % (work_file, missing_keys)
+                    )
+                    return
 
-            publish_file = publish_template.apply_fields(work_fields)
-
-            # copy the file
-            try:
-                publish_folder = os.path.dirname(publish_file)
-                ensure_folder_exists(publish_folder)
-                copy_file(work_file, publish_file)
-            except Exception:
-                raise Exception(
-                    "Failed to copy work file from '%s' to '%s'.\n%s"
-                    % (work_file, publish_file, traceback.format_exc())
-                )
+                publish_files.append(publish_template.apply_fields(work_fields))
 
-            self.logger.debug(
-                "Copied work file '%s' to publish file '%s'."
-                % (work_file, publish_file)
+        # ---- copy the work files to the publish location
+
+        verify = settings["Verify Copies"].value if "Verify Copies" in settings else False
+        strategy = file_transfer.DEFAULT_STRATEGY
+        if "Transfer Strategy" in settings:
+            strategy = settings["Transfer Strategy"].value
+
+        def progress(copied, total):
+            logger.info("Copied %d of %d files to the publish location." % (copied, total))
+
+        try:
+            strategies = file_transfer.bulk_copy(
+                zip(work_files, publish_files),
+                verify=verify,
+                progress_callback=progress if len(work_files) > 1 else None,
+                strategy=strategy,
+                logger=logger,
+            )
+        except Exception:
+            raise Exception(
+                "Failed to copy work files to '%s'.\n%s"
+                % (os.path.dirname(publish_files[0]), traceback.format_exc())
             )
 
+        logger.debug(
+            "Transferred %d work files from '%s' to '%s' (%s, chain %s)."
+            % (
+                len(work_files),
+                work_files[0],
+                publish_files[0],
+                ", ".join("%s: %d" % x for x in sorted(strategies.items())),
+                " > ".join(file_transfer.get_strategies(strategy)),
+            )
+        )
+
+    def _get_sequence_publish_files(self, work_template, publish_template, work_files):
+        """
+        Resolves the publish paths of the frames of a sequence with the
+        templates once, instead of once per frame.
+
+        The work and publish paths are formatted with the frame key as a
+        pattern, the frame number of each work file is read with a regular
+        expression and substituted in the publish pattern.
+
+        :param work_template: The work template of the item.
+        :param publish_template: The publish template of the item.
+        :param list work_files: The work files of the sequence.
+        :returns: The list of publish paths, or None if the frames can't be
+            resolved this way and each file has to go through the templates.
+        """
+        if len(work_files) < 2 or not work_template.validate(work_files[0]):
+            return None
+
+        frame_keys = [
+            key
+            for key in work_template.keys.values()
+            if isinstance(key, sgtk.templatekey.SequenceKey)
+        ]
+        if len(frame_keys) != 1:
+            return None
+        frame_key = frame_keys[0]
+
+        work_fields = work_template.get_fields(work_files[0])
+        if publish_template.missing_keys(work_fields):
+            return None
+        work_fields[frame_key.name] = "FORMAT: %d"
+        work_pattern = work_template.apply_fields(work_fields)
+        publish_pattern = publish_template.apply_fields(work_fields)
+
+        # the frame is the only varying part of the work files
+        parts = re.split(r"%0?\d*d", work_pattern)
+        if len(parts) != 2 or publish_pattern.count("%") != 1:
+            return None
+        frame_regex = re.compile(
+            "^%s(-?\\d+)%s$" % (re.escape(parts[0]), re.escape(parts[1]))
+        )
+
+        publish_files = []
+        for work_file in work_files:
+            match = frame_regex.match(work_file)
+            if not match:
+                return None
+            publish_files.append(publish_pattern % int(match.group(1)))
+        return publish_files
+
     def _get_next_version_info(self, path, item):
         """
         Return the next version of the supplied path.
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Background phases of the publish plugins.
+
+A plugin's publish is split in two :
+
+- the main thread phase, which queries the scene, resolves the templates and
+  writes the export scripts, as Maya and Qt are only usable from there
+- the background phase, the file transfers, farm submissions and ShotGrid
+  registrations, which only wait on the disks and the network
+
+The PublishPipeline of a publish session runs the background phases on a
+thread pool while the publisher goes on with the main thread phase of the next
+items. The first finalize waits for all of them, and each finalize raises the
+errors of the phases of its own item.
+
+Background phases log to a BufferedLogger, replayed on the main thread by
+wait, since the publisher log handlers update the UI.
+"""
+
+import os
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+# concurrent background phases, SGTK_PUBLISH_WORKERS overrides the plugin setting
+PUBLISH_WORKERS = 4
+
+# the pipeline of the current publish session
+_pipeline = [None]
+
+
+def get_root(item):
+    while item.parent:
+        item = item.parent
+    return item
+
+
+def get_workers(workers):
+    return max(1, int(os.environ.get("SGTK_PUBLISH_WORKERS", workers)))
+
+
+def get_pipeline(item, workers=PUBLISH_WORKERS):
+    """
+    :returns: The pipeline of the publish session of item.
+    """
+    pipeline = _pipeline[0]
+    if pipeline is None or pipeline.root is not get_root(item):
+        if pipeline is not None:
+            pipeline.shutdown()
+        pipeline = PublishPipeline(get_root(item), get_workers(workers))
+        _pipeline[0] = pipeline
+    return pipeline
+
+
+def get_active_pipeline(item):
+    """
+    :returns: The pipeline of the publish session of item if a plugin started
+        one, None otherwise.
+    """
+    pipeline = _pipeline[0]
+    if pipeline is not None and pipeline.root is get_root(item):
+        return pipeline
+    return None
+
+
+def start_validation(item, workers=PUBLISH_WORKERS):
+    """
+    Called by validate. Validating an item again means a new publish pass,
+    which starts without background phases.
+    """
+    pipeline = get_active_pipeline(item)
+    if pipeline is not None and any(x is item for x in pipeline.validated):
+        pipeline.shutdown()
+        _pipeline[0] = None
+        pipeline = None
+    if pipeline is None:
+        pipeline = get_pipeline(item, workers)
+    pipeline.validated.append(item)
+    return pipeline
+
+
+class BufferedLogger(object):
+    """
+    Keeps the records of a background phase until they are replayed on the
+    main thread.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def log(self, level, msg, *args, **kwargs):
+        self.records.append((level, msg, args, kwargs))
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    warn = warning
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def replay(self, logger):
+        records = self.records
+        self.records = []
+        for level, msg, args, kwargs in records:
+            logger.log(level, msg, *args, **kwargs)
+
+
+class Phase(object):
+    def __init__(self, item, title, logger):
+        self.item = item
+        self.title = title
+        self.logger = logger
+        self.future = None
+        self.error = None
+        self.reported = False
+
+
+class PublishPipeline(object):
+    def __init__(self, root, workers=PUBLISH_WORKERS):
+        self.root = root
+        self.workers = workers
+        self.validated = []
+        self.phases = []
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, item, title, function, *args, **kwargs):
+        """
+        Runs function(*args, logger=BufferedLogger, **kwargs) on the pool.
+
+        :param item: The item whose finalize reports the errors of the phase.
+        :param str title: Name of the phase in the logs.
+        :returns: The Phase.
+        """
+        phase = Phase(item, title, BufferedLogger())
+        kwargs["logger"] = phase.logger
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            phase.future = self._executor.submit(self._run, phase, function, args, kwargs)
+            self.phases.append(phase)
+        return phase
+
+    def _run(self, phase, function, args, kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception as err:
+            phase.error = err
+            phase.logger.error(
+                "%s failed: %s" % (phase.title, err),
+                extra={
+                    "action_show_more_info": {
+                        "label": "Error Details",
+                        "tooltip": "Show the full error stack trace",
+                        "text": "<pre>%s</pre>" % (traceback.format_exc(),),
+                    }
+                },
+            )
+
+    def wait_for(self, item):
+        """
+        Waits for the phases of item, from a background phase. Phases are
+        started in submission order, so waiting on the ones of a parent item
+        published earlier can't deadlock.
+
+        :returns: True if they all succeeded.
+        """
+        with self.lock:
+            futures = [x.future for x in self.phases if x.item is item]
+        wait_futures(futures)
+        return not any(x.error for x in self.phases if x.item is item)
+
+    def wait(self, item, logger):
+        """
+        Waits for all the phases submitted so far and replays their logs to
+        logger, then raises the errors of the phases of item.
+        """
+        with self.lock:
+            phases = list(self.phases)
+        if phases:
+            wait_futures([x.future for x in phases])
+        for phase in phases:
+            phase.logger.replay(logger)
+
+        errors = []
+        for phase in phases:
+            if phase.item is item and phase.error and not phase.reported:
+                phase.reported = True
+                errors.append("%s: %s" % (phase.title, phase.error))
+        if errors:
+            raise Exception("\n".join(errors))
+
+    def shutdown(self):
+        with self.lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
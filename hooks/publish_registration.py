@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Session wide publish registration for publish_file.py.
+
+Instead of a ShotGrid round trip per item for the conflict check in validate
+and for register_publish in publish, the RegistrationCoordinator of a publish
+session :
+
+- looks up the conflicting publishes of all the items of a plugin in one query
+- keeps the register_publish arguments of the items during publish
+- creates all the publishes with one batch() call in the first finalize, then
+  their dependencies, including the ones on publishes of parent items of the
+  same session, and clears the status of the conflicting publishes
+
+If the batch fails, which creates nothing, the items are registered one by one
+with register_publish.
+"""
+
+import threading
+
+import sgtk
+
+CONFLICT_FIELDS = [
+    "code",
+    "name",
+    "path",
+    "path_cache",
+    "version_number",
+    "entity",
+    "task",
+    "created_by",
+    "created_at",
+    "sg_status_list",
+]
+
+# the coordinator of the current publish session
+_coordinator = [None]
+
+
+def get_root(item):
+    while item.parent:
+        item = item.parent
+    return item
+
+
+def get_coordinator(publisher, item):
+    """
+    :returns: The coordinator of the publish session of item.
+    """
+    coordinator = _coordinator[0]
+    if coordinator is None or coordinator.root is not get_root(item):
+        coordinator = RegistrationCoordinator(publisher, get_root(item))
+        _coordinator[0] = coordinator
+    return coordinator
+
+
+def start_validation(publisher, item):
+    """
+    Called by validate. Validating an item again means a new publish pass, which
+    starts with a new coordinator.
+    """
+    coordinator = get_coordinator(publisher, item)
+    if any(x is item for x in coordinator.validated):
+        coordinator = RegistrationCoordinator(publisher, get_root(item))
+        _coordinator[0] = coordinator
+    coordinator.validated.append(item)
+    return coordinator
+
+
+def _entity_id(entity):
+    return entity["id"] if entity else None
+
+
+class RegistrationCoordinator(object):
+    def __init__(self, publisher, root):
+        self.publisher = publisher
+        self.tk = publisher.sgtk
+        self.root = root
+        self.validated = []
+        # (code, path_cache, entity id, task id) -> conflicting publishes
+        self.conflicts = {}
+        # [(item, register_publish arguments)]
+        self.pending = []
+        self.flushed = False
+        # defer is called from the background phases of the publish pipeline
+        self.lock = threading.Lock()
+
+    @property
+    def entity_type(self):
+        return sgtk.util.get_published_file_entity_type(self.tk)
+
+    def _get_key(self, context, path, name):
+        data = sgtk.util.register_publish(
+            self.tk, context, path, name, version_number=None, dry_run=True
+        )
+        return (
+            data.get("code"),
+            data.get("path_cache"),
+            _entity_id(context.entity),
+            _entity_id(context.task),
+        )
+
+    def prefetch_conflicts(self, requests):
+        """
+        Looks up the publishes with a status of the (context, path, name)
+        requests in one query.
+        """
+        keys = [self._get_key(*x) for x in requests]
+        keys = [x for x in keys if x not in self.conflicts]
+        if not keys:
+            return
+        for key in keys:
+            self.conflicts[key] = []
+
+        project = requests[0][0].project
+        publishes = self.publisher.shotgun.find(
+            self.entity_type,
+            [
+                ["project", "is", project],
+                ["sg_status_list", "is_not", None],
+                ["code", "in", list(set(x[0] for x in keys))],
+                ["path_cache", "in", list(set(x[1] for x in keys))],
+            ],
+            CONFLICT_FIELDS,
+        )
+        for publish in publishes:
+            key = (
+                publish["code"],
+                publish["path_cache"],
+                _entity_id(publish["entity"]),
+                _entity_id(publish["task"]),
+            )
+            if key in self.conflicts:
+                self.conflicts[key].append(publish)
+
+    def get_conflicting_publishes(self, context, path, name, requests=()):
+        """
+        :param requests: The (context, path, name) of the other items to look
+            up with this one if it isn't known yet.
+        :returns: The publishes with a status conflicting with a publish of
+            path named name in context.
+        """
+        key = self._get_key(context, path, name)
+        if key not in self.conflicts:
+            self.prefetch_conflicts([(context, path, name)] + list(requests))
+        return self.conflicts[key]
+
+    def defer(self, item, publish_data):
+        """
+        Keeps the register_publish arguments of item until flush.
+        """
+        with self.lock:
+            self.pending = [x for x in self.pending if x[0] is not item]
+            self.pending.append((item, publish_data))
+
+    def _get_publish_types(self, names):
+        """
+        :returns: The PublishedFileType entities of names, created if missing.
+        """
+        sg = self.publisher.shotgun
+        types = dict(
+            (x["code"], x)
+            for x in sg.find("PublishedFileType", [["code", "in", names]], ["code"])
+        )
+        missing = [x for x in names if x not in types]
+        if missing:
+            created = sg.batch(
+                [
+                    {
+                        "request_type": "create",
+                        "entity_type": "PublishedFileType",
+                        "data": {"code": x},
+                    }
+                    for x in missing
+                ]
+            )
+            types.update((x["code"], x) for x in created)
+        return dict(
+            (code, {"type": "PublishedFileType", "id": x["id"]})
+            for code, x in types.items()
+        )
+
+    def _create_publishes(self, pending):
+        """
+        Creates the publishes of pending with one batch call.
+
+        :returns: The created publish entities, in the order of pending.
+        """
+        entity_type = self.entity_type
+        requests = []
+        type_names = []
+        for item, publish_data in pending:
+            data = sgtk.util.register_publish(dry_run=True, **publish_data)
+            for key in ("type", "id"):
+                data.pop(key, None)
+            requests.append(data)
+            if publish_data.get("published_file_type"):
+                type_names.append(publish_data["published_file_type"])
+
+        if entity_type == "PublishedFile" and type_names:
+            types = self._get_publish_types(sorted(set(type_names)))
+            for data, (item, publish_data) in zip(requests, pending):
+                if publish_data.get("published_file_type"):
+                    data["published_file_type"] = types[
+                        publish_data["published_file_type"]
+                    ]
+
+        return self.publisher.shotgun.batch(
+            [
+                {"request_type": "create", "entity_type": entity_type, "data": x}
+                for x in requests
+            ]
+        )
+
+    def _create_dependencies(self, pending, publishes):
+        """
+        Links the publishes to their dependency paths and ids, and to the
+        publishes of their parent items.
+        """
+        created = dict((id(item), x) for (item, _), x in zip(pending, publishes))
+        paths = set()
+        for item, publish_data in pending:
+            paths.update(publish_data.get("dependency_paths") or [])
+        path_publishes = sgtk.util.find_publish(self.tk, list(paths)) if paths else {}
+
+        entity_type = self.entity_type
+        if entity_type == "PublishedFile":
+            dependency_type = "PublishedFileDependency"
+            fields = ("published_file", "dependent_published_file")
+        else:
+            dependency_type = "TankDependency"
+            fields = ("tank_published_file", "dependent_tank_published_file")
+
+        requests = []
+        for (item, publish_data), publish in zip(pending, publishes):
+            dependency_ids = list(publish_data.get("dependency_ids") or [])
+            parent = created.get(id(item.parent)) if item.parent else None
+            if parent and parent["id"] not in dependency_ids:
+                dependency_ids.append(parent["id"])
+            for path in publish_data.get("dependency_paths") or []:
+                if path in path_publishes:
+                    dependency_ids.append(path_publishes[path]["id"])
+            for dependency_id in dependency_ids:
+                requests.append(
+                    {
+                        "request_type": "create",
+                        "entity_type": dependency_type,
+                        "data": {
+                            fields[0]: {"type": entity_type, "id": publish["id"]},
+                            fields[1]: {"type": entity_type, "id": dependency_id},
+                        },
+                    }
+                )
+        if requests:
+            self.publisher.shotgun.batch(requests)
+
+    def _clear_conflicts(self, pending, publishes):
+        """
+        Clears the status of the publishes conflicting with the new ones.
+        """
+        new_ids = set(x["id"] for x in publishes)
+        publishes_by_key = {}
+        for publish in publishes:
+            key = (
+                publish.get("code"),
+                publish.get("path_cache"),
+                _entity_id(publish.get("entity")),
+                _entity_id(publish.get("task")),
+            )
+            publishes_by_key[key] = publish
+        if not publishes_by_key:
+            return
+
+        conflicts = self.publisher.shotgun.find(
+            self.entity_type,
+            [
+                ["project", "is", pending[0][0].context.project],
+                ["sg_status_list", "is_not", None],
+                ["code", "in", list(set(x[0] for x in publishes_by_key))],
+                ["path_cache", "in", list(set(x[1] for x in publishes_by_key))],
+            ],
+            CONFLICT_FIELDS,
+        )
+        requests = [
+            {
+                "request_type": "update",
+                "entity_type": self.entity_type,
+                "entity_id": x["id"],
+                "data": {"sg_status_list": None},
+            }
+            for x in conflicts
+            if x["id"] not in new_ids
+            and (
+                x["code"],
+                x["path_cache"],
+                _entity_id(x["entity"]),
+                _entity_id(x["task"]),
+            )
+            in publishes_by_key
+        ]
+        if requests:
+            self.publisher.shotgun.batch(requests)
+
+    def flush(self, logger):
+        """
+        Registers the pending publishes and sets their sg_publish_data. Only
+        the first call of a session does anything.
+        """
+        if self.flushed or not self.pending:
+            return
+        self.flushed = True
+        pending = self.pending
+        self.pending = []
+
+        try:
+            publishes = self._create_publishes(pending)
+        except Exception as err:
+            logger.warning(
+                "Batch registration of %d publishes failed, registering them "
+                "one by one: %s" % (len(pending), err)
+            )
+            for item, publish_data in pending:
+                if item.parent and "sg_publish_data" in item.parent.properties:
+                    parent_id = item.parent.properties.sg_publish_data["id"]
+                    if parent_id not in publish_data["dependency_ids"]:
+                        publish_data["dependency_ids"].append(parent_id)
+                item.properties.sg_publish_data = sgtk.util.register_publish(
+                    **publish_data
+                )
+            return
+
+        for (item, publish_data), publish in zip(pending, publishes):
+            publish["type"] = self.entity_type
+            item.properties.sg_publish_data = publish
+            item.properties.sg_publish_conflicts_cleared = True
+        logger.info("Registered %d publishes." % (len(publishes),))
+
+        self._create_dependencies(pending, publishes)
+        self._clear_conflicts(pending, publishes)
+
+        for (item, publish_data), publish in zip(pending, publishes):
+            thumbnail_path = publish_data.get("thumbnail_path")
+            if thumbnail_path:
+                try:
+                    self.publisher.shotgun.upload_thumbnail(
+                        self.entity_type, publish["id"], thumbnail_path
+                    )
+                except Exception as err:
+                    logger.warning(
+                        "Could not upload the thumbnail of %s: %s"
+                        % (publish_data["path"], err)
+                    )
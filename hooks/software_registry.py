@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Software -> rez package registry shared by the launcher and the farm submitters.
+
+All the Software rows of a project, project specific and global, are fetched
+in one query and indexed by (code, project id, platform). The registry is
+refreshed in the background once older than SOFTWARE_TTL, so lookups only
+wait on ShotGrid the first time, and engine_init prefetches it at engine start.
+"""
+
+import time
+import threading
+
+SOFTWARE_TTL = 600
+# how long a lookup waits for a prefetch in progress before querying itself
+PREFETCH_WAIT = 30
+
+PLATFORM_FIELDS = {
+    'linux': 'sg_rez',
+    'windows': 'sg_win_rez',
+}
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_platform(system):
+    # sys.platform is linux2 on python 2 and linux on python 3
+    if system.startswith('linux') or system == 'Linux':
+        return 'linux'
+    return 'windows'
+
+
+class SoftwareRegistry(object):
+
+    def __init__(self, tk, project, ttl=SOFTWARE_TTL):
+        self.tk = tk
+        self.project = project
+        self.ttl = ttl
+        self.packages = None
+        self.loaded_time = 0
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.refreshed = threading.Event()
+
+    def refresh(self):
+        """
+        Fetches the Software rows of the project and of all projects
+        """
+        # tk.shotgun is a connection of the calling thread
+        sg = self.tk.shotgun
+        filters = [{'filter_operator': 'any',
+                    'filters': [['projects', 'in', self.project],
+                                ['projects', 'is', None]]}]
+        rows = sg.find('Software', filters, ['code', 'projects'] + list(PLATFORM_FIELDS.values()))
+
+        packages = {}
+        for row in rows:
+            project_ids = [x['id'] for x in row['projects'] or []]
+            if self.project['id'] in project_ids:
+                project_id = self.project['id']
+            elif not project_ids:
+                project_id = None
+            else:
+                continue
+            for platform_name, field in PLATFORM_FIELDS.items():
+                # the first row found wins, as with find()[0]
+                key = (row['code'], project_id, platform_name)
+                if key not in packages:
+                    # an empty project row hides the global one, as before
+                    packages[key] = [x for x in row[field].split(',')] if row[field] else []
+
+        with self.lock:
+            self.packages = packages
+            self.loaded_time = time.time()
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # the registry keeps its current packages until the next refresh
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing = False
+                self.refreshed.set()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def get_packages(self, code, system):
+        """
+        Returns the rez packages of the Software code for the platform of system,
+        project specific first, then global. None if there are none.
+        """
+        if self.packages is None and self.refreshing:
+            self.refreshed.wait(PREFETCH_WAIT)
+        if self.packages is None:
+            self.refresh()
+        elif time.time() - self.loaded_time > self.ttl:
+            self.refresh_in_background()
+
+        platform_name = get_platform(system)
+        with self.lock:
+            key = (code, self.project['id'], platform_name)
+            if key not in self.packages:
+                key = (code, None, platform_name)
+            packages = self.packages.get(key)
+        return list(packages) if packages else None
+
+
+def get_registry(tk, project):
+    """
+    Returns the registry of project shared by this process
+    """
+    with _registries_lock:
+        registry = _registries.get(project['id'])
+        if registry is None:
+            registry = SoftwareRegistry(tk, project)
+            _registries[project['id']] = registry
+        return registry
+
+
+def prefetch(tk, project):
+    """
+    Loads the registry of project in the background
+    """
+    if project:
+        get_registry(tk, project).refresh_in_background()
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+'''
+Time log client used by TimeLogManager.
+
+The time log operations of database_manager.py are reached, in order of
+preference, through :
+    - the database_manager module imported in process, on one pooled
+      connection, when psycopg2 and shotgun_api3 are importable
+    - a local time log server started once per user with rez-env and reached
+      over a unix socket. It exits by itself after an hour without requests
+    - one rez-env subprocess per call, as before
+
+Writes go through TimeLogQueue, which sends them in batches from a background
+thread so that file operations never wait on Postgres or ShotGrid, and spools
+them to a local file while the database can't be reached. Events the
+database rejects are retried up to MAX_ATTEMPTS times, then moved to the
+rejected file next to the spool.
+'''
+
+import os
+import json
+import time
+import atexit
+import getpass
+import platform
+import tempfile
+import threading
+import subprocess as sp
+from abc import ABCMeta, abstractmethod
+from datetime import datetime, timedelta
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+FILE_PATH       =   os.path.dirname( os.path.realpath( __file__ ) )
+DATABASE_SCRIPT =   os.path.join( FILE_PATH, 'database_manager.py' )
+REZ_COMMAND     =   [ 'rez-env', 'psycopg2', 'shotgunapi', '--', 'python', DATABASE_SCRIPT ]
+TIME_FORMAT     =   '%Y-%m-%d %H:%M:%S'
+
+SOCKET_PATH     =   os.path.join( tempfile.gettempdir(), 'sgtk_timelog_{0}.sock'.format( getpass.getuser() ) )
+SERVER_IDLE     =   3600
+# resolving the rez environment of the server can take several seconds
+SERVER_START    =   30
+
+SPOOL_PATH      =   os.path.join( os.path.expanduser( '~' ), '.sgtk_timelog_spool' )
+BATCH_SIZE      =   100
+# how long the queue waits for more events before writing a batch
+FLUSH_INTERVAL  =   1.0
+# how often the spool is replayed while the database can't be reached
+RETRY_INTERVAL  =   60.0
+# how long exiting waits for queued events before spooling them
+CLOSE_TIMEOUT   =   5.0
+# writes of an event rejected by a reachable database before it is moved to
+# the rejected file
+MAX_ATTEMPTS    =   5
+
+_client         =   None
+_queue          =   None
+_client_lock    =   threading.Lock()
+
+
+class TimeLogClient( ABCMeta( 'ABC', ( object, ), {} ) ):
+    '''
+    get_user_info returns the user_info row as a list, with log_time formatted
+    as TIME_FORMAT, or None. now returns the database time as TIME_FORMAT.
+    log_data and user_data are the argument lists of database_manager.py -log and -user
+    '''
+    @abstractmethod
+    def get_user_info( self, user_id ):
+        pass
+
+    @abstractmethod
+    def now( self ):
+        pass
+
+    @abstractmethod
+    def log( self, log_data ):
+        pass
+
+    @abstractmethod
+    def set_status( self, user_data ):
+        pass
+
+    @abstractmethod
+    def record_worktime( self, log_data, work_time ):
+        pass
+
+    @abstractmethod
+    def write_batch( self, events ):
+        '''
+        Writes the events queued by TimeLogQueue and returns those left to write
+        '''
+
+    def stack( self, log_data, user_data, work_time = "" ):
+        self.log( log_data )
+        self.set_status( user_data )
+        if work_time:
+            self.record_worktime( log_data, work_time )
+
+
+class InProcessTimeLogClient( TimeLogClient ):
+    def __init__( self ):
+        import database_manager
+        # the connection is shared by every caller in this process, but the
+        # batches written by TimeLogQueue, ShotGrid timelogs included, have
+        # their own so that reads never wait behind them
+        self.service       = database_manager.TimeLogService( )
+        self.lock          = threading.Lock()
+        self.write_service = database_manager.TimeLogService( )
+        self.write_lock    = threading.Lock()
+
+    def call( self, op, *args ):
+        with self.lock:
+            return getattr( self.service, op )( *args )
+
+    def get_user_info( self, user_id ):
+        return self.call( 'get_user_info', user_id )
+
+    def now( self ):
+        return self.call( 'now' )
+
+    def log( self, log_data ):
+        self.call( 'log', list( log_data ) )
+
+    def set_status( self, user_data ):
+        self.call( 'set_status', list( user_data ) )
+
+    def record_worktime( self, log_data, work_time ):
+        self.call( 'record_worktime', list( log_data ), work_time )
+
+    def write_batch( self, events ):
+        with self.write_lock:
+            return self.write_service.write_batch( events )
+
+
+class SubprocessTimeLogClient( TimeLogClient ):
+    def __init__( self ):
+        self.sys_os = platform.system()
+
+    def run( self, args ):
+        cmd = REZ_COMMAND + [ str( x ) for x in args ]
+        if self.sys_os == 'Windows':
+            output, stderr = sp.Popen( sp.list2cmdline( cmd ), stdout = sp.PIPE, stderr = sp.PIPE, shell = False, cwd = FILE_PATH ).communicate()
+        else:
+            output, stderr = sp.Popen( ' '.join( quote( x ) for x in cmd ), stdout = sp.PIPE, stderr = sp.PIPE, shell = True, cwd = FILE_PATH ).communicate()
+        return output.decode( 'utf-8' )
+
+    def get_user_info( self, user_id ):
+        lines = self.run( [ '-id', user_id ] )
+        if not lines.strip():
+            return None
+        log_list = lines.split( "\n" )[0].split( " " )
+        return log_list[:4] + [ "{0} {1}".format( log_list[4], log_list[5] ) ]
+
+    def now( self ):
+        log_list = self.run( [ '-now' ] ).split( "\n" )[0].split( " " )
+        return "{0} {1}".format( log_list[0], log_list[1] )
+
+    def log( self, log_data ):
+        self.run( [ '-log' ] + list( log_data ) )
+
+    def set_status( self, user_data ):
+        self.run( [ '-user' ] + list( user_data ) )
+
+    def record_worktime( self, log_data, work_time ):
+        self.run( [ '-worktime' ] + list( log_data ) + [ work_time ] )
+
+    def write_batch( self, events ):
+        handle, batch_path = tempfile.mkstemp( suffix = '.json' )
+        try:
+            with os.fdopen( handle, 'w' ) as batch_file:
+                json.dump( events, batch_file )
+            lines = self.run( [ '-batch', batch_path ] ).strip().split( "\n" )
+        finally:
+            os.remove( batch_path )
+        # raises when the batch failed and nothing was printed
+        return json.loads( lines[-1] )
+
+    def stack( self, log_data, user_data, work_time = "" ):
+        # a single interpreter for the three writes
+        args = [ '-log' ] + list( log_data ) + [ '-user' ] + list( user_data )
+        if work_time:
+            args += [ '-timelog', work_time ]
+        self.run( args )
+
+
+class SocketTimeLogClient( TimeLogClient ):
+    '''
+    Talks to the time log server of database_manager.py, starting it when
+    needed. Falls back to SubprocessTimeLogClient if the server can't be started
+    '''
+    def __init__( self, socket_path = SOCKET_PATH ):
+        self.socket_path = socket_path
+        self.fallback    = None
+
+    def connect( self ):
+        import socket
+        sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            sock.connect( self.socket_path )
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def is_serving( self ):
+        try:
+            self.connect().close()
+        except ( IOError, OSError ):
+            return False
+        return True
+
+    def request( self, op, args ):
+        import socket
+        sock = self.connect()
+        try:
+            sock.sendall( ( json.dumps( { 'op': op, 'args': args } ) + '\n' ).encode( 'utf-8' ) )
+            sock.shutdown( socket.SHUT_WR )
+            data = b''
+            while not data.endswith( b'\n' ):
+                chunk = sock.recv( 65536 )
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            sock.close()
+        response = json.loads( data.decode( 'utf-8' ) )
+        if 'error' in response:
+            raise RuntimeError( 'time log server error : {0}'.format( response[ 'error' ] ) )
+        return response[ 'result' ]
+
+    def start_server( self ):
+        with open( os.devnull, 'w' ) as devnull:
+            sp.Popen( REZ_COMMAND + [ '-serve', self.socket_path, '-idle', str( SERVER_IDLE ) ],
+                      stdin = devnull, stdout = devnull, stderr = devnull,
+                      cwd = FILE_PATH, close_fds = True, preexec_fn = os.setsid )
+        deadline = time.time() + SERVER_START
+        while time.time() < deadline:
+            if self.is_serving():
+                return True
+            time.sleep( 0.1 )
+        return False
+
+    def call( self, op, *args ):
+        if self.fallback is None and not self.is_serving():
+            # no server running, or a stale socket left by a server that died
+            try:
+                started = self.start_server()
+            except OSError:
+                started = False
+            if not started:
+                self.fallback = SubprocessTimeLogClient( )
+        if self.fallback is not None:
+            return getattr( self.fallback, op )( *args )
+        return self.request( op, list( args ) )
+
+    def get_user_info( self, user_id ):
+        return self.call( 'get_user_info', user_id )
+
+    def now( self ):
+        return self.call( 'now' )
+
+    def log( self, log_data ):
+        self.call( 'log', list( log_data ) )
+
+    def set_status( self, user_data ):
+        self.call( 'set_status', list( user_data ) )
+
+    def record_worktime( self, log_data, work_time ):
+        self.call( 'record_worktime', list( log_data ), work_time )
+
+    def write_batch( self, events ):
+        return self.call( 'write_batch', events )
+
+
+class TimeLogQueue():
+    '''
+    Write-behind queue in front of a TimeLogClient. stack only queues the
+    events, stamped with the database time, and a background thread writes
+    them in batches. Events that can't be written are appended to the spool
+    file and replayed once the database can be reached again. Events rejected
+    MAX_ATTEMPTS times by a reachable database are appended to the rejected
+    file instead, to be looked at by hand.
+    Statuses not written yet are returned by get_user_info.
+    '''
+    def __init__( self, client, spool_path = SPOOL_PATH ):
+        self.client         =  client
+        self.spool_path     =  spool_path
+        self.rejected_path  =  spool_path + '.rejected'
+        self.events         =  queue.Queue()
+        self.lock           =  threading.Lock()
+        # status events not written yet, by user id
+        self.pending_status =  {}
+        # database time minus local time, updated by now
+        self.time_offset    =  timedelta( 0 )
+        self.closed         =  False
+        self.thread         =  threading.Thread( target = self.run )
+        self.thread.daemon  =  True
+        self.thread.start()
+        atexit.register( self.close )
+
+    def get_user_info( self, user_id ):
+        with self.lock:
+            event = self.pending_status.get( user_id )
+        if event is not None:
+            return list( event[ 'args' ][0] ) + [ event[ 'time' ] ]
+        return self.client.get_user_info( user_id )
+
+    def now( self ):
+        now_str = self.client.now()
+        self.time_offset = datetime.strptime( now_str, TIME_FORMAT ) - datetime.now()
+        return now_str
+
+    def event_time( self ):
+        return ( datetime.now() + self.time_offset ).strftime( TIME_FORMAT )
+
+    def put( self, event_type, args ):
+        event = { 'type': event_type, 'args': args, 'time': self.event_time() }
+        if event_type == 'status':
+            with self.lock:
+                self.pending_status[ args[0][0] ] = event
+        self.events.put( event )
+
+    def stack( self, log_data, user_data, work_time = "" ):
+        self.put( 'log', [ list( log_data ) ] )
+        self.put( 'status', [ list( user_data ) ] )
+        if work_time:
+            self.put( 'worktime', [ list( log_data ), work_time ] )
+
+    def run( self ):
+        stopping = False
+        while not stopping:
+            # the spool is replayed before each batch, so that events are
+            # written in order, and every RETRY_INTERVAL while idle
+            self.replay()
+            batch    = []
+            timeout  = RETRY_INTERVAL
+            deadline = None
+            while len( batch ) < BATCH_SIZE:
+                try:
+                    event = self.events.get( timeout = timeout )
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append( event )
+                if deadline is None:
+                    deadline = time.time() + FLUSH_INTERVAL
+                timeout = max( 0, deadline - time.time() )
+            if batch:
+                self.write( batch )
+
+    def write( self, events ):
+        '''
+        Writes events. When the batch fails with the database reachable, the
+        events are written one by one, and those failing count an attempt and
+        are spooled, or rejected after MAX_ATTEMPTS.
+        Returns True if the database could be reached
+        '''
+        try:
+            left = self.client.write_batch( events )
+        except Exception:
+            if not self.is_reachable():
+                # nothing was written, which isn't the fault of the events
+                self.spool( events )
+                self.clear_pending( events, events )
+                return False
+            left = events
+        if left and len( events ) > 1:
+            # find the events at fault, the others are written
+            left = [ event for event in left if not self.write_one( event ) ]
+
+        retry    = []
+        rejected = []
+        for event in left:
+            event[ 'attempts' ] = event.get( 'attempts', 0 ) + 1
+            if event[ 'attempts' ] >= MAX_ATTEMPTS:
+                rejected.append( event )
+            else:
+                retry.append( event )
+        if retry:
+            self.spool( retry )
+        if rejected:
+            self.spool( rejected, self.rejected_path )
+        self.clear_pending( events, retry )
+        return True
+
+    def write_one( self, event ):
+        try:
+            return not self.client.write_batch( [ event ] )
+        except Exception:
+            return False
+
+    def is_reachable( self ):
+        try:
+            self.client.now()
+        except Exception:
+            return False
+        return True
+
+    def clear_pending( self, events, spooled ):
+        '''
+        Forgets the statuses of events which are not spooled
+        '''
+        with self.lock:
+            for event in events:
+                user_id = event[ 'args' ][0][0] if event[ 'type' ] == 'status' else None
+                if user_id is not None and self.pending_status.get( user_id ) is event and \
+                   not any( x is event for x in spooled ):
+                    del self.pending_status[ user_id ]
+
+    def spool( self, events, path = None ):
+        with open( path or self.spool_path, 'a' ) as spool_file:
+            for event in events:
+                spool_file.write( json.dumps( event ) + '\n' )
+
+    def replay( self ):
+        # the spool is moved aside first, so that another process replaying it
+        # at the same time doesn't write the same events twice
+        replay_path = '{0}.{1}'.format( self.spool_path, os.getpid() )
+        try:
+            os.rename( self.spool_path, replay_path )
+        except OSError:
+            return
+        with open( replay_path ) as replay_file:
+            events = [ json.loads( line ) for line in replay_file if line.strip() ]
+        os.remove( replay_path )
+        for start in range( 0, len( events ), BATCH_SIZE ):
+            if not self.write( events[ start:start + BATCH_SIZE ] ):
+                self.spool( events[ start + BATCH_SIZE: ] )
+                break
+
+    def close( self, timeout = CLOSE_TIMEOUT ):
+        '''
+        Writes the events left, spooling whatever isn't written within timeout
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        self.events.put( None )
+        self.thread.join( timeout )
+        if self.thread.is_alive():
+            left = []
+            while True:
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if event is not None:
+                    left.append( event )
+            if left:
+                self.spool( left )
+
+
+def get_client( ):
+    '''
+    Returns the time log client shared by this process
+    '''
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = InProcessTimeLogClient( )
+            except ImportError:
+                if platform.system() == 'Windows':
+                    _client = SubprocessTimeLogClient( )
+                else:
+                    _client = SocketTimeLogClient( )
+        return _client
+
+
+def get_queue( ):
+    '''
+    Returns the time log queue shared by this process
+    '''
+    global _queue
+    client = get_client( )
+    with _client_lock:
+        if _queue is None:
+            _queue = TimeLogQueue( client )
+        return _queue
@@ -0,0 +1,149 @@
+# Copyright (c) 2012 The Foundry Visionmongers Ltd. All Rights Reserved.
+
+"""
+benchmarkSgXML.py
+Benchmarks for scenegraphXML.py on synthetic hierarchies.
+
+    python benchmarkSgXML.py writer [numNodes]
+    python benchmarkSgXML.py memory [numNodes] [--baseline revision]
+
+Each mode is run in its own process so that peak RSS can be compared.
+With --baseline, the memory benchmark is also run with the scenegraphXML.py
+of a git revision, e.g. one before the compact node classes, to compare the
+bytes per node before and after.
+"""
+
+import filecmp
+import gc
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# the memory benchmark of a baseline imports the scenegraphXML.py of its
+# revision, written to the folder given after the number of nodes
+if len(sys.argv) > 3 and sys.argv[1] == '_memory':
+    sys.path.insert(0, sys.argv[3])
+import scenegraphXML as sgxml
+
+
+def buildHierarchy(numNodes, groupSize=10):
+    """
+    Builds a ScenegraphRoot with numNodes elements, as assemblies of groups
+    holding groupSize references each, with static xforms and bounds.
+    """
+    root = sgxml.ScenegraphRoot()
+    numCreated = 0
+    groupNo = 0
+    while numCreated < numNodes:
+        group = sgxml.Group(name='group%d' % groupNo, groupType='assembly')
+        group.setBounds(value=[-1.0, 1.0, -1.0, 1.0, -1.0, 1.0])
+        numCreated += 1
+        for refNo in range(min(groupSize, numNodes - numCreated)):
+            ref = sgxml.Reference(name='ref%d' % refNo, refType='abc',
+                                  refFile='components/prop%d.abc' % (refNo % 7))
+            ref.setXform(value=[1,0,0,0, 0,1,0,0, 0,0,1,0, float(groupNo), float(refNo), 0, 1])
+            ref.setBounds(value=[-0.5, 0.5, -0.5, 0.5, -0.5, 0.5])
+            ref.setLodData(tag='hi', weight=1.0)
+            group.addInstance(ref)
+            numCreated += 1
+        root.addInstance(group)
+        groupNo += 1
+    return root
+
+
+def peakRSS():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxRSS /= 1024
+    return maxRSS
+
+
+def runWriter(numNodes, mode, filepath):
+    root = buildHierarchy(numNodes)
+    baseRSS = peakRSS()
+    startTime = time.time()
+    root.writeXMLFile(filepath, verbose=False, streaming=(mode == 'streaming'))
+    elapsed = time.time() - startTime
+    print('%-10s %8.2fs  peak RSS %8d KB  (hierarchy %d KB)' % (mode, elapsed, peakRSS(), baseRSS))
+
+
+def benchmarkWriter(numNodes):
+    tempDir = tempfile.mkdtemp()
+    try:
+        outputs = []
+        for mode in ('tree', 'streaming'):
+            filepath = os.path.join(tempDir, '%s.xml' % mode)
+            subprocess.check_call([sys.executable, __file__, '_writer', str(numNodes), mode, filepath])
+            outputs.append(filepath)
+        print('identical output: %s' % filecmp.cmp(outputs[0], outputs[1], shallow=False))
+    finally:
+        shutil.rmtree(tempDir)
+
+
+def runMemory(numNodes, label):
+    # read the hierarchy back from XML, as Katana and Maya tools do, so that
+    # names and paths are parsed strings rather than shared literals
+    tempDir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempDir, 'memory.xml')
+        buildHierarchy(numNodes).writeXMLFile(filepath, verbose=False)
+        gc.collect()
+        tracemalloc.start()
+        root = sgxml.ScenegraphRoot()
+        root.readXMLFile(filepath)
+        # the parsed XML tree is released once readXMLFile returns
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(tempDir)
+    print('%-10s %d nodes: %.1f MB, %d bytes per node' % (label, numNodes, size / 1048576.0, size // numNodes))
+
+
+def writeRevision(revision, moduleDir):
+    """
+    Writes the scenegraphXML.py of a git revision to moduleDir.
+    """
+    sourceDir = os.path.dirname(os.path.abspath(__file__))
+    path = subprocess.check_output(['git', 'ls-files', '--full-name', 'scenegraphXML.py'],
+                                   cwd=sourceDir).decode().strip()
+    source = subprocess.check_output(['git', 'show', '%s:%s' % (revision, path)], cwd=sourceDir)
+    with open(os.path.join(moduleDir, 'scenegraphXML.py'), 'wb') as f:
+        f.write(source)
+
+
+def benchmarkMemory(numNodes, baseline=None):
+    if baseline:
+        moduleDir = tempfile.mkdtemp()
+        try:
+            writeRevision(baseline, moduleDir)
+            subprocess.check_call([sys.executable, __file__, '_memory', str(numNodes), moduleDir, baseline])
+        finally:
+            shutil.rmtree(moduleDir)
+    runMemory(numNodes, 'current')
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'writer'
+    if command == '_writer':
+        runWriter(int(sys.argv[2]), sys.argv[3], sys.argv[4])
+    elif command == 'writer':
+        benchmarkWriter(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    elif command == '_memory':
+        runMemory(int(sys.argv[2]), sys.argv[4])
+    elif command == 'memory':
+        args = sys.argv[2:]
+        baseline = None
+        if '--baseline' in args:
+            index = args.index('--baseline')
+            baseline = args[index + 1]
+            del args[index:index + 2]
+        benchmarkMemory(int(args[0]) if args else 200000, baseline)
+    else:
+        raise ValueError('unknown benchmark: %s' % command)
@@ -1,8 +1,11 @@
 # Copyright (c) 2012 The Foundry Visionmongers Ltd. All Rights Reserved.
 
 import maya.cmds as cmds
+import maya.api.OpenMaya as om
 import sys
 import os.path
+import time
+from array import array
 import scenegraphXML
 
 # Make sure the Alembic plugin is loaded
@@ -14,7 +17,9 @@ animBoundsData = {}
 
 # Main function called to actually export from Maya to ScenegraphXML format
 def maya2ScenegraphXML(mayaSelection, xmlFileName, startFrame=None, endFrame=None,
-                       arbAttrs=None, geoFileOptions=''):
+                       arbAttrs=None, geoFileOptions='',
+                       channelFormat=scenegraphXML.CHANNEL_FORMAT_XML, channelWriterThreads=4,
+                       foldStaticChannels=False, useTimeContext=True, profileSampling=False):
     # Strip xmlFileName into directory and file name components
     fileDir, fileStem = os.path.split(xmlFileName)
  
@@ -32,7 +37,12 @@ def maya2ScenegraphXML(mayaSelection, xmlFileName, startFrame=None, endFrame=Non
                                     startFrame=startFrame,
                                     endFrame=endFrame,
                                     arbAttrs=arbAttrs,
-                                    geoFileOptions=geoFileOptions)
+                                    geoFileOptions=geoFileOptions,
+                                    channelFormat=channelFormat,
+                                    channelWriterThreads=channelWriterThreads,
+                                    foldStaticChannels=foldStaticChannels,
+                                    useTimeContext=useTimeContext,
+                                    profileSampling=profileSampling)
 
     sgxmlHandler.writeChannelData()
 
@@ -235,11 +245,225 @@ class ChannelHandler:
         self.mayaChannelData.append(newChannelData)
 
 
+class MayaSceneIndex:
+    # snapshot of the Maya hierarchies to export. The DAG is walked once, a level
+    # at a time, recording the type, children and shapes of every node and the
+    # names of the sgxml_* and arbAttr_* attributes on each transform, so that
+    # building the sgxml hierarchy only queries this index. Attribute values are
+    # read the first time they are requested and then kept.
+
+    attrPrefixes = ('sgxml_', 'arbAttr_')
+
+    def __init__(self, mayaRoots):
+        self.nodeTypes = {}
+        self.children = {}
+        self.shapes = set()
+        self.attrNames = {}
+        self.attrValues = {}
+        self.longNames = {}
+        for curRoot in mayaRoots:
+            self.addHierarchy(curRoot)
+
+    def addHierarchy(self, mayaRoot):
+        longRoot = self.getLongName(mayaRoot)
+        level = [longRoot]
+        while level:
+            for curNode, curNodeType in pairs(cmds.ls(level, long=True, showType=True)):
+                self.nodeTypes[curNode] = curNodeType
+            self.shapes.update(cmds.ls(level, long=True, shapes=True) or [])
+
+            nextLevel = []
+            for curNode in level:
+                self.children[curNode] = []
+                # only transforms are exported below the selected nodes
+                if curNode in self.shapes or \
+                   (curNode != longRoot and self.nodeTypes.get(curNode) != 'transform'):
+                    continue
+                attrs = cmds.listAttr(curNode, userDefined=True) or []
+                attrs = set(x for x in attrs if x.startswith(self.attrPrefixes))
+                self.attrNames[curNode] = attrs
+                # ignored nodes are never exported, so their children are not needed
+                if 'sgxml_ignore' not in attrs:
+                    nextLevel.append(curNode)
+
+            # listRelatives returns the children of each node in turn, and the
+            # parent of each child is the prefix of its full path
+            if nextLevel:
+                for curChild in cmds.listRelatives(nextLevel, fullPath=True) or []:
+                    parent = curChild.rpartition('|')[0]
+                    if parent in self.children:
+                        self.children[parent].append(curChild)
+            level = [x for y in nextLevel for x in self.children[y]]
+
+    def getLongName(self, mayaPath):
+        if mayaPath not in self.longNames:
+            longNames = cmds.ls(mayaPath, long=True)
+            if not longNames:
+                raise ValueError('maya node not found: %s' % mayaPath)
+            self.longNames[mayaPath] = longNames[0]
+        return self.longNames[mayaPath]
+
+    def getIndexedName(self, mayaPath):
+        if mayaPath in self.nodeTypes:
+            return mayaPath
+        longName = self.getLongName(mayaPath)
+        if longName not in self.nodeTypes:
+            # not under one of the indexed hierarchies
+            self.addHierarchy(longName)
+        return longName
+
+    def nodeType(self, mayaPath):
+        return self.nodeTypes[self.getIndexedName(mayaPath)]
+
+    def hasShapes(self, mayaPath):
+        return any(x in self.shapes for x in self.children[self.getIndexedName(mayaPath)])
+
+    def hasAttr(self, mayaPath, attrName):
+        return attrName in self.attrNames.get(self.getIndexedName(mayaPath), ())
+
+    def getAttrOrNone(self, mayaPath, attrName):
+        mayaPath = self.getIndexedName(mayaPath)
+        if attrName not in self.attrNames.get(mayaPath, ()):
+            return None
+        key = (mayaPath, attrName)
+        if key not in self.attrValues:
+            self.attrValues[key] = cmds.getAttr(mayaPath + '.' + attrName)
+        return self.attrValues[key]
+
+    def getValidChildren(self, mayaPath):
+        # children which are transforms not set to 'ignore'
+        return [x for x in self.children[self.getIndexedName(mayaPath)]
+                if self.nodeTypes.get(x) == 'transform' and not self.hasAttr(x, 'sgxml_ignore')]
+
+
+def pairs(items):
+    # [a, b, c, d] -> [(a, b), (c, d)], as returned by ls with showType
+    items = items or []
+    return zip(items[0::2], items[1::2])
+
+
+class MayaChannelSampler:
+    # samples the animated channels of a MayaSgxmlHandler. All plugs are resolved
+    # once up front through the API and attribute existence is cached, so that
+    # sampling a frame reads plug values directly instead of issuing xform,
+    # getAttr and listAttr commands per channel. With useTimeContext, plugs are
+    # evaluated in a DG context for the frame, so the current time of the scene
+    # does not need to change between frames.
+
+    customBoundsAttrs = ('sgxml_boundMinX', 'sgxml_boundMaxX', 'sgxml_boundMinY',
+                         'sgxml_boundMaxY', 'sgxml_boundMinZ', 'sgxml_boundMaxZ')
+
+    def __init__(self, mayaChannelData, useTimeContext=True, profile=False):
+        self.useTimeContext = useTimeContext
+        self.profile = profile
+        # per attribute kind: [number of reads, seconds spent]
+        self.stats = {}
+        self.channels = []
+        for mayaPath, attrName, channelIndex, numChannels in mayaChannelData:
+            if attrName == 'bounds':
+                plugs = None
+            elif attrName == 'xform':
+                # the local matrix attribute holds the object space matrix returned by xform
+                plugs = getPlug(mayaPath, 'matrix')
+            elif attrName == 'customBounds':
+                # missing custom bounds attributes read as 0
+                plugs = [getPlug(mayaPath, x) if attributeExists(mayaPath, x) else None
+                         for x in self.customBoundsAttrs]
+            else:
+                plugs = getPlug(mayaPath, attrName)
+            self.channels.append((mayaPath, attrName, channelIndex, numChannels, plugs))
+
+    def getKind(self, attrName):
+        if attrName.startswith('arbAttr_'):
+            return 'arbAttr'
+        return attrName
+
+    def sampleFrame(self, frameNumber, channelData):
+        # copies the values of all channels at frameNumber into channelData
+        context = None
+        previousContext = None
+        if self.useTimeContext:
+            context = om.MDGContext(om.MTime(frameNumber, om.MTime.uiUnit()))
+            if hasattr(context, 'makeCurrent'):
+                previousContext = context.makeCurrent()
+                context = None
+
+        values = channelData.values
+        if not isinstance(values, list):
+            values = [float(x) for x in values]
+        try:
+            for mayaPath, attrName, channelIndex, numChannels, plugs in self.channels:
+                if self.profile:
+                    startTime = time.time()
+                vals = None
+                if attrName == 'bounds':
+                    vals = getAnimBoundsData(mayaPath, frameNumber)
+                elif attrName == 'xform':
+                    matrixData = om.MFnMatrixData(readPlug(plugs, context, asObject=True))
+                    vals = list(matrixData.matrix())
+                elif attrName == 'customBounds':
+                    addAnimBoundsData(mayaPath, frameNumber,
+                                      [0 if x is None else readPlug(x, context) for x in plugs])
+                elif numChannels == 1:
+                    vals = [readPlug(plugs, context)]
+                else:
+                    vals = [readPlug(plugs.child(i), context) for i in range(plugs.numChildren())]
+
+                # note: vals can be none for bounds that are to be automatically calculated
+                if vals is not None:
+                    if len(values) < channelIndex + len(vals):
+                        values.extend([0.0] * (channelIndex + len(vals) - len(values)))
+                    values[channelIndex:channelIndex + len(vals)] = vals
+
+                if self.profile:
+                    kindStats = self.stats.setdefault(self.getKind(attrName), [0, 0.0])
+                    kindStats[0] += 1
+                    kindStats[1] += time.time() - startTime
+        finally:
+            if previousContext is not None:
+                previousContext.makeCurrent()
+        channelData.values = values
+
+    def reportStats(self):
+        # prints the number of reads and reads per second for each attribute kind
+        for kind in sorted(self.stats):
+            calls, seconds = self.stats[kind]
+            callsPerSecond = calls / seconds if seconds > 0 else float('inf')
+            print('sgxml sampling %-14s %8d calls %12.1f calls/sec' % (kind, calls, callsPerSecond))
+
+
+def getPlug(mayaPath, attrName):
+    selectionList = om.MSelectionList()
+    selectionList.add(mayaPath + '.' + attrName)
+    return selectionList.getPlug(0)
+
+
+def attributeExists(mayaPath, attrName):
+    return bool(cmds.attributeQuery(attrName, node=mayaPath, exists=True))
+
+
+def readPlug(plug, context=None, asObject=False):
+    # reads a plug in the current DG context, or in context for API versions
+    # without MDGContext.makeCurrent
+    if asObject:
+        if context is not None:
+            return plug.asMObject(context)
+        return plug.asMObject()
+    if context is not None:
+        return plug.asDouble(context)
+    return plug.asDouble()
+
+
 class MayaSgxmlHandler:
     # creates python classes using scenegraphXML.py to represent Maya hierarchy data
 
     def __init__(self, mayaSelection, fileDir, fileStem, startFrame=None, endFrame=None,
-                 arbAttrs=None, geoFileOptions=None, boundsWriteMode='all', mayaParent=None):
+                 arbAttrs=None, geoFileOptions=None, boundsWriteMode='all', mayaParent=None,
+                 channelFormat=scenegraphXML.CHANNEL_FORMAT_XML, channelWriterThreads=4,
+                 foldStaticChannels=False, useTimeContext=True, profileSampling=False,
+                 sceneIndex=None):
+        if channelFormat not in scenegraphXML.CHANNEL_FORMATS:
+            raise ValueError('unsupported channelFormat: %s' % channelFormat)
         self.mayaSelection = mayaSelection
         self.mayaParent = mayaParent
         self.fileDir = fileDir
@@ -249,10 +473,32 @@ class MayaSgxmlHandler:
         self.arbAttrs = arbAttrs
         self.geoFileOptions = geoFileOptions
         self.boundsWriteMode = boundsWriteMode
+        self.channelFormat = channelFormat
+        # number of background threads writing channel files, 0 writes them
+        # synchronously while sampling
+        self.channelWriterThreads = channelWriterThreads
+        # when set, sampled frames are spooled to a temporary file by a
+        # ChannelFolder and the channel files are only written once the whole
+        # range is sampled and the constant channels have been folded, so the
+        # writes no longer overlap the sampling
+        self.foldStaticChannels = foldStaticChannels
+        self.channelFolder = None
+        # channels are sampled through a MayaChannelSampler, created once the
+        # hierarchy is known. With useTimeContext frames are evaluated without
+        # changing the current time of the scene
+        self.useTimeContext = useTimeContext
+        self.profileSampling = profileSampling
+        self.channelSampler = None
         self.childHandlers = []
         self.mayaChannelData = []
         self.numChannels = 0
         self.rangeMaxBoundsList = []
+        self.boundsEngine = None
+        # the hierarchy is built from a single snapshot of the scene, shared with
+        # child handlers
+        if sceneIndex is None:
+            sceneIndex = MayaSceneIndex(self.mayaSelection)
+        self.sceneIndex = sceneIndex
 
         # iterate over the hierachy and create scenegraphXML element to hold data for
         # any Maya nodes that need to be written out to scenegraphXML
@@ -270,7 +516,8 @@ class MayaSgxmlHandler:
             frameNo = self.getStaticFrameNo()
             self.root.channelData = scenegraphXML.ChannelData(frameNo, frameNo)
         else:
-            self.root.channelData = scenegraphXML.ChannelData(startFrame, endFrame, chanPath)
+            self.root.channelData = scenegraphXML.ChannelData(startFrame, endFrame, chanPath,
+                                                                channelFormat=self.channelFormat)
 
         # iterate through the Maya selection list creating a SgXML hierarchy for each
         # instance and add them to the root SgXML element
@@ -289,11 +536,12 @@ class MayaSgxmlHandler:
 
     def createSgXMLHierarchy(self, mayaElementPath):
         curNodeName = getMayaNodeName(mayaElementPath)
+        index = self.sceneIndex
 
-        nodeType = getAttrOrNone(mayaElementPath, 'sgxml_nodeType')
+        nodeType = index.getAttrOrNone(mayaElementPath, 'sgxml_nodeType')
         newElement = None
 
-        nodeGroupType = getAttrOrNone(mayaElementPath, 'sgxml_nodeGroupType')
+        nodeGroupType = index.getAttrOrNone(mayaElementPath, 'sgxml_nodeGroupType')
 
         dirUsed = self.fileDir
         stemUsed = ''
@@ -305,7 +553,7 @@ class MayaSgxmlHandler:
             # SgXML files together
 
             # Allow to overwrite the name and path of the destination file
-            nodeFilepath = getAttrOrNone(mayaElementPath, 'sgxml_filepath')            
+            nodeFilepath = index.getAttrOrNone(mayaElementPath, 'sgxml_filepath')            
             if nodeFilepath:
                 fileDir = os.path.dirname(nodeFilepath)
                 if fileDir:
@@ -317,7 +565,7 @@ class MayaSgxmlHandler:
 
             filepath = mayaNode2FilePath(mayaElementPath, self.fileDir, 'xml', relativePath=True)
             newElement = scenegraphXML.Reference(curNodeName, refFile=filepath, groupType=nodeGroupType)
-            elementChildList = getValidChildren(mayaElementPath)
+            elementChildList = index.getValidChildren(mayaElementPath)
             newChildHandler = MayaSgxmlHandler(mayaSelection=elementChildList,
                                                 fileDir=dirUsed,
                                                 fileStem=stemUsed,
@@ -326,7 +574,12 @@ class MayaSgxmlHandler:
                                                 arbAttrs=self.arbAttrs,
                                                 geoFileOptions=self.geoFileOptions,
                                                 boundsWriteMode=self.boundsWriteMode,
-                                                mayaParent=mayaElementPath)
+                                                mayaParent=mayaElementPath,
+                                                channelFormat=self.channelFormat,
+                                                foldStaticChannels=self.foldStaticChannels,
+                                                useTimeContext=self.useTimeContext,
+                                                profileSampling=self.profileSampling,
+                                                sceneIndex=index)
             self.childHandlers.append(newChildHandler)
 
         elif nodeType == 'component' or nodeType == 'staticComponent':
@@ -334,9 +587,9 @@ class MayaSgxmlHandler:
             # alembic format .abc file
             # (Would be nice to generalise this later)
             
-            refType = getAttrOrNone(mayaElementPath, 'sgxml_refType')
+            refType = index.getAttrOrNone(mayaElementPath, 'sgxml_refType')
 
-            elementChildList = getValidChildren(mayaElementPath)
+            elementChildList = index.getValidChildren(mayaElementPath)
             if not elementChildList and mayaElementPath:
                 elementChildList = [mayaElementPath]
 
@@ -354,7 +607,7 @@ class MayaSgxmlHandler:
         elif nodeType == 'reference':
             # This is a reference to an already existing .abc or .xml file
             newElement = scenegraphXML.Reference(curNodeName)
-            refType = getAttrOrNone(mayaElementPath, 'sgxml_refType')
+            refType = index.getAttrOrNone(mayaElementPath, 'sgxml_refType')
             if refType == 'abc':
                 filepath = mayaNode2FilePath(mayaElementPath, self.fileDir, 'abc', relativePath=True)
             else:
@@ -368,8 +621,7 @@ class MayaSgxmlHandler:
             if nodeType is not None:
                 newElement.groupType = nodeType
             else:
-                relShapes = cmds.listRelatives(curNodeName, shapes=True)
-                if relShapes is not None:
+                if index.hasShapes(mayaElementPath):
                     cmds.warning("'%s' is not defined. The geometry will not "
                                  "be included in the scenegraph."
                                  % curNodeName)
@@ -377,17 +629,10 @@ class MayaSgxmlHandler:
             if nodeGroupType is not None: # Overrides type if set explicitly
                 newElement.groupType = nodeGroupType
 
-            childNodes = cmds.listRelatives(mayaElementPath, fullPath=True)
-            if childNodes is not None:
-                for mayaChildPath in childNodes:
-                    # check if the node isn't set to 'ignore'
-                    if cmds.listAttr(mayaChildPath, st=['sgxml_ignore']) is None:
-                        # check if this is a valid instance node. For now we only
-                        # process transform nodes
-                        curNodeType = cmds.nodeType(mayaChildPath)
-                        if curNodeType == 'transform':
-                            childElement = self.createSgXMLHierarchy(mayaChildPath)
-                            newElement.addInstance(childElement)
+            # only transform nodes which aren't set to 'ignore' are processed
+            for mayaChildPath in index.getValidChildren(mayaElementPath):
+                childElement = self.createSgXMLHierarchy(mayaChildPath)
+                newElement.addInstance(childElement)
 
         # process xform
         # In the instances where a component has shape nodes i.e. it's Maya geometry
@@ -397,8 +642,8 @@ class MayaSgxmlHandler:
         # the time being we are going to just leave it out of the scenegraph file.
         #
         # test if xform is animating
-        refType = getAttrOrNone(mayaElementPath, 'sgxml_refType')
-        if cmds.listRelatives(mayaElementPath, shapes=True ) and refType == 'abc':
+        refType = index.getAttrOrNone(mayaElementPath, 'sgxml_refType')
+        if index.hasShapes(mayaElementPath) and refType == 'abc':
             cmds.warning("%s contains a shape node. Transforms will be stored "
                          "in the Alembic file to prevent double transforms."
                          % mayaElementPath)
@@ -412,7 +657,7 @@ class MayaSgxmlHandler:
 
         # process bounds
         # Check if local override has been set to force the boundsWriteMode on this node
-        processBounds = getAttrOrNone(mayaElementPath, 'sgxml_boundsWriteMode')
+        processBounds = index.getAttrOrNone(mayaElementPath, 'sgxml_boundsWriteMode')
         if processBounds is None:
             if self.boundsWriteMode == 'all':
                 processBounds = True
@@ -423,7 +668,7 @@ class MayaSgxmlHandler:
                 # Now supporting static components (no animation)
                 processBounds = nodeType in ('assembly', 'component', 'staticComponent', 'reference')
                 
-        customBounds = getAttrOrNone(mayaElementPath, 'sgxml_customBounds')
+        customBounds = index.getAttrOrNone(mayaElementPath, 'sgxml_customBounds')
         if customBounds:
             newChannelIndex = self.newAnimChannel(mayaElementPath, 'customBounds', 6)
         
@@ -437,22 +682,22 @@ class MayaSgxmlHandler:
                 newElement.setBounds(channelIndex=newChannelIndex)
 
         # process lodData
-        lodTag = getAttrOrNone(mayaElementPath, 'sgxml_lodTag')
-        lodWeight = getAttrOrNone(mayaElementPath, 'sgxml_lodWeight')
+        lodTag = index.getAttrOrNone(mayaElementPath, 'sgxml_lodTag')
+        lodWeight = index.getAttrOrNone(mayaElementPath, 'sgxml_lodWeight')
         if lodTag is not None or lodWeight is not None:
             newElement.setLodData(tag=lodTag, weight=lodWeight)
 
         # process proxyList
         # note: currently only supports single proxy in proxyList
-        proxyName = getAttrOrNone(mayaElementPath, 'sgxml_proxyName')
-        proxyFile = getAttrOrNone(mayaElementPath, 'sgxml_proxyFile')
+        proxyName = index.getAttrOrNone(mayaElementPath, 'sgxml_proxyName')
+        proxyFile = index.getAttrOrNone(mayaElementPath, 'sgxml_proxyFile')
         if proxyName is not None and proxyFile is not None:
             newElement.addProxy(name=proxyName, ref=proxyFile)
 
         # process arbitrary attributes
         if self.arbAttrs is not None:
             for attrName in self.arbAttrs:
-                curVal = getAttrOrNone(mayaElementPath, 'arbAttr_' + attrName)
+                curVal = index.getAttrOrNone(mayaElementPath, 'arbAttr_' + attrName)
                 if curVal is not None:
                     if isinstance( curVal, float ):
                         # animated float attribute case
@@ -497,7 +742,7 @@ class MayaSgxmlHandler:
             fullFilePath = os.path.join(self.fileDir, fullFilePath)
 
         # write our file for the SgXML handler
-        self.root.writeXMLFile(fullFilePath)
+        self.root.writeXMLFile(fullFilePath, streaming=True)
 
         # write out files for child SgXML handlers
         for curChildHandler in self.childHandlers:
@@ -506,54 +751,54 @@ class MayaSgxmlHandler:
     def writeChannelData(self):
         # write the channel data for the animation range for this and any child handlers
         # note: we should only get here if a valid animation range has been set
+        # Channel files are written by background threads while the next frames
+        # are sampled; any write error is raised when closing the writer.
+        channelWriter = None
         try:
             if self.isStatic():
                 curFrame = self.getStaticFrameNo()
-                cmds.currentTime(curFrame)
+                if not self.useTimeContext:
+                    cmds.currentTime(curFrame)
                 self.writeChannelDataForFrame(curFrame)
-            else:                
+            else:
+                if self.channelWriterThreads:
+                    channelWriter = scenegraphXML.ChannelFileWriter(numWorkers=self.channelWriterThreads)
                 for curFrame in range(self.startFrame, self.endFrame+1):
-                    cmds.currentTime(curFrame)
-                    self.writeChannelDataForFrame(curFrame)
+                    if not self.useTimeContext:
+                        cmds.currentTime(curFrame)
+                    self.writeChannelDataForFrame(curFrame, channelWriter)
+                if self.foldStaticChannels:
+                    self.writeFoldedChannelData(channelWriter)
+                if channelWriter is not None:
+                    channelWriter.close()
+            if self.profileSampling:
+                self.reportSamplingStats()
         except Exception as e:
+            if channelWriter is not None and channelWriter.workers:
+                try:
+                    channelWriter.close()
+                except Exception:
+                    pass
             cmds.error("Exception: %s (MayaSgxmlHandler.writeChannelData)" % e)
 
-    def writeChannelDataForFrame(self, frameNumber):
+    def writeChannelDataForFrame(self, frameNumber, channelWriter=None):
         # recurse through each child handler writing the channel data for this frame
         for curChildHandler in self.childHandlers:
-            curChildHandler.writeChannelDataForFrame(frameNumber)
+            curChildHandler.writeChannelDataForFrame(frameNumber, channelWriter)
 
         # copy the values for the animated values from maya to the sgxml channels
-        for mayaPath, attrName, channelIndex, numChannels in self.mayaChannelData:
-            vals = []
-            #print("mayaPath = %s" % mayaPath)
-            #print("attrName = %s" % attrName)
-            if attrName is 'bounds':
-                vals = getAnimBoundsData(mayaPath, frameNumber)
-            elif attrName is 'xform':
-                vals = cmds.xform(mayaPath, query=True, matrix=True, objectSpace=True)
-            elif attrName is 'customBounds':
-                sgxml_boundMinX = getAttrOrZero(mayaPath, 'sgxml_boundMinX')
-                sgxml_boundMaxX = getAttrOrZero(mayaPath, 'sgxml_boundMaxX')
-                sgxml_boundMinY = getAttrOrZero(mayaPath, 'sgxml_boundMinY')
-                sgxml_boundMaxY = getAttrOrZero(mayaPath, 'sgxml_boundMaxY')
-                sgxml_boundMinZ = getAttrOrZero(mayaPath, 'sgxml_boundMinZ')
-                sgxml_boundMaxZ = getAttrOrZero(mayaPath, 'sgxml_boundMaxZ')
-                
-                addAnimBoundsData(mayaPath, frameNumber, [sgxml_boundMinX, sgxml_boundMaxX, sgxml_boundMinY, sgxml_boundMaxY, sgxml_boundMinZ, sgxml_boundMaxZ])
-            else:
-                if numChannels == 1:
-                    vals = [cmds.getAttr(mayaPath + '.' + attrName)]
-                else:
-                    vals = cmds.getAttr(mayaPath + '.' + attrName)
-            # note: vals can be none for bounds that are to be automatically calculated
-            if vals is not None:
-                for i, curVal in enumerate(vals):
-                    fle = channelIndex + i
-                    self.root.setChannelDataValue(channelIndex + i, curVal)
-
-        # force any automatic calculation of bounds of parents based on children needed
-        curBounds = self.root.calcBounds()
+        if self.channelSampler is None:
+            self.channelSampler = MayaChannelSampler(self.mayaChannelData,
+                                                     useTimeContext=self.useTimeContext,
+                                                     profile=self.profileSampling)
+        self.channelSampler.sampleFrame(frameNumber, self.root.channelData)
+
+        # force any automatic calculation of bounds of parents based on children needed.
+        # The hierarchy is fixed once the handler is built, so it is flattened once
+        # and the bounds are then calculated in batch for every frame
+        if self.boundsEngine is None:
+            self.boundsEngine = scenegraphXML.BoundsEngine(self.root)
+        curBounds = self.boundsEngine.calcBounds(self.root.channelData)
 
         # if this SgXML handler has a mayaParent, place the top level bounds data into
         # animBoundsData for use by the parent handler
@@ -563,9 +808,49 @@ class MayaSgxmlHandler:
         # write out the XML file for the channel data
         if not self.isStatic():
             "Writing XML channel file..."
-            self.root.writeXMLChannelFile(frameNumber)
+            if self.foldStaticChannels:
+                frameValues = array('d', self.root.channelData.values)
+                # channels which were never set are implicitly 0.0
+                frameValues.extend([0.0] * (self.numChannels - len(frameValues)))
+                if self.channelFolder is None:
+                    self.channelFolder = scenegraphXML.ChannelFolder(self.root)
+                self.channelFolder.addFrame(frameNumber, frameValues)
+            elif channelWriter is not None:
+                channelWriter.write(self.root.channelData, frameNumber)
+            else:
+                self.root.writeXMLChannelFile(frameNumber)
            
 
+    def reportSamplingStats(self):
+        for curChildHandler in self.childHandlers:
+            curChildHandler.reportSamplingStats()
+        if self.channelSampler is not None:
+            print('sgxml sampling stats for %s:' % self.fileStem)
+            self.channelSampler.reportStats()
+
+    def writeFoldedChannelData(self, channelWriter=None):
+        # fold channels that are constant over the frame range into static values,
+        # then write the remaining channels for every spooled frame
+        for curChildHandler in self.childHandlers:
+            curChildHandler.writeFoldedChannelData(channelWriter)
+
+        channelFolder = self.channelFolder
+        if channelFolder is None:
+            return
+        self.channelFolder = None
+        try:
+            channelFolder.fold()
+            channelData = self.root.channelData
+            for frameNumber, curValues in channelFolder.getFrames():
+                channelData.values = curValues.tolist()
+                if channelWriter is not None:
+                    channelWriter.write(channelData, frameNumber)
+                else:
+                    channelData.writeXMLChannelFile(frameNumber)
+        finally:
+            channelFolder.close()
+
+
 def setSgxmlAttr( attrName, selection=None, value=None, attrType='bool' ):
     if selection is None:
         selection = cmds.ls( selection=True )
@@ -9,7 +9,34 @@ that can be read and written using XML and Alembic .abc files.
 
 import xml.etree.ElementTree as ET
 import os.path
+import hashlib
 import logging
+import mmap
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+if sys.version_info[0] >= 3:
+    from sys import intern
 
 
 __version__ = '0.1.0'
@@ -21,6 +48,48 @@ SG_XML_LOG_LEVEL = logging.WARNING
 log = logging.getLogger("scenegraphXML")
 log.setLevel(SG_XML_LOG_LEVEL)
 
+# Storage formats available for animated channel data. 'xml' writes one
+# .chan.%04d.xml file per frame, 'binary' packs every frame into a single
+# .chan.bin file that can be memory-mapped by readers and 'delta' stores
+# blocks of a keyframe followed by per-frame deltas in a single .chan.dlt file.
+CHANNEL_FORMAT_XML = 'xml'
+CHANNEL_FORMAT_BINARY = 'binary'
+CHANNEL_FORMAT_DELTA = 'delta'
+CHANNEL_FORMATS = (CHANNEL_FORMAT_XML, CHANNEL_FORMAT_BINARY, CHANNEL_FORMAT_DELTA)
+
+# Header of the binary channel file: magic, version, array typecode ('f' or 'd'),
+# startFrame, endFrame and number of channels. The header is padded to
+# CHANNEL_BINARY_HEADER_SIZE bytes so that the frame data is 8 byte aligned.
+CHANNEL_BINARY_MAGIC = b'SGXC'
+CHANNEL_BINARY_VERSION = 1
+CHANNEL_BINARY_HEADER = struct.Struct('<4sHcxiiI')
+CHANNEL_BINARY_HEADER_SIZE = 32
+# Guards creation of binary channel files written from several threads
+_binaryChannelFileLock = threading.Lock()
+
+# Layout of the delta channel file: a header (magic, version, compression,
+# startFrame, endFrame, number of channels, keyframe interval, number of blocks)
+# followed by a block index of (offset, size) entries and the blocks. Each
+# block holds the full values of its first frame, then for every following
+# frame the number of changed channels, their indices and their new values,
+# and is optionally compressed as a whole.
+CHANNEL_DELTA_MAGIC = b'SGXD'
+CHANNEL_DELTA_VERSION = 1
+CHANNEL_DELTA_HEADER = struct.Struct('<4sHBxiiIII')
+CHANNEL_DELTA_INDEX_ENTRY = struct.Struct('<QI')
+CHANNEL_DELTA_COMPRESSION = {None: 0, 'zlib': 1, 'lz4': 2}
+# Guards delta channel files, whose blocks are assembled from frames that can
+# arrive in any order from several threads
+_deltaChannelFileLock = threading.Lock()
+
+# Maximum number of referenced scenegraphXML files kept by the process-wide
+# reference cache used by loadScenegraphFile
+REFERENCE_CACHE_SIZE = 256
+_referenceCache = OrderedDict()
+_referenceCacheLock = threading.Lock()
+# Guards the creation of the instances of lazily read groups
+_lazyGroupLock = threading.RLock()
+
 
 def floatOrNone(val):
     """
@@ -42,27 +111,304 @@ def intOrNone(val):
         return int(val)
 
 
-def createScenegraphElementFromXMLData(xmlElement):
+def internOrNone(val):
+    """
+    Returns None if val is None and the interned string otherwise, so that
+    names and paths repeated across many nodes share a single string.
+    """
+    if val is None or not isinstance(val, str):
+        return val
+    else:
+        return intern(val)
+
+
+def arrayToBytes(values):
+    """
+    Returns the little-endian bytes of an array.
+    """
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    if sys.version_info[0] < 3:
+        return values.tostring()
+    return values.tobytes()
+
+
+def arrayFromBytes(typecode, data):
+    """
+    Returns an array of typecode from little-endian bytes.
+    """
+    values = array(typecode)
+    if sys.version_info[0] < 3:
+        values.fromstring(data)
+    else:
+        values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def compressChannelBlock(data, compression):
+    if compression is None:
+        return data
+    if compression == 'zlib':
+        return zlib.compress(data)
+    if compression == 'lz4':
+        if lz4 is None:
+            raise ValueError('lz4 compression requested but the lz4 module is not available')
+        return lz4.frame.compress(data)
+    raise ValueError('Invalid compression for delta channel data: %s' % compression)
+
+
+def decompressChannelBlock(data, compression):
+    if compression is None:
+        return data
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    if compression == 'lz4':
+        if lz4 is None:
+            raise ValueError('Cannot read lz4 compressed channel data, the lz4 module is not available')
+        return lz4.frame.decompress(data)
+    raise ValueError('Invalid compression for delta channel data: %s' % compression)
+
+
+def floatArrayOrNone(val):
+    """
+    Returns None if val is None and a compact array of doubles otherwise.
+    """
+    if val is None:
+        return None
+    else:
+        return array('d', val)
+
+
+def createScenegraphElementFromXMLData(xmlElement, lazy=False, baseDir=None):
     """
     Utility function to create appropriate scenegraph element type when
     reading in XML data. Uses the tag value of the XML data to create and
     instance of the appropriate class.
+
+    With lazy set, the instances of groups are only created when their
+    instanceList is first accessed. baseDir is the directory of the file being
+    read, used to resolve relative reference paths.
     """
     elementType = xmlElement.get('type')
 
     if elementType == 'group':
         newGroup = Group()
-        newGroup.readXMLData(xmlElement)
+        newGroup.readXMLData(xmlElement, lazy=lazy, baseDir=baseDir)
         return newGroup
 
     if elementType == 'reference':
         newReference = Reference()
         newReference.readXMLData(xmlElement)
+        newReference.baseDir = baseDir
         return newReference
 
     raise ValueError('No valid scenegraph element found when reading XML data for ScenegraphElement')
 
 
+# Corner index triplets into a bounds list [minx, maxx, miny, maxy, minz, maxz],
+# in the order used by applyXformToBounds
+BOUNDS_CORNERS = ((0,2,4), (1,2,4), (0,3,4), (1,3,4), (0,2,5), (1,2,5), (0,3,5), (1,3,5))
+
+
+def loadScenegraphFile(filepath):
+    """
+    Returns a lazily read ScenegraphRoot for filepath through the process-wide
+    reference cache. Files are keyed by path, modification time and size, so a
+    file is only parsed again once it has changed on disk. The returned root
+    is shared between all callers and must be treated as read-only.
+    """
+    filepath = os.path.abspath(filepath)
+    if not os.path.isfile(filepath):
+        raise ValueError('File not found: "%s"' % filepath)
+    fileStat = os.stat(filepath)
+    cacheKey = (filepath, fileStat.st_mtime, fileStat.st_size)
+
+    with _referenceCacheLock:
+        root = _referenceCache.pop(cacheKey, None)
+        if root is not None:
+            # re-insert to mark the entry as most recently used
+            _referenceCache[cacheKey] = root
+            return root
+
+    root = ScenegraphRoot()
+    root.readXMLFile(filepath, lazy=True)
+
+    with _referenceCacheLock:
+        _referenceCache[cacheKey] = root
+        while len(_referenceCache) > REFERENCE_CACHE_SIZE:
+            _referenceCache.popitem(last=False)
+    return root
+
+
+def clearReferenceCache():
+    """
+    Empties the process-wide reference cache used by loadScenegraphFile.
+    """
+    with _referenceCacheLock:
+        _referenceCache.clear()
+
+
+def getChannelUsers(rootElement):
+    """
+    Returns a list of (owner, numValues) for every animated value in the
+    hierarchy below rootElement, where owner is the Xform, Bounds, LodData,
+    ArbitraryAttribute, LookFile or AttributeFile holding the channelIndex.
+    """
+    channelUsers = []
+    elements = [rootElement]
+    while elements:
+        curElement = elements.pop()
+        if curElement.xform is not None and curElement.xform.channelIndex is not None:
+            channelUsers.append((curElement.xform, 16))
+        if curElement.bounds is not None and curElement.bounds.channelIndex is not None:
+            channelUsers.append((curElement.bounds, 6))
+        if curElement.lodData is not None and curElement.lodData.channelIndex is not None:
+            channelUsers.append((curElement.lodData, 1))
+        if curElement.arbitraryList is not None:
+            for curAttribute in curElement.arbitraryList:
+                if curAttribute.channelIndex is not None:
+                    channelUsers.append((curAttribute, curAttribute.numValues or 1))
+        for curOwner in (curElement.lookFile, curElement.attributeFile):
+            if curOwner is not None and curOwner.channelIndex is not None:
+                channelUsers.append((curOwner, 1))
+        if isinstance(curElement, Group) and curElement.instanceList is not None:
+            elements.extend(curElement.instanceList)
+    return channelUsers
+
+
+class ChannelFolder(object):
+    """
+    Folds the animated channels used below rootElement while the frames are
+    sampled, with a memory use bound by the number of channels rather than by
+    the frame range.
+
+    Each frame given to addFrame is compared with the first one to track the
+    channels which stay constant, added to a running digest per channel user
+    and spooled to a temporary file. fold then folds the constant xforms,
+    bounds, LOD weights and float arbitrary attributes back into static values,
+    shares the remaining channels with the same values over the whole range
+    between their users and renumbers the channel indices. getFrames reads the
+    compacted values of the spooled frames back.
+    """
+
+    FRAME_NUMBER = struct.Struct('<i')
+
+    def __init__(self, rootElement):
+        # visit users in channel order so that the compacted layout follows the original one
+        self.channelUsers = sorted(getChannelUsers(rootElement), key=lambda x: x[0].channelIndex)
+        self.constant = [True] * len(self.channelUsers)
+        self.digests = [hashlib.sha1() for x in self.channelUsers]
+        self.firstFrame = None
+        self.frameSize = None
+        self.numFrames = 0
+        self.keptChannels = None
+        self.spool = tempfile.TemporaryFile()
+
+    def addFrame(self, frameNumber, values):
+        """
+        Tracks and spools the values, array('d'), of a frame.
+        """
+        if self.firstFrame is None:
+            self.firstFrame = array('d', values)
+            self.frameSize = len(values)
+        elif len(values) != self.frameSize:
+            raise ValueError('frame %d has %d channels, expected %d' % (frameNumber, len(values), self.frameSize))
+
+        firstFrame = self.firstFrame
+        for i, (curOwner, numValues) in enumerate(self.channelUsers):
+            index = curOwner.channelIndex
+            curValues = values[index:index+numValues]
+            if self.constant[i] and curValues != firstFrame[index:index+numValues]:
+                self.constant[i] = False
+            # channels are compared by their bytes, which also keeps 0.0 and -0.0 apart
+            self.digests[i].update(arrayToBytes(curValues))
+
+        self.spool.write(self.FRAME_NUMBER.pack(frameNumber))
+        self.spool.write(arrayToBytes(values))
+        self.numFrames += 1
+
+    def fold(self):
+        """
+        Folds and renumbers the channels of the hierarchy from the frames added
+        so far.
+        """
+        self.keptChannels = []
+        if self.firstFrame is None:
+            return
+        firstFrame = self.firstFrame
+        sharedChannels = {}
+        for i, (curOwner, numValues) in enumerate(self.channelUsers):
+            index = curOwner.channelIndex
+            firstValues = firstFrame[index:index+numValues]
+            isConstant = self.constant[i]
+
+            if isConstant and isinstance(curOwner, (Xform, Bounds)):
+                curOwner.value = firstValues
+                curOwner.channelIndex = None
+            elif isConstant and isinstance(curOwner, LodData):
+                curOwner.weight = firstValues[0]
+                curOwner.channelIndex = None
+            elif isConstant and isinstance(curOwner, ArbitraryAttribute) and curOwner.dataType in ('float', 'floatList'):
+                if curOwner.dataType == 'float':
+                    curOwner.value = firstValues[0]
+                else:
+                    curOwner.value = list(firstValues)
+                curOwner.channelIndex = None
+            else:
+                channelKey = (numValues, self.digests[i].digest())
+                newIndex = sharedChannels.get(channelKey)
+                if newIndex is None:
+                    newIndex = sum(x[1] for x in self.keptChannels)
+                    self.keptChannels.append((index, numValues))
+                    sharedChannels[channelKey] = newIndex
+                curOwner.channelIndex = newIndex
+
+    def getFrames(self):
+        """
+        Yields (frameNumber, compacted values) for the spooled frames, in the
+        order they were added. fold must have been called.
+        """
+        if self.keptChannels is None:
+            raise RuntimeError('ChannelFolder.getFrames called before fold')
+        frameBytes = self.frameSize * 8 if self.frameSize else 0
+        self.spool.seek(0)
+        for _ in range(self.numFrames):
+            frameNumber = self.FRAME_NUMBER.unpack(self.spool.read(self.FRAME_NUMBER.size))[0]
+            curFrame = arrayFromBytes('d', self.spool.read(frameBytes))
+            curCompacted = array('d')
+            for index, numValues in self.keptChannels:
+                curCompacted.extend(curFrame[index:index+numValues])
+            yield frameNumber, curCompacted
+
+    def close(self):
+        self.spool.close()
+
+
+def foldStaticChannels(rootElement, frameValues):
+    """
+    Post-sampling analysis of the animated channels used below rootElement.
+    frameValues holds the sampled channel values for every frame of the range,
+    as array('d') per frame. See ChannelFolder, which does the same while the
+    frames are sampled.
+
+    Returns the compacted per-frame values.
+    """
+    if not frameValues:
+        return frameValues
+
+    folder = ChannelFolder(rootElement)
+    try:
+        for frameNumber, curValues in enumerate(frameValues):
+            folder.addFrame(frameNumber, curValues)
+        folder.fold()
+        return [x[1] for x in folder.getFrames()]
+    finally:
+        folder.close()
+
+
 def applyXformToVector(m, v):
     """
     Utility function to calculate the effect of an Xform (list of 16 values) on a 3D vector (list of 3 values)
@@ -85,7 +431,7 @@ def applyXformToBounds(curXform, curBounds):
     """
     newBounds = None
     # loop through the 8 corners of the bounding box
-    for ix, iy, iz in ( (0,2,4), (1,2,4), (0,3,4), (1,3,4), (0,2,5), (1,2,5), (0,3,5), (1,3,5) ):
+    for ix, iy, iz in BOUNDS_CORNERS:
         # calculate position of corner under the Xform
         curPos = applyXformToVector(curXform, [curBounds[ix], curBounds[iy], curBounds[iz]])
         # if this is the first corner, initialize the bounds
@@ -109,20 +455,280 @@ def applyXformToBounds(curXform, curBounds):
     return newBounds
         
 
-class ArbitraryAttribute:
+class BoundsEngine:
+    """
+    Batched alternative to Group.getBounds. The hierarchy below a Group is
+    flattened once into arrays of parent indices, xform and bounds sources,
+    and the bounds of every auto-calculated group are then computed for one
+    frame (calcBounds) or a whole frame range (calcBoundsForFrames) with numpy,
+    level by level from the leaves up.
+
+    Results are identical to the recursive Group.getBounds: corners are
+    transformed with the same arithmetic as applyXformToVector and min/max
+    reductions are exact. Calculated values are written back to the groups'
+    Bounds in the same way. The engine snapshots the hierarchy, so it needs
+    to be rebuilt if instances are added or removed afterwards. Without
+    numpy it falls back to Group.getBounds.
+    """
+
+    def __init__(self, rootElement):
+        self.rootElement = rootElement
+        if numpy is None:
+            return
+
+        # flatten the hierarchy breadth first, so siblings are contiguous and
+        # all nodes of a level are processed together
+        self.elements = [rootElement]
+        parents = [-1]
+        depths = [0]
+        index = 0
+        while index < len(self.elements):
+            curElement = self.elements[index]
+            if self._isAutoGroup(curElement):
+                for curInstance in curElement.instanceList:
+                    self.elements.append(curInstance)
+                    parents.append(index)
+                    depths.append(depths[index] + 1)
+            index += 1
+
+        numNodes = len(self.elements)
+        self.parents = numpy.array(parents, dtype=numpy.int64)
+        self.depths = numpy.array(depths, dtype=numpy.int64)
+        self.isAutoGroup = numpy.array([self._isAutoGroup(x) for x in self.elements], dtype=bool)
+
+        # per node bounds source for nodes which are not auto-calculated groups
+        self.staticBounds = numpy.zeros((numNodes, 6))
+        self.hasStaticBounds = numpy.zeros(numNodes, dtype=bool)
+        self.boundsChannels = numpy.full(numNodes, -1, dtype=numpy.int64)
+        # per node xform source, applied when propagating bounds to the parent
+        self.staticXforms = numpy.zeros((numNodes, 16))
+        self.hasStaticXform = numpy.zeros(numNodes, dtype=bool)
+        self.xformChannels = numpy.full(numNodes, -1, dtype=numpy.int64)
+
+        for i, curElement in enumerate(self.elements):
+            if not self.isAutoGroup[i] and self._hasBounds(curElement):
+                if curElement.bounds.channelIndex is not None:
+                    self.boundsChannels[i] = curElement.bounds.channelIndex
+                elif curElement.bounds.value is not None:
+                    self.staticBounds[i] = curElement.bounds.value
+                    self.hasStaticBounds[i] = True
+            if curElement.xform is not None:
+                if curElement.xform.channelIndex is not None:
+                    self.xformChannels[i] = curElement.xform.channelIndex
+                elif curElement.xform.value is not None:
+                    self.staticXforms[i] = curElement.xform.value
+                    self.hasStaticXform[i] = True
+
+        # a node has valid bounds if it has a bounds source, or is an
+        # auto-calculated group with at least one child with valid bounds
+        self.isValid = self.hasStaticBounds | (self.boundsChannels >= 0)
+        self.maxDepth = int(self.depths.max())
+        for depth in range(self.maxDepth, 0, -1):
+            validChildren = (self.depths == depth) & self.isValid
+            self.isValid[self.parents[validChildren]] = True
+
+    def _isAutoGroup(self, element):
+        return isinstance(element, Group) and element.instanceList is not None and element.boundsAutoCalc
+
+    def _hasBounds(self, element):
+        # groups with no instanceList never report bounds, see Group.getBounds
+        if isinstance(element, Group) and element.instanceList is None:
+            return False
+        return element.bounds is not None
+
+    def calcBounds(self, channelData=None):
+        """
+        Returns the bounds of the root element for the current values of
+        channelData, updating the Bounds of all auto-calculated groups, like
+        Group.getBounds(channelData).
+        """
+        if numpy is None:
+            return self.rootElement.getBounds(channelData)
+
+        values = None
+        if channelData is not None:
+            values = numpy.asarray(channelData.values, dtype=numpy.float64).reshape(1, -1)
+        nodeBounds = self._propagate(values)
+        self._storeGroupBounds(nodeBounds, channelData, values)
+        if not self.isValid[0]:
+            return None
+        return [float(x) for x in nodeBounds[0, 0]]
+
+    def calcBoundsForFrames(self, frameValues):
+        """
+        Calculates bounds for many frames at once. frameValues is an array of
+        shape (numFrames, numChannels) holding the channel values of every
+        frame; the channels of auto-calculated group bounds are updated in
+        place. Returns an array of shape (numFrames, 6) with the bounds of the
+        root element, or None if it has no valid bounds.
+        """
+        if numpy is None:
+            raise ValueError('numpy is required to calculate bounds for a frame range')
+        if not isinstance(frameValues, numpy.ndarray) or frameValues.dtype != numpy.float64:
+            raise ValueError('frameValues must be a float64 numpy array')
+
+        nodeBounds = self._propagate(frameValues)
+        self._storeGroupBounds(nodeBounds, None, frameValues)
+        if not self.isValid[0]:
+            return None
+        return nodeBounds[:, 0].copy()
+
+    def _gather(self, values, channels, numValues):
+        # returns values[:, channels[i]:channels[i]+numValues] for each channel
+        indices = channels[:, None] + numpy.arange(numValues)
+        return values[:, indices]
+
+    def _propagate(self, values):
+        numFrames = 1 if values is None else values.shape[0]
+        nodeBounds = numpy.zeros((numFrames, len(self.elements), 6))
+
+        nodeBounds[:, self.hasStaticBounds] = self.staticBounds[self.hasStaticBounds]
+        boundsNodes = numpy.nonzero(self.boundsChannels >= 0)[0]
+        if len(boundsNodes):
+            nodeBounds[:, boundsNodes] = self._gather(values, self.boundsChannels[boundsNodes], 6)
+
+        for depth in range(self.maxDepth, 0, -1):
+            # valid nodes of this level, grouped by parent in instance order
+            nodes = numpy.nonzero((self.depths == depth) & self.isValid)[0]
+            if not len(nodes):
+                continue
+            childBounds = nodeBounds[:, nodes]
+
+            staticNodes = self.hasStaticXform[nodes]
+            channelNodes = self.xformChannels[nodes] >= 0
+            if staticNodes.any() or channelNodes.any():
+                xforms = numpy.zeros((numFrames, len(nodes), 16))
+                xforms[:, staticNodes] = self.staticXforms[nodes[staticNodes]]
+                if channelNodes.any():
+                    xforms[:, channelNodes] = self._gather(values, self.xformChannels[nodes[channelNodes]], 16)
+                hasXform = staticNodes | channelNodes
+                childBounds = childBounds.copy()
+                childBounds[:, hasXform] = self._applyXforms(xforms[:, hasXform], childBounds[:, hasXform])
+
+            parents = self.parents[nodes]
+            starts = numpy.concatenate(([0], numpy.nonzero(parents[1:] != parents[:-1])[0] + 1))
+            groupParents = parents[starts]
+            nodeBounds[:, groupParents, 0::2] = numpy.minimum.reduceat(childBounds[:, :, 0::2], starts, axis=1)
+            nodeBounds[:, groupParents, 1::2] = numpy.maximum.reduceat(childBounds[:, :, 1::2], starts, axis=1)
+
+        return nodeBounds
+
+    def _applyXforms(self, m, b):
+        # vectorized applyXformToBounds: m has shape (..., 16), b (..., 6)
+        corners = numpy.array(BOUNDS_CORNERS)
+        cx = b[..., corners[:, 0]]
+        cy = b[..., corners[:, 1]]
+        cz = b[..., corners[:, 2]]
+        m = m[..., None]
+        x = m[..., 0, :]*cx + m[..., 4, :]*cy + m[..., 8, :]*cz + m[..., 12, :]
+        y = m[..., 1, :]*cx + m[..., 5, :]*cy + m[..., 9, :]*cz + m[..., 13, :]
+        z = m[..., 2, :]*cx + m[..., 6, :]*cy + m[..., 10, :]*cz + m[..., 14, :]
+        w = m[..., 3, :]*cx + m[..., 7, :]*cy + m[..., 11, :]*cz + m[..., 15, :]
+        if (w == 0).any():
+            raise ValueError("w==0 after homogeneous matrix multiplication")
+        x = x/w
+        y = y/w
+        z = z/w
+        return numpy.stack((x.min(-1), x.max(-1), y.min(-1), y.max(-1), z.min(-1), z.max(-1)), axis=-1)
+
+    def _storeGroupBounds(self, nodeBounds, channelData, values):
+        # equivalent of the self.bounds.setValue() call in Group.getBounds
+        for i in numpy.nonzero(self.isAutoGroup & self.isValid)[0]:
+            curBounds = self.elements[i].bounds
+            if curBounds is None:
+                continue
+            if curBounds.channelIndex is not None and values is not None:
+                values[:, curBounds.channelIndex:curBounds.channelIndex+6] = nodeBounds[:, i]
+                if channelData is not None:
+                    curBounds.setValue([float(x) for x in nodeBounds[-1, i]], channelData)
+            elif curBounds.channelIndex is None:
+                curBounds.setValue([float(x) for x in nodeBounds[-1, i]], channelData)
+
+
+class XMLStreamWriter:
+    """
+    Writes an XML document depth-first to a file handle as elements are
+    visited, so that only the elements on the current path are held in memory.
+    Start tags and leaf elements are serialized with ElementTree, which keeps
+    the output byte-identical to ElementTree.write with the default encoding.
+    Consecutive leaf elements are serialized in batches of up to batchSize
+    elements to limit the per call overhead of ElementTree.
+    """
+
+    def __init__(self, fileHandle, encoding='us-ascii', batchSize=1000):
+        self.fileHandle = fileHandle
+        self.encoding = encoding
+        self.batchSize = batchSize
+        self.openTags = []
+        self.startTagPending = False
+        self.batch = ET.Element('batch')
+
+    def _flush(self):
+        if len(self.batch):
+            # serialize the batch container and strip its own <batch></batch> tags
+            batchData = ET.tostring(self.batch, encoding=self.encoding)
+            self.fileHandle.write(batchData[len(b'<batch>'):-len(b'</batch>')])
+            self.batch = ET.Element('batch')
+
+    def _closeStartTag(self):
+        # the start tag of an element is only closed once we know it has children,
+        # empty elements are written as <tag />
+        if self.startTagPending:
+            self.fileHandle.write(b'>')
+            self.startTagPending = False
+
+    def startElement(self, xmlElement):
+        """
+        Writes the start tag of xmlElement, followed by any children it
+        already holds. Further children can then be written until endElement.
+        """
+        self._flush()
+        self._closeStartTag()
+        if xmlElement.attrib:
+            emptyElement = ET.tostring(ET.Element(xmlElement.tag, xmlElement.attrib), encoding=self.encoding)
+            self.fileHandle.write(emptyElement[:-len(b' />')])
+        else:
+            self.fileHandle.write(('<%s' % xmlElement.tag).encode(self.encoding))
+        self.startTagPending = True
+        self.openTags.append(xmlElement.tag)
+        for xmlChild in xmlElement:
+            self.writeElement(xmlChild)
+
+    def writeElement(self, xmlElement):
+        """
+        Writes a complete element, including its children.
+        """
+        self._closeStartTag()
+        self.batch.append(xmlElement)
+        if len(self.batch) >= self.batchSize:
+            self._flush()
+
+    def endElement(self):
+        self._flush()
+        tag = self.openTags.pop()
+        if self.startTagPending:
+            self.fileHandle.write(b' />')
+            self.startTagPending = False
+        else:
+            self.fileHandle.write(('</%s>' % tag).encode(self.encoding))
+
+
+class ArbitraryAttribute(object):
     """
     Class to hold animated static arbitrary attribute values. Values are typed, and
     can be single values or lists of the same value type. It also writes and 
     reads the in-memory XML representation of these values using ElementTree. 
     """
 
+    __slots__ = ('name', 'dataType', 'numValues', 'value', 'channelIndex')
+
     def __init__(self, name=None, dataType=None, value=None, numValues=None, channelIndex=None):
         """
             Type of the generic value is defined by the combination of dataType and listLength.
             valid values of dataType: "float", "floatList" or "string"
         """
-        self.name = name
-        self.dataType = dataType
+        self.name = internOrNone(name)
+        self.dataType = internOrNone(dataType)
         self.numValues = numValues
         self.value = value
         self.channelIndex = channelIndex
@@ -170,9 +776,9 @@ class ArbitraryAttribute:
         """
         log.debug('    calling ArbitraryAttribute.readXMLData')
 
-        self.name = xmlArbitraryAttribute.get('name')
+        self.name = internOrNone(xmlArbitraryAttribute.get('name'))
 
-        self.dataType = xmlArbitraryAttribute.get('type')
+        self.dataType = internOrNone(xmlArbitraryAttribute.get('type'))
 
         self.value = xmlArbitraryAttribute.get('value')
         if self.value is not None:
@@ -190,19 +796,29 @@ class ArbitraryAttribute:
         self.channelIndex = intOrNone(xmlArbitraryAttribute.get('channelIndex'))
 
 
-class Bounds:
+class Bounds(object):
     """
     Class to hold Bounding Box  values. It also writes and reads the in-memory 
     XML representation of these values using ElementTree. 
     """
 
+    __slots__ = ('_value', 'channelIndex')
+
     def __init__(self, minx=None, maxx=None, miny=None, maxy=None, minz=None, maxz=None, value=None, channelIndex=None):
         if minx is not None:
             self.value = [minx, maxx, miny, maxy, minz, maxz]
         else:
             self.value = value
         self.channelIndex = channelIndex
-            
+
+    # static values are stored as an array of 6 doubles
+    def _getValue(self):
+        return self._value
+
+    def _setValue(self, value):
+        self._value = floatArrayOrNone(value)
+
+    value = property(_getValue, _setValue)
 
     def setValue(self, value, channelData):
         if self.channelIndex is not None:
@@ -260,16 +876,27 @@ class Bounds:
         self.channelIndex = intOrNone(xmlBounds.get('channelIndex'))
 
 
-class Xform:
+class Xform(object):
     """
     Class to hold Transform values. It also writes and reads the in-memory 
     XML representation of these values using ElementTree. 
     """
 
+    __slots__ = ('_value', 'channelIndex')
+
     def __init__(self, value=None, channelIndex=None):
         self.value = value
         self.channelIndex = channelIndex
 
+    # static values are stored as an array of 16 doubles
+    def _getValue(self):
+        return self._value
+
+    def _setValue(self, value):
+        self._value = floatArrayOrNone(value)
+
+    value = property(_getValue, _setValue)
+
     def getValue(self, channelData):
         if self.channelIndex is not None:
             return channelData.getValues(self.channelIndex, 16)
@@ -304,15 +931,17 @@ class Xform:
         self.channelIndex = intOrNone(xmlXform.get('channelIndex'))
 
 
-class Proxy:
+class Proxy(object):
     """
     Class to hold a geometry Proxy. It also writes and reads the in-memory 
     XML representation of these values using ElementTree. 
     """
 
+    __slots__ = ('name', 'ref')
+
     def __init__(self, name=None, ref=None):
-        self.name = name
-        self.ref = ref
+        self.name = internOrNone(name)
+        self.ref = internOrNone(ref)
 
     def writeXMLData(self, xmlProxy):
         """
@@ -334,23 +963,25 @@ class Proxy:
         ElementTree.
         """
         log.debug('    calling Proxy.readXMLData')
-        self.name = xmlProxy.get('name')
+        self.name = internOrNone(xmlProxy.get('name'))
         if self.name is None:
             raise ValueError('Cannot find XML attribute "name" when reading XML data for Proxy')
 
-        self.ref = xmlProxy.get('ref')
+        self.ref = internOrNone(xmlProxy.get('ref'))
         if self.ref is None:
             raise ValueError('Cannot find XML attribute "ref" when reading XML data for Proxy')
 
 
-class LodData:
+class LodData(object):
     """
     Class to hold a geometry LOD data. It also writes and reads the in-memory 
     XML representation of these values using ElementTree. 
     """
 
+    __slots__ = ('tag', 'weight', 'channelIndex')
+
     def __init__(self, tag=None, weight=None, channelIndex=None):
-        self.tag = tag
+        self.tag = internOrNone(tag)
         self.weight = weight
         self.channelIndex = channelIndex
 
@@ -379,15 +1010,17 @@ class LodData:
         using ElementTree.
         """
         log.debug('    calling LodData.readXMLData')
-        self.tag = xmlLodData.get('tag')
+        self.tag = internOrNone(xmlLodData.get('tag'))
         self.weight = floatOrNone(xmlLodData.get('weight'))
         self.channelIndex = intOrNone(xmlLodData.get('channelIndex'))
 
 
-class LookFile:
+class LookFile(object):
+
+    __slots__ = ('ref', 'channelIndex')
 
     def __init__(self, ref=None, channelIndex=None):
-        self.ref = ref        
+        self.ref = internOrNone(ref)
         self.channelIndex = channelIndex
 
     def writeXMLData(self, xmlLookFile):
@@ -399,16 +1032,18 @@ class LookFile:
 
     def readXMLData(self, xmlLookFile):
         log.debug('    calling LookFile.readXMLData')
-        self.ref = xmlLookFile.get('ref')
+        self.ref = internOrNone(xmlLookFile.get('ref'))
         self.channelIndex = intOrNone(xmlLookFile.get('channelIndex'))
 
 
-class AttributeFile:
+class AttributeFile(object):
+
+    __slots__ = ('ref', 'groupName', 'customParser', 'channelIndex')
 
     def __init__(self, ref=None, groupName=None, customParser=None, channelIndex=None):
-        self.ref = ref
-        self.groupName = groupName
-        self.customParser = customParser
+        self.ref = internOrNone(ref)
+        self.groupName = internOrNone(groupName)
+        self.customParser = internOrNone(customParser)
         self.channelIndex = channelIndex
 
     def writeXMLData(self, xmlAttributeFile):
@@ -424,9 +1059,9 @@ class AttributeFile:
 
     def readXMLData(self, xmlAttributeFile):
         log.debug('    calling AttributeFile.readXMLData')
-        self.ref = xmlAttributeFile.get('ref')
-        self.groupName = xmlAttributeFile.get('groupName')
-        self.customParser = xmlAttributeFile.get('customParser')
+        self.ref = internOrNone(xmlAttributeFile.get('ref'))
+        self.groupName = internOrNone(xmlAttributeFile.get('groupName'))
+        self.customParser = internOrNone(xmlAttributeFile.get('customParser'))
         self.channelIndex = intOrNone(xmlAttributeFile.get('channelIndex'))
 
 
@@ -434,14 +1069,34 @@ class ChannelData:
     """
     Class to hold a animation Channel data. It also writes and reads the 
     in-memory XML representation of these values using ElementTree. 
+
+    Per-frame values are stored either as one XML file per frame (the default
+    'xml' channelFormat), packed into a single binary file ('binary'
+    channelFormat) holding every frame of the range as float32 ('f') or
+    float64 ('d') values, or as keyframe/delta blocks ('delta' channelFormat)
+    with a full keyframe every keyframeInterval frames, optionally zlib or
+    lz4 compressed. Reading a frame of delta data only reads its own block.
     """
     
-    def __init__(self, startFrame=None, endFrame=None, ref=None):
+    def __init__(self, startFrame=None, endFrame=None, ref=None, channelFormat=CHANNEL_FORMAT_XML, dataType='d',
+                 keyframeInterval=24, compression='zlib'):
         self.startFrame = startFrame
         self.endFrame = endFrame
         self.ref = ref
         self.values = []
         self.relativeMode = True
+        self.channelFormat = channelFormat
+        self.dataType = dataType
+        self._binaryFileCreated = False
+        self._binaryNumChannels = None
+        self._binaryMap = None
+        self._binaryFrames = None
+        self.keyframeInterval = keyframeInterval
+        self.compression = compression
+        self._deltaFileCreated = False
+        self._deltaPendingFrames = {}
+        self._deltaHeader = None
+        self._deltaBlockCache = None
 
     def isStatic(self):
         return self.startFrame == self.endFrame
@@ -452,6 +1107,10 @@ class ChannelData:
         is smaller than the one specified, 0.0 will be added to all missing
         indexes between the currently last index and the one to be added. 
         """
+        # values read from a binary channel file are read-only views, so take
+        # a copy before modifying them
+        if not isinstance(self.values, list):
+            self.values = [float(x) for x in self.values]
         # pad value range if need be
         if index >= len(self.values):
             self.values = self.values + [0.0]*(index - len(self.values) + 1)
@@ -487,6 +1146,11 @@ class ChannelData:
             else:
                 xmlChannelData.attrib['ref'] = self.ref
 
+        # the XML format is implied when no format attribute is present
+        if self.channelFormat != CHANNEL_FORMAT_XML:
+            xmlChannelData.attrib['format'] = self.channelFormat
+            xmlChannelData.attrib['dataType'] = self.dataType
+
     def readXMLData(self, xmlChannelData):
         """
         Read the Channel Data values from the in-memory XML representation  
@@ -496,21 +1160,51 @@ class ChannelData:
         self.startFrame = int(xmlChannelData.get('startFrame'))
         self.endFrame = int(xmlChannelData.get('endFrame'))
         self.ref = xmlChannelData.get('ref')
+        self.channelFormat = xmlChannelData.get('format', CHANNEL_FORMAT_XML)
+        self.dataType = xmlChannelData.get('dataType', 'd')
 
-    def writeXMLChannelFile(self, frameNumber, verbose=True):
+    def getChannelFilePath(self, frameNumber=None):
+        """
+        Returns the path of the channel file holding frameNumber. Binary
+        channel data uses a single file for the whole frame range.
+        """
+        if self.channelFormat == CHANNEL_FORMAT_BINARY:
+            return self.ref + '.chan.bin'
+        if self.channelFormat == CHANNEL_FORMAT_DELTA:
+            return self.ref + '.chan.dlt'
+        return self.ref + ".chan.%04d.xml" % frameNumber
+
+    def writeXMLChannelFile(self, frameNumber, verbose=True, values=None):
         """
         Writes the in-memory XML representation using ElemenTree into a channel
         xml file. frameNumber will be used in the filename before the .xml 
-        extention using 4 zero padding.
+        extention using 4 zero padding. values defaults to the current values,
+        a snapshot of them can be given when writing from another thread.
         """
-        filepath = self.ref + ".chan.%04d.xml" % frameNumber
+        if values is None:
+            values = self.values
+        if self.channelFormat == CHANNEL_FORMAT_BINARY:
+            self.writeBinaryChannelFrame(frameNumber, verbose, values)
+            return
+        if self.channelFormat == CHANNEL_FORMAT_DELTA:
+            self.writeDeltaChannelFrame(frameNumber, verbose, values)
+            return
+        if self.channelFormat != CHANNEL_FORMAT_XML:
+            raise ValueError('Invalid channelFormat for ChannelData: %s' % self.channelFormat)
+
+        filepath = self.getChannelFilePath(frameNumber)
         log.debug('\nwriting XML channel data to file %s' % filepath)
         dir = os.path.dirname(filepath)
         if not os.path.isdir(dir):
-            os.makedirs(dir)
+            try:
+                os.makedirs(dir)
+            except OSError:
+                # another writer thread may have created it in the meantime
+                if not os.path.isdir(dir):
+                    raise
         xmlRoot = ET.Element('channels')
 
-        for curValue in self.values:
+        for curValue in values:
             xmlCurValue = ET.SubElement(xmlRoot, 'c')
             xmlCurValue.attrib['v'] = str(float(curValue))
 
@@ -527,7 +1221,16 @@ class ChannelData:
         construction of the filename before the .xml extention using 4 zero 
         padding.
         """
-        filepath = self.ref + ".chan.%04d.xml" % frameNumber
+        if self.channelFormat == CHANNEL_FORMAT_BINARY:
+            self.values = self.readBinaryChannelFrame(frameNumber)
+            return
+        if self.channelFormat == CHANNEL_FORMAT_DELTA:
+            self.values = self.readDeltaChannelFrame(frameNumber)
+            return
+        if self.channelFormat != CHANNEL_FORMAT_XML:
+            raise ValueError('Invalid channelFormat for ChannelData: %s' % self.channelFormat)
+
+        filepath = self.getChannelFilePath(frameNumber)
         log.debug('\nreading XML channel data file %s' % filepath)
         if not os.path.isfile(filepath):
             raise ValueError('File not found: "%s"' % filepath)
@@ -538,15 +1241,338 @@ class ChannelData:
             value = float(xmlCurValue.get('v'))
             self.setValue(index, value)
 
+    def writeBinaryChannelFrame(self, frameNumber, verbose=True, values=None):
+        """
+        Writes values (the current values by default) as frameNumber into the
+        binary channel file. The file is created, with its header and room for
+        the full frame range, on the first frame written by this ChannelData.
+        Frames can be written concurrently from several threads.
+        """
+        if values is None:
+            values = self.values
+        if self.startFrame is None or self.endFrame is None:
+            raise ValueError('Frame range not set when writing binary ChannelData')
+        if not self.startFrame <= frameNumber <= self.endFrame:
+            raise ValueError('Frame %s outside of channel data frame range' % frameNumber)
+
+        filepath = self.getChannelFilePath()
+        numChannels = len(values)
+        itemSize = array(self.dataType).itemsize
+
+        with _binaryChannelFileLock:
+            if not self._binaryFileCreated:
+                self.closeChannelFile()
+                log.debug('\ncreating binary channel data file %s' % filepath)
+                dir = os.path.dirname(filepath)
+                if dir and not os.path.isdir(dir):
+                    os.makedirs(dir)
+                header = CHANNEL_BINARY_HEADER.pack(CHANNEL_BINARY_MAGIC, CHANNEL_BINARY_VERSION,
+                                                    self.dataType.encode('ascii'), self.startFrame,
+                                                    self.endFrame, numChannels)
+                numFrames = self.endFrame - self.startFrame + 1
+                with open(filepath, 'wb') as binaryFile:
+                    binaryFile.write(header.ljust(CHANNEL_BINARY_HEADER_SIZE, b'\0'))
+                    binaryFile.truncate(CHANNEL_BINARY_HEADER_SIZE + numFrames * numChannels * itemSize)
+                self._binaryFileCreated = True
+                self._binaryNumChannels = numChannels
+
+        if numChannels != self._binaryNumChannels:
+            raise ValueError('Number of channels changed from %d to %d while writing binary ChannelData'
+                             % (self._binaryNumChannels, numChannels))
+
+        frameValues = array(self.dataType, [float(x) for x in values])
+
+        if verbose:
+            print('Writing frame %d to file "%s"...' % (frameNumber, filepath))
+
+        with open(filepath, 'r+b') as binaryFile:
+            binaryFile.seek(CHANNEL_BINARY_HEADER_SIZE +
+                            (frameNumber - self.startFrame) * numChannels * itemSize)
+            binaryFile.write(arrayToBytes(frameValues))
+
+    def openBinaryChannelFile(self):
+        """
+        Memory-maps the binary channel file and validates its header. Frames
+        are exposed as a 2D numpy.memmap when numpy is available, otherwise
+        they are unpacked from the mmap of the file. Returns the header values
+        as (dataType, startFrame, endFrame, numChannels).
+        """
+        filepath = self.getChannelFilePath()
+        log.debug('\nmapping binary channel data file %s' % filepath)
+        if not os.path.isfile(filepath):
+            raise ValueError('File not found: "%s"' % filepath)
+
+        with open(filepath, 'rb') as binaryFile:
+            header = binaryFile.read(CHANNEL_BINARY_HEADER.size)
+            if len(header) != CHANNEL_BINARY_HEADER.size:
+                raise ValueError('Truncated binary channel file: "%s"' % filepath)
+            magic, version, dataType, startFrame, endFrame, numChannels = CHANNEL_BINARY_HEADER.unpack(header)
+            if magic != CHANNEL_BINARY_MAGIC or version != CHANNEL_BINARY_VERSION:
+                raise ValueError('Not a binary channel file: "%s"' % filepath)
+            dataType = dataType.decode('ascii')
+            numFrames = endFrame - startFrame + 1
+
+            if numpy is not None:
+                self._binaryFrames = numpy.memmap(filepath, dtype='<f%d' % array(dataType).itemsize,
+                                                  mode='r', offset=CHANNEL_BINARY_HEADER_SIZE,
+                                                  shape=(numFrames, numChannels))
+            else:
+                # memoryview.cast and the buffer interface of mmap are python 3 only
+                self._binaryMap = mmap.mmap(binaryFile.fileno(), 0, access=mmap.ACCESS_READ)
+                self._binaryFrames = self._binaryMap
+
+        self.dataType = dataType
+        self.startFrame = startFrame
+        self.endFrame = endFrame
+        self._binaryNumChannels = numChannels
+        return dataType, startFrame, endFrame, numChannels
+
+    def readBinaryChannelFrame(self, frameNumber):
+        """
+        Returns the values of frameNumber from the binary channel file, as a
+        read-only, zero-copy slice of the memory-mapped data with numpy and as
+        a tuple unpacked from the mapped file otherwise.
+        """
+        if self._binaryFrames is None:
+            self.openBinaryChannelFile()
+        if not self.startFrame <= frameNumber <= self.endFrame:
+            raise ValueError('Frame %s outside of channel data frame range' % frameNumber)
+
+        frameIndex = frameNumber - self.startFrame
+        if numpy is not None:
+            return self._binaryFrames[frameIndex]
+        numChannels = self._binaryNumChannels
+        frameSize = numChannels * struct.calcsize('<' + self.dataType)
+        return struct.unpack_from('<%d%s' % (numChannels, self.dataType), self._binaryMap,
+                                  CHANNEL_BINARY_HEADER_SIZE + frameIndex * frameSize)
+
+    def getDeltaBlockRange(self, blockNumber):
+        """
+        Returns the first and last frame stored in delta block blockNumber.
+        """
+        blockStart = self.startFrame + blockNumber * self.keyframeInterval
+        return blockStart, min(blockStart + self.keyframeInterval - 1, self.endFrame)
+
+    def writeDeltaChannelFrame(self, frameNumber, verbose=True, values=None):
+        """
+        Adds values (the current values by default) as frameNumber to the
+        delta channel file. Frames are buffered until all frames of their
+        block have been given, in any order, and the block is then encoded
+        and appended to the file.
+        """
+        if values is None:
+            values = self.values
+        if self.startFrame is None or self.endFrame is None:
+            raise ValueError('Frame range not set when writing delta ChannelData')
+        if not self.startFrame <= frameNumber <= self.endFrame:
+            raise ValueError('Frame %s outside of channel data frame range' % frameNumber)
+        if self.compression not in CHANNEL_DELTA_COMPRESSION:
+            raise ValueError('Invalid compression for delta channel data: %s' % self.compression)
+
+        filepath = self.getChannelFilePath()
+        numBlocks = (self.endFrame - self.startFrame) // self.keyframeInterval + 1
+
+        with _deltaChannelFileLock:
+            if not self._deltaFileCreated:
+                log.debug('\ncreating delta channel data file %s' % filepath)
+                dir = os.path.dirname(filepath)
+                if dir and not os.path.isdir(dir):
+                    os.makedirs(dir)
+                header = CHANNEL_DELTA_HEADER.pack(CHANNEL_DELTA_MAGIC, CHANNEL_DELTA_VERSION,
+                                                   CHANNEL_DELTA_COMPRESSION[self.compression],
+                                                   self.startFrame, self.endFrame, len(values),
+                                                   self.keyframeInterval, numBlocks)
+                with open(filepath, 'wb') as deltaFile:
+                    deltaFile.write(header)
+                    deltaFile.write(b'\0' * (CHANNEL_DELTA_INDEX_ENTRY.size * numBlocks))
+                self._deltaFileCreated = True
+                self._deltaPendingFrames = {}
+                self._binaryNumChannels = len(values)
+
+            if len(values) != self._binaryNumChannels:
+                raise ValueError('Number of channels changed from %d to %d while writing delta ChannelData'
+                                 % (self._binaryNumChannels, len(values)))
+            self._deltaPendingFrames[frameNumber] = array('d', [float(x) for x in values])
+
+            blockNumber = (frameNumber - self.startFrame) // self.keyframeInterval
+            blockStart, blockEnd = self.getDeltaBlockRange(blockNumber)
+            blockFrames = range(blockStart, blockEnd + 1)
+            if not all(x in self._deltaPendingFrames for x in blockFrames):
+                return
+
+            if verbose:
+                print('Writing frames %d-%d to file "%s"...' % (blockStart, blockEnd, filepath))
+
+            blockData = [arrayToBytes(self._deltaPendingFrames[blockStart])]
+            # changes are detected on the bit patterns of the values, which keeps
+            # the encoding lossless for -0.0 and NaN
+            bitsFormat = '<%dQ' % self._binaryNumChannels
+            previousBits = struct.unpack(bitsFormat, blockData[0])
+            del self._deltaPendingFrames[blockStart]
+            for curFrame in blockFrames[1:]:
+                curValues = self._deltaPendingFrames.pop(curFrame)
+                curBits = struct.unpack(bitsFormat, arrayToBytes(curValues))
+                changed = array('I', [i for i, x in enumerate(curBits) if x != previousBits[i]])
+                blockData.append(struct.pack('<I', len(changed)))
+                blockData.append(arrayToBytes(changed))
+                blockData.append(arrayToBytes(array('d', [curValues[i] for i in changed])))
+                previousBits = curBits
+            blockData = compressChannelBlock(b''.join(blockData), self.compression)
+
+            with open(filepath, 'r+b') as deltaFile:
+                deltaFile.seek(0, os.SEEK_END)
+                blockOffset = deltaFile.tell()
+                deltaFile.write(blockData)
+                deltaFile.seek(CHANNEL_DELTA_HEADER.size + blockNumber * CHANNEL_DELTA_INDEX_ENTRY.size)
+                deltaFile.write(CHANNEL_DELTA_INDEX_ENTRY.pack(blockOffset, len(blockData)))
+
+    def readDeltaChannelFrame(self, frameNumber):
+        """
+        Returns the values of frameNumber from the delta channel file. Only the
+        header, the index entry and the block holding the frame are read. The
+        last decoded block is kept, so that reading consecutive frames decodes
+        each block once.
+        """
+        filepath = self.getChannelFilePath()
+        if not os.path.isfile(filepath):
+            raise ValueError('File not found: "%s"' % filepath)
+
+        with open(filepath, 'rb') as deltaFile:
+            if self._deltaHeader is None:
+                header = deltaFile.read(CHANNEL_DELTA_HEADER.size)
+                if len(header) != CHANNEL_DELTA_HEADER.size:
+                    raise ValueError('Truncated delta channel file: "%s"' % filepath)
+                magic, version, compression, startFrame, endFrame, numChannels, keyframeInterval, numBlocks = \
+                    CHANNEL_DELTA_HEADER.unpack(header)
+                if magic != CHANNEL_DELTA_MAGIC or version != CHANNEL_DELTA_VERSION:
+                    raise ValueError('Not a delta channel file: "%s"' % filepath)
+                compressionNames = dict((v, k) for k, v in CHANNEL_DELTA_COMPRESSION.items())
+                self._deltaHeader = (compressionNames[compression], numChannels)
+                self.startFrame = startFrame
+                self.endFrame = endFrame
+                self.keyframeInterval = keyframeInterval
+                self.compression = compressionNames[compression]
+            compression, numChannels = self._deltaHeader
+
+            if not self.startFrame <= frameNumber <= self.endFrame:
+                raise ValueError('Frame %s outside of channel data frame range' % frameNumber)
+            blockNumber = (frameNumber - self.startFrame) // self.keyframeInterval
+            blockStart, blockEnd = self.getDeltaBlockRange(blockNumber)
+
+            if self._deltaBlockCache is None or self._deltaBlockCache[0] != blockNumber:
+                deltaFile.seek(CHANNEL_DELTA_HEADER.size + blockNumber * CHANNEL_DELTA_INDEX_ENTRY.size)
+                blockOffset, blockSize = CHANNEL_DELTA_INDEX_ENTRY.unpack(deltaFile.read(CHANNEL_DELTA_INDEX_ENTRY.size))
+                if blockOffset == 0:
+                    raise ValueError('Frames %d-%d missing from delta channel file "%s"' % (blockStart, blockEnd, filepath))
+                deltaFile.seek(blockOffset)
+                blockData = decompressChannelBlock(deltaFile.read(blockSize), compression)
+
+                # decode all frames of the block
+                keySize = numChannels * 8
+                curValues = arrayFromBytes('d', blockData[:keySize])
+                blockFrames = [curValues]
+                offset = keySize
+                for curFrame in range(blockStart + 1, blockEnd + 1):
+                    numChanged = struct.unpack('<I', blockData[offset:offset+4])[0]
+                    offset += 4
+                    changed = arrayFromBytes('I', blockData[offset:offset+numChanged*4])
+                    offset += numChanged * 4
+                    changedValues = arrayFromBytes('d', blockData[offset:offset+numChanged*8])
+                    offset += numChanged * 8
+                    curValues = array('d', curValues)
+                    for index, value in zip(changed, changedValues):
+                        curValues[index] = value
+                    blockFrames.append(curValues)
+                self._deltaBlockCache = (blockNumber, blockFrames)
+
+        return self._deltaBlockCache[1][frameNumber - blockStart].tolist()
+
+    def closeChannelFile(self):
+        """
+        Releases the memory map held on the binary channel file, if any.
+        Values of the current frame are copied so that they stay valid.
+        """
+        if self._binaryFrames is not None and not isinstance(self.values, list):
+            self.values = [float(x) for x in self.values]
+        self._binaryFrames = None
+        if self._binaryMap is not None:
+            self._binaryMap.close()
+            self._binaryMap = None
+
 
-class ScenegraphElement:
+class ChannelFileWriter(object):
     """
-    Base class used by Group, ScenegraphRoot and Reference classes
+    Writes channel files on a pool of background threads, so that sampling
+    the next frame can overlap the file I/O of the previous ones. Each frame
+    is queued as an immutable snapshot of the channel values. The queue holds
+    at most maxPending frames: write() blocks when it is full, which bounds
+    memory use. Errors raised by the workers are collected and re-raised by
+    close().
     """
 
+    def __init__(self, numWorkers=4, maxPending=16, verbose=True):
+        self.verbose = verbose
+        self.errors = []
+        self.queue = queue.Queue(maxsize=maxPending)
+        self.workers = []
+        for i in range(numWorkers):
+            worker = threading.Thread(target=self._processQueue, name='ChannelFileWriter%d' % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _processQueue(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                channelData, frameNumber, values = item
+                channelData.writeXMLChannelFile(frameNumber, self.verbose, values)
+            except Exception as e:
+                log.debug('failed to write channel data for frame %s: %s' % (frameNumber, e))
+                self.errors.append((frameNumber, e))
+            finally:
+                self.queue.task_done()
+
+    def write(self, channelData, frameNumber):
+        """
+        Queues the current values of channelData to be written as frameNumber.
+        """
+        # stop feeding frames as soon as one of them failed
+        self.raiseErrors()
+        self.queue.put((channelData, frameNumber, tuple(channelData.values)))
+
+    def raiseErrors(self):
+        if self.errors:
+            frameNumber, error = self.errors[0]
+            raise ValueError('Failed to write channel data for frame %s: %s' % (frameNumber, error))
+
+    def close(self):
+        """
+        Waits for all queued frames to be written and stops the workers.
+        """
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.raiseErrors()
+
+
+class ScenegraphElement(object):
+    """
+    Base class used by Group, ScenegraphRoot and Reference classes. Node
+    classes use __slots__ and interned strings to keep large hierarchies
+    compact in memory.
+    """
+
+    __slots__ = ('name', 'elemType', 'xform', 'bounds', 'proxyList', 'arbitraryList',
+                 'lodData', 'lookFile', 'attributeFile')
+
     def __init__(self, name=None, elemType=None, xform=None, bounds=None, proxyList=None, arbitraryList=None, lodData=None, lookFile=None, attributeFile=None):
-        self.name = name
-        self.elemType = elemType
+        self.name = internOrNone(name)
+        self.elemType = internOrNone(elemType)
         self.xform = xform
         self.bounds = bounds
         self.proxyList = proxyList
@@ -663,7 +1689,7 @@ class ScenegraphElement:
         """
         Reads a full scene's in-memory XML representation using ElementTree 
         """
-        self.name = xmlElement.get('name')
+        self.name = internOrNone(xmlElement.get('name'))
         log.debug('  calling ScenegraphElement.readXMLCommonData for %s' % self.name)
 
         xmlBounds = xmlElement.find('bounds')
@@ -678,7 +1704,7 @@ class ScenegraphElement:
             self.xform = Xform()
             self.xform.readXMLData(xmlXform)
         else:
-            self.xfrom = None
+            self.xform = None
 
         xmlLodData = xmlElement.find('lodData')
         if xmlLodData is not None:
@@ -728,13 +1754,35 @@ class Group(ScenegraphElement):
     node type. 
     """
 
+    __slots__ = ('_instanceList', '_xmlInstanceList', '_xmlBaseDir', 'groupType', 'boundsAutoCalc')
+
     def __init__(self, name=None, instanceList=None, groupType=None, xform=None, bounds=None, proxyList=None, arbitraryList=None, lodData=None):
         ScenegraphElement.__init__(self, name=name, xform=xform, bounds=bounds, proxyList=proxyList, arbitraryList=arbitraryList, lodData=lodData)
+        self._xmlInstanceList = None
+        self._xmlBaseDir = None
         self.instanceList = instanceList
         self.elemType = 'group'
-        self.groupType = groupType
+        self.groupType = internOrNone(groupType)
         self.boundsAutoCalc = True
 
+    def _getInstanceList(self):
+        # instances of lazily read groups are created on first access. Cached
+        # roots are shared between threads, so the list is built under a lock
+        # and assigned before the xml data is released
+        if self._xmlInstanceList is not None:
+            with _lazyGroupLock:
+                if self._xmlInstanceList is not None:
+                    self._instanceList = [createScenegraphElementFromXMLData(x, lazy=True, baseDir=self._xmlBaseDir)
+                                          for x in self._xmlInstanceList]
+                    self._xmlInstanceList = None
+        return self._instanceList
+
+    def _setInstanceList(self, instanceList):
+        self._xmlInstanceList = None
+        self._instanceList = instanceList
+
+    instanceList = property(_getInstanceList, _setInstanceList)
+
     def setInstanceList(self, instanceList):
         self.instanceList = instanceList
 
@@ -794,7 +1842,7 @@ class Group(ScenegraphElement):
             else:
                 return self.bounds.getValue(channelData)
         
-    def writeXMLData(self, sgElement, xmlElement, channelMapping=None, channelData=None):
+    def writeXMLData(self, sgElement, xmlElement, channelMapping=None, channelData=None, xmlWriter=None):
         if channelMapping is not None:
             if sgElement in channelMapping.keys():
                 channelNo = channelMapping[sgElement]
@@ -809,24 +1857,41 @@ class Group(ScenegraphElement):
         if self.groupType is not None:
             xmlElement.attrib['groupType'] = self.groupType
 
+        # when streaming, the instances are written straight to the xmlWriter
+        # instead of being added to the in-memory XML tree
+        if xmlWriter is not None:
+            xmlWriter.startElement(xmlElement)
+            xmlWriter.startElement(ET.Element('instanceList'))
+            if self.instanceList is not None:
+                for curInstance in self.instanceList:
+                    xmlCurInstance = ET.Element('instance')
+                    curInstance.writeXMLData(curInstance, xmlCurInstance, channelMapping, channelData, xmlWriter)
+            xmlWriter.endElement()
+            xmlWriter.endElement()
+            return
+
         xmlInstanceList = ET.SubElement(xmlElement, 'instanceList')
         if self.instanceList is not None:
             for curInstance in self.instanceList:
                 xmlCurInstance = ET.SubElement(xmlInstanceList, 'instance')
                 curInstance.writeXMLData(curInstance, xmlCurInstance, channelMapping, channelData)
 
-    def readXMLData(self, xmlElement):
+    def readXMLData(self, xmlElement, lazy=False, baseDir=None):
         log.debug('calling Group.readXMLData')
         self.readXMLCommonData(xmlElement)
 
-        self.groupType = xmlElement.get('groupType')
+        self.groupType = internOrNone(xmlElement.get('groupType'))
 
         xmlInstanceList = xmlElement.find('instanceList')
         if xmlInstanceList is None:
             raise ValueError('Cannot find XML element "instanceList" when reading XML data for Group')
         self.instanceList = []
+        if lazy:
+            self._xmlInstanceList = xmlInstanceList
+            self._xmlBaseDir = baseDir
+            return
         for xmlCurInstance in xmlInstanceList:
-            curInstance = createScenegraphElementFromXMLData(xmlCurInstance)
+            curInstance = createScenegraphElementFromXMLData(xmlCurInstance, baseDir=baseDir)
             self.instanceList.append(curInstance)
 
 
@@ -836,13 +1901,17 @@ class Reference(ScenegraphElement):
     some sub-SceneGraph.  
     """
 
+    __slots__ = ('refFile', 'refType', 'groupType', 'baseDir')
+
     def __init__(self, name=None, refFile=None, refType='xml', xform=None, bounds=None, proxyList=None, 
                  arbitraryList=None, lodData=None, lookFile=None, attributeFile=None, groupType=None):
         ScenegraphElement.__init__(self, name=name, xform=xform, bounds=bounds, proxyList=proxyList, arbitraryList=arbitraryList, lodData=lodData, lookFile=lookFile, attributeFile=attributeFile)
         self.elemType = 'reference'
-        self.refFile = refFile
-        self.refType = refType
-        self.groupType = groupType
+        self.refFile = internOrNone(refFile)
+        self.refType = internOrNone(refType)
+        self.groupType = internOrNone(groupType)
+        # directory of the file this reference was read from, if any
+        self.baseDir = None
 
     def setReference(self, refFile, refType='xml'):
         self.refFile = refFile
@@ -854,7 +1923,7 @@ class Reference(ScenegraphElement):
     def setRefType(self, refType):
         self.refType = refType
         
-    def writeXMLData(self, sgElement, xmlElement, channelMapping=None, channelData=None):      
+    def writeXMLData(self, sgElement, xmlElement, channelMapping=None, channelData=None, xmlWriter=None):
         if channelMapping is not None:
             if sgElement in channelMapping.keys():
                 channelNo = channelMapping[sgElement]
@@ -877,21 +1946,46 @@ class Reference(ScenegraphElement):
         if self.groupType is not None:
             xmlElement.attrib['groupType'] = self.groupType
 
+        if xmlWriter is not None:
+            xmlWriter.writeElement(xmlElement)
+
     def readXMLData(self, xmlElement):
         log.debug('calling Reference.readXMLData')
         self.readXMLCommonData(xmlElement)
 
-        self.refType = xmlElement.get('refType')
+        self.refType = internOrNone(xmlElement.get('refType'))
 
-        self.refFile = xmlElement.get('refFile')
+        self.refFile = internOrNone(xmlElement.get('refFile'))
         if self.refFile is None:
             raise ValueError('Cannot find XML attribute "refFile" when reading XMl data for Reference')
 
+    def getRefFilePath(self):
+        """
+        Returns the path of the referenced file, resolving relative paths
+        against the directory of the file the reference was read from.
+        """
+        if self.baseDir is not None and not os.path.isabs(self.refFile):
+            return os.path.join(self.baseDir, self.refFile)
+        return self.refFile
+
+    def getReferencedScenegraph(self):
+        """
+        Returns the ScenegraphRoot of the referenced XML file. The file is
+        read lazily and shared through the process-wide reference cache, so
+        each referenced file is parsed once however many times it is
+        referenced.
+        """
+        if self.refType is not None and self.refType != 'xml':
+            raise ValueError('Cannot resolve Reference %s of refType "%s"' % (self.name, self.refType))
+        return loadScenegraphFile(self.getRefFilePath())
+
 
 class ScenegraphRoot(Group):
     """
     Represents a root node of a full Scene.
     """
+
+    __slots__ = ('channelData', 'channelMapping')
     
     def __init__(self, name=None, instanceList=None, channelData=None):
         Group.__init__(self, name=name, instanceList=instanceList)
@@ -904,7 +1998,14 @@ class ScenegraphRoot(Group):
     def calcBounds(self):
         return self.getBounds(self.channelData)
 
-    def writeXMLFile(self, filepath, verbose=True):
+    def writeXMLFile(self, filepath, verbose=True, streaming=False):
+        """
+        Writes the scenegraph to filepath. By default the complete XML tree is
+        built in memory before writing. With streaming set, elements are
+        written to a buffered file as the hierarchy is visited, keeping memory
+        use proportional to the depth of the hierarchy. Both modes produce the
+        same bytes.
+        """
         log.debug('\nwriting XML to file %s' % filepath)
         dir = os.path.dirname(filepath)
         if not os.path.isdir(dir):
@@ -917,13 +2018,28 @@ class ScenegraphRoot(Group):
 
         if self.instanceList is None:
             raise ValueError('instanceList not set when writing out XMl for ScenegraphRoot')
-        xmlInstanceList = ET.SubElement(xmlRoot, 'instanceList')
-        
+
         # Avoid if statements within a for loop
         channelMappingPackage = None
         if self.channelData is not None and self.channelData.isStatic():
             channelMappingPackage = self.channelMapping
-        
+
+        if streaming:
+            if verbose:
+                print('Writing file "%s"...' % filepath)
+            with open(filepath, 'wb') as xmlFile:
+                xmlWriter = XMLStreamWriter(xmlFile)
+                xmlWriter.startElement(xmlRoot)
+                xmlWriter.startElement(ET.Element('instanceList'))
+                for curInstance in self.instanceList:
+                    xmlCurInstance = ET.Element('instance')
+                    curInstance.writeXMLData(curInstance, xmlCurInstance, channelMappingPackage,
+                                             self.channelData, xmlWriter)
+                xmlWriter.endElement()
+                xmlWriter.endElement()
+            return
+
+        xmlInstanceList = ET.SubElement(xmlRoot, 'instanceList')
         for curInstance in self.instanceList:
             xmlCurInstance = ET.SubElement(xmlInstanceList, 'instance')
             curInstance.writeXMLData(curInstance, xmlCurInstance, channelMappingPackage, self.channelData)
@@ -934,7 +2050,12 @@ class ScenegraphRoot(Group):
         xmlTree = ET.ElementTree(xmlRoot)
         xmlTree.write(filepath)
 
-    def readXMLFile(self, filepath):
+    def readXMLFile(self, filepath, lazy=False):
+        """
+        Reads the scenegraph from filepath. With lazy set, scenegraph elements
+        are only created from the XML data when the instanceList holding them
+        is first accessed.
+        """
         log.debug('\nreading XML file %s' % filepath)
         if not os.path.isfile(filepath):
             raise ValueError('File not found: "%s"' % filepath)
@@ -949,14 +2070,19 @@ class ScenegraphRoot(Group):
             self.channelData = ChannelData()
             self.channelData.readXMLData(xmlChannelData)
         else:
-            self.ChannelData = None
+            self.channelData = None
 
         xmlInstanceList = xmlRoot.find('instanceList')
         if xmlInstanceList is None:
             raise ValueError('Cannot find XML element "instanceList" when reading XML data for ScenegraphRoot')
+        baseDir = os.path.dirname(os.path.abspath(filepath))
         self.instanceList = []
+        if lazy:
+            self._xmlInstanceList = xmlInstanceList
+            self._xmlBaseDir = baseDir
+            return
         for xmlCurInstance in xmlInstanceList:
-            curInstance = createScenegraphElementFromXMLData(xmlCurInstance)
+            curInstance = createScenegraphElementFromXMLData(xmlCurInstance, baseDir=baseDir)
             self.instanceList.append(curInstance)
 
     def addChannelMapping(self, channelNo, element):
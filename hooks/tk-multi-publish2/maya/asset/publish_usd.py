@@ -19,6 +19,9 @@ from pxr import Kind, Sdf, Usd, UsdGeom
 import sgtk
 from tank_vendor import six
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+import software_registry
+
 HookBaseClass = sgtk.get_hook_baseclass()
 
 
@@ -615,15 +618,11 @@ class MayaSessionUSDPublishPlugin(HookBaseClass):
 
             sg = engine.shotgun
 
-            filters = [
-                ['projects', 'is', {'type': 'Project', 'name': project_info['name'], 'id': project_info['id']}],
-                ['code', 'is', 'Maya '+ maya_major]
-            ]
-
-            fields = ['sg_rez']
-
-            rez_packages = sg.find_one('Software', filters, fields)
-            rez_packages_list = rez_packages['sg_rez'].split(',')
+            # the farm runs linux
+            registry = software_registry.get_registry(engine.sgtk, project_info)
+            rez_packages_list = registry.get_packages('Maya '+ maya_major, 'linux')
+            if not rez_packages_list:
+                raise Exception('No rez packages are set for the Software "Maya {}".'.format(maya_major))
 
             argv = ['rez-env']
             argv += rez_packages_list
@@ -16,6 +16,83 @@ import sgtk
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
+CAMERA_TRANSFORMS = ['mmCam','layoutCam','aniCam','renderCam','projectionCam']
+DUMMY_TRANSFORMS = ['mmGeom','aniGeom']
+
+
+class SceneIndex(object):
+    """
+    Transforms of the scene listed once per collection, by role :
+
+        setgrp        top level set groups
+        cache_grp     cache groups outside of the set groups
+        simDummy_grp  sim dummy groups
+        bone_grp      bone groups outside of the set groups
+        camera        shot cameras, CAMERA_TRANSFORMS
+        dummy         shot dummies, DUMMY_TRANSFORMS
+
+    with the long name, parent and transform children of each transform.
+    Names are the short names of cmds.ls, in scene order.
+    """
+
+    def __init__(self):
+
+        names = cmds.ls(type="transform") or []
+        long_names = cmds.ls(type="transform",l=1) or []
+        if len(long_names) != len(names):
+            long_names = [cmds.ls(x,l=1)[0] for x in names]
+
+        self.long_names = dict(zip(names,long_names))
+        self.names = dict(zip(long_names,names))
+        self.children = {}
+        self.roles = dict((x,[]) for x in 
+                          ['setgrp','cache_grp','simDummy_grp','bone_grp','camera','dummy'])
+
+        for name,long_name in zip(names,long_names):
+            parent = long_name.rsplit("|",1)[0]
+            if parent:
+                self.children.setdefault(parent,[]).append(long_name)
+            for role in self._classify(name,long_name):
+                self.roles[role].append(name)
+
+    def _classify(self,name,long_name):
+
+        top_level = long_name.count("|") == 1
+        in_set = not long_name.split("|")[1].find("setgrp") == -1
+        roles = []
+        if not name.find('setgrp') == -1 and top_level:
+            roles.append('setgrp')
+        if not name.find('cache_grp') == -1 and not in_set:
+            roles.append('cache_grp')
+        if not name.find('simDummy_grp') == -1:
+            roles.append('simDummy_grp')
+        if not name.find('bone_grp') == -1 and not in_set:
+            roles.append('bone_grp')
+        if name in CAMERA_TRANSFORMS:
+            roles.append('camera')
+        if name in DUMMY_TRANSFORMS:
+            roles.append('dummy')
+        return roles
+
+    def get(self,role):
+        """
+        Short names of the transforms of role
+        """
+        return self.roles[role]
+
+    def get_long_name(self,name):
+        return self.long_names[name]
+
+    def get_parent(self,name):
+        parent = self.long_names[name].rsplit("|",1)[0]
+        return self.names.get(parent)
+
+    def get_children(self,name):
+        """
+        Short names of the transform children of name
+        """
+        return [self.names[x] for x in self.children.get(self.long_names[name],[])]
+
 
 class MayaSessionCollector(HookBaseClass):
     """
@@ -92,6 +169,8 @@ class MayaSessionCollector(HookBaseClass):
                 }
             )
 
+            # every collect method shares one listing of the scene
+            self._scene_index = SceneIndex()
             self.collect_shot(item)
             self.collect_camera(item)
             self.collect_dummy(item)
@@ -348,6 +427,12 @@ class MayaSessionCollector(HookBaseClass):
 
 
 
+    def _get_scene_index(self):
+
+        if getattr(self,'_scene_index',None) is None:
+            self._scene_index = SceneIndex()
+        return self._scene_index
+
     def collect_shot(self,parent_item):
         
         shot_name = parent_item.context.entity['name']
@@ -413,8 +498,7 @@ class MayaSessionCollector(HookBaseClass):
             sub_frame = 0.25
             
         
-        shot_asset_list = [ x for x in cmds.ls(type="transform") if not x.find('setgrp') == -1 
-        and not cmds.listRelatives(x,p=1)] 
+        shot_asset_list = self._get_scene_index().get('setgrp')
         
         for asset in shot_asset_list:
 
@@ -482,11 +566,10 @@ class MayaSessionCollector(HookBaseClass):
         if not sub_frame :
             sub_frame = 0.25
 
-        shot_asset_list = [ x for x in cmds.ls(type="transform") if not x.find('cache_grp') == -1 
-        #and cmds.referenceQuery( x, isNodeReferenced=True )
-        and cmds.ls(x,l=1)[0].split("|")[1].find("setgrp") == -1] 
+        scene_index = self._get_scene_index()
+        shot_asset_list = list(scene_index.get('cache_grp'))
 
-        sim_dummy_list = [ x for x in cmds.ls(type="transform") if not x.find('simDummy_grp') == -1 ]
+        sim_dummy_list = scene_index.get('simDummy_grp')
 
         if sim_dummy_list and cache_type == "abc": 
             shot_asset_list.extend(sim_dummy_list)
@@ -567,8 +650,11 @@ class MayaSessionCollector(HookBaseClass):
         sub_frame = sg.find_one("Shot",[['id','is',entity['id']]],['sg_sub_frame'])['sg_sub_frame']
         
 
-        shot_asset_list = [ cmds.listRelatives(x,c=1)[0].split(":")[-1] for x in cmds.ls(type="transform") if not x.find('cache_grp') == -1 
-        and cmds.ls(x,l=1)[0].split("|")[1].find("setgrp") == -1] 
+        scene_index = self._get_scene_index()
+        shot_asset_list = []
+        for x in scene_index.get('cache_grp'):
+            children = scene_index.get_children(x) or cmds.listRelatives(x,c=1)
+            shot_asset_list.append(children[0].split(":")[-1])
         for asset in shot_asset_list:
             search = [
                 ['project','is',project],
@@ -582,7 +668,6 @@ class MayaSessionCollector(HookBaseClass):
 
     def collect_camera(self,parent_item):
 
-        camera_transform_name = ['mmCam','layoutCam','aniCam','renderCam','projectionCam']
         shot_name = parent_item.context.entity['name']
         start_frame = cmds.playbackOptions(min=1,q=1)
         end_frame = cmds.playbackOptions(max=1,q=1)
@@ -618,57 +703,55 @@ class MayaSessionCollector(HookBaseClass):
             "alembic.png"
         )
         
-        for transform in cmds.ls(type="transform"):
-            if transform in camera_transform_name :
-                component_name = transform
-                camera_usd_item = camera_item.create_item(
-                        "maya.session.camera.usd",
-                        "Usd",
-                        "Export %s USD"%component_name
-                    )
+        for transform in self._get_scene_index().get('camera'):
+            component_name = transform
+            camera_usd_item = camera_item.create_item(
+                    "maya.session.camera.usd",
+                    "Usd",
+                    "Export %s USD"%component_name
+                )
 
-                camera_usd_item.properties['name'] = component_name
-                camera_usd_item.properties['file_extension'] = "usd"
-                camera_usd_item.properties['namespace'] = component_name.split(":")[0]
-                camera_usd_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
-                camera_usd_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
-                camera_usd_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
+            camera_usd_item.properties['name'] = component_name
+            camera_usd_item.properties['file_extension'] = "usd"
+            camera_usd_item.properties['namespace'] = component_name.split(":")[0]
+            camera_usd_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
+            camera_usd_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
+            camera_usd_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
 
-                camera_usd_item.set_icon_from_path(usd_icon_path)
+            camera_usd_item.set_icon_from_path(usd_icon_path)
 
-                camera_abc_item = camera_item.create_item(
-                        "maya.session.camera.abc",
-                        "Alembic",
-                        "Export %s Alembic"%component_name
-                    )
+            camera_abc_item = camera_item.create_item(
+                    "maya.session.camera.abc",
+                    "Alembic",
+                    "Export %s Alembic"%component_name
+                )
                 
-                camera_abc_item.properties['name'] = component_name
-                camera_abc_item.properties['file_extension'] = "abc"
-                camera_abc_item.properties['namespace'] = component_name.split(":")[0]
-                camera_abc_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
-                camera_abc_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
-                camera_abc_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
-                camera_abc_item.set_icon_from_path(abc_icon_path)
-
-                camera_maya_item = camera_item.create_item(
-                        "maya.session.camera.maya",
-                        "Maya File",
-                        "Export %s Maya Ascii"%component_name
-                    )
+            camera_abc_item.properties['name'] = component_name
+            camera_abc_item.properties['file_extension'] = "abc"
+            camera_abc_item.properties['namespace'] = component_name.split(":")[0]
+            camera_abc_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
+            camera_abc_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
+            camera_abc_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
+            camera_abc_item.set_icon_from_path(abc_icon_path)
+
+            camera_maya_item = camera_item.create_item(
+                    "maya.session.camera.maya",
+                    "Maya File",
+                    "Export %s Maya Ascii"%component_name
+                )
 
-                camera_maya_item.properties['name'] = component_name
-                camera_maya_item.properties['file_extension'] = "mb"
-                camera_maya_item.properties['namespace'] = component_name.split(":")[0]
-                camera_maya_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
-                camera_maya_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
-                camera_maya_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
+            camera_maya_item.properties['name'] = component_name
+            camera_maya_item.properties['file_extension'] = "mb"
+            camera_maya_item.properties['namespace'] = component_name.split(":")[0]
+            camera_maya_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
+            camera_maya_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
+            camera_maya_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
 
         self.logger.debug("Collected shot camera : %s"%(shot_name))
 
                 
     def collect_dummy(self,parent_item):
 
-        dummy_transform_name = ['mmGeom','aniGeom']
         shot_name = parent_item.context.entity['name']
         start_frame = cmds.playbackOptions(min=1,q=1)
         end_frame = cmds.playbackOptions(max=1,q=1)
@@ -712,46 +795,44 @@ class MayaSessionCollector(HookBaseClass):
             "alembic.png"
         )
         
-        for transform in cmds.ls(type="transform"):
-            if transform in dummy_transform_name :
-                component_name = transform
-                dummy_usd_item = dummy_item.create_item(
-                        "maya.session.dummy.usd",
-                        "Usd",
-                        "Export %s USD"%component_name
-                    )
+        for transform in self._get_scene_index().get('dummy'):
+            component_name = transform
+            dummy_usd_item = dummy_item.create_item(
+                    "maya.session.dummy.usd",
+                    "Usd",
+                    "Export %s USD"%component_name
+                )
 
-                dummy_usd_item.properties['name'] = component_name
-                dummy_usd_item.properties['file_extension'] = "usd"
-                dummy_usd_item.properties['namespace'] = component_name.split(":")[0]
-                dummy_usd_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
-                dummy_usd_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
-                dummy_usd_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
-                dummy_usd_item.properties['sub_frame'] = sub_frame
+            dummy_usd_item.properties['name'] = component_name
+            dummy_usd_item.properties['file_extension'] = "usd"
+            dummy_usd_item.properties['namespace'] = component_name.split(":")[0]
+            dummy_usd_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
+            dummy_usd_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
+            dummy_usd_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
+            dummy_usd_item.properties['sub_frame'] = sub_frame
 
-                dummy_usd_item.set_icon_from_path(usd_icon_path)
+            dummy_usd_item.set_icon_from_path(usd_icon_path)
 
-                dummy_abc_item = dummy_item.create_item(
-                        "maya.session.dummy.abc",
-                        "Alembic",
-                        "Export %s Alembic"%component_name
-                    )
+            dummy_abc_item = dummy_item.create_item(
+                    "maya.session.dummy.abc",
+                    "Alembic",
+                    "Export %s Alembic"%component_name
+                )
                 
-                dummy_abc_item.properties['name'] = component_name
-                dummy_abc_item.properties['file_extension'] = "abc"
-                dummy_abc_item.properties['namespace'] = component_name.split(":")[0]
-                dummy_abc_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
-                dummy_abc_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
-                dummy_abc_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
-                dummy_abc_item.set_icon_from_path(abc_icon_path)
-                dummy_abc_item.properties['sub_frame'] = sub_frame
+            dummy_abc_item.properties['name'] = component_name
+            dummy_abc_item.properties['file_extension'] = "abc"
+            dummy_abc_item.properties['namespace'] = component_name.split(":")[0]
+            dummy_abc_item.properties['translate'] = cmds.xform(component_name,q=1,t=1)
+            dummy_abc_item.properties['rotate'] = cmds.xform(component_name,q=1,ro=1)
+            dummy_abc_item.properties['scale'] = cmds.xform(component_name,q=1,s=1)
+            dummy_abc_item.set_icon_from_path(abc_icon_path)
+            dummy_abc_item.properties['sub_frame'] = sub_frame
 
 
         self.logger.debug("Collected shot dummy : %s"%(shot_name))
 
     def collect_sim_dummy(self,parent_item):
 
-        dummy_transform_name = ['mmGeom','aniGeom']
         shot_name = parent_item.context.entity['name']
         start_frame = cmds.playbackOptions(min=1,q=1)
         end_frame = cmds.playbackOptions(max=1,q=1)
@@ -790,9 +871,7 @@ class MayaSessionCollector(HookBaseClass):
             "alembic.png"
         )
         
-        shot_sim_dummy_list = [ x for x in cmds.ls(type="transform") if not x.find('bone_grp') == -1 
-        #and cmds.referenceQuery( x, isNodeReferenced=True )
-        and cmds.ls(x,l=1)[0].split("|")[1].find("setgrp") == -1] 
+        shot_sim_dummy_list = self._get_scene_index().get('bone_grp')
 
         for dummy in shot_sim_dummy_list:
             component_name = dummy
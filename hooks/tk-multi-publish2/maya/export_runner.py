@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Export runner of the farm scripts written by MayaToTractor.
+
+MayaToTractor writes this file followed by the job SPEC, a dict :
+
+    {'scene': scene path,
+     'plugins': [plugin, ...],
+     'fork': export each item in a process forked after the scene is loaded,
+     'items': [{'name': node,
+                'select': 'node' or 'cache_grp',
+                'prepare': [camera preparation step, ...],
+                'commands': [mel command, ...],
+                'frames': {frame: mel command, ...},
+                'frame_dir': directory of the frame layers,
+                'layers': [frame layer, ...],
+                'output': stitched layer}, ...]}
+
+and runs it under mayapy :
+
+    mayapy script.py                 exports everything and stitches the frame layers
+    mayapy script.py --frames S E    exports frames S to E of the per frame items
+    mayapy script.py --stitch        stitches the frame layers, without loading maya
+"""
+
+import os
+import sys
+import json
+import errno
+import time
+import traceback
+import subprocess
+
+CAMERA_USD_ATTRIBUTES = [
+    'filmFit', 'filmFitOffset', 'horizontalFilmOffset', 'focalLength', 'postScale',
+    'fStop', 'horizontalFilmAperture', 'overscan', 'verticalFilmOffset',
+    'lensSqueezeRatio', 'verticalFilmAperture', 'filmTranslate', 'preScale',
+    'focusDistance', 'frameRange', 'panZoomEnabled', 'pan', 'zoom', 'cameraScale',
+]
+
+
+def get_camera_shapes(node):
+    import maya.cmds as cmds
+    return [x for x in cmds.listRelatives(node, c=1, f=1, ad=1) or []
+            if cmds.nodeType(x) == "camera"]
+
+
+def camera_usd_attributes(node):
+    import maya.cmds as cmds
+    start = int(cmds.playbackOptions(q=True, min=True))
+    end = int(cmds.playbackOptions(q=True, max=True))
+    exported = json.dumps(dict((x, {}) for x in CAMERA_USD_ATTRIBUTES))
+    for cam_shape in get_camera_shapes(node):
+        cmds.addAttr(cam_shape, ln="frameRange", dt="double2")
+        cmds.setAttr(cam_shape + ".frameRange", start, end, type="double2")
+        cmds.addAttr(cam_shape, ln="USD_UserExportedAttributesJson", dt="string")
+        cmds.setAttr(cam_shape + ".USD_UserExportedAttributesJson", exported, type="string")
+
+
+def camera_reset_pan_zoom(node):
+    import maya.cmds as cmds
+    for shape in get_camera_shapes(node):
+        cmds.setAttr(shape + ".overscan", 1.0)
+        if cmds.getAttr(shape + ".panZoomEnabled") == True:
+            cmds.setAttr(shape + ".pan", 0.0, 0.0, typ="float2")
+            cmds.setAttr(shape + ".zoom", 1.0)
+            if cmds.getAttr(shape + ".renderPanZoom") == True:
+                cmds.setAttr(shape + ".renderPanZoom", False)
+                cmds.setAttr(shape + ".panZoomEnabled", False)
+
+
+PREPARE_STEPS = {
+    'camera_usd_attributes': camera_usd_attributes,
+    'camera_reset_pan_zoom': camera_reset_pan_zoom,
+}
+
+
+def open_scene(spec):
+    import maya.standalone
+    maya.standalone.initialize()
+    import maya.cmds as cmds
+
+    cmds.file(spec['scene'], open=1, force=1, iv=1)
+    for plugin in spec['plugins']:
+        cmds.loadPlugin(plugin)
+
+
+def select_item(item):
+    import maya.cmds as cmds
+    if item.get('select') == 'cache_grp':
+        cache_grp = [x for x in cmds.listRelatives(item['name'], ad=1) if not x.find("cache_grp") == -1]
+        cmds.select(cache_grp)
+    else:
+        cmds.select(item['name'])
+
+
+def export_item(item, frames=None):
+    import maya.mel as mel
+
+    for step in item.get('prepare', []):
+        PREPARE_STEPS[step](item['name'])
+    select_item(item)
+    for command in item.get('commands', []):
+        mel.eval(command)
+
+    if item.get('frames'):
+        # the chunk tasks of the job start together
+        try:
+            os.makedirs(item['frame_dir'])
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        for frame in sorted(item['frames'], key=int):
+            if frames is None or frames[0] <= int(frame) <= frames[1]:
+                mel.eval(item['frames'][frame])
+
+
+def stitch_item(item):
+    missing = [x for x in item['layers'] if not os.path.exists(x)]
+    if missing:
+        raise RuntimeError('missing frame layers : %s' % ' '.join(missing))
+    subprocess.check_call(['usdstitch'] + item['layers'] + ['-o', item['output']])
+
+
+def run_item(item, frames, fork=False):
+    """
+    Exports item, in a forked process if fork. Returns True if it succeeded
+    """
+    if fork:
+        pid = os.fork()
+        if pid:
+            return os.waitpid(pid, 0)[1] == 0
+    try:
+        export_item(item, frames)
+        success = True
+    except Exception:
+        traceback.print_exc()
+        success = False
+    if fork:
+        sys.stdout.flush()
+        os._exit(0 if success else 1)
+    return success
+
+
+def main(spec, args):
+    if '--stitch' in args:
+        for item in spec['items']:
+            if item.get('frames'):
+                stitch_item(item)
+        return
+
+    frames = None
+    if '--frames' in args:
+        index = args.index('--frames')
+        frames = (int(args[index + 1]), int(args[index + 2]))
+
+    open_scene(spec)
+    items = [x for x in spec['items'] if frames is None or x.get('frames')]
+    failed = []
+    for index, item in enumerate(items):
+        print('[%d/%d] exporting %s' % (index + 1, len(items), item['name']))
+        sys.stdout.flush()
+        start = time.time()
+        if run_item(item, frames, spec.get('fork')):
+            print('[%d/%d] exported %s in %.1fs' % (index + 1, len(items), item['name'], time.time() - start))
+        else:
+            failed.append(item['name'])
+            print('[%d/%d] FAILED %s' % (index + 1, len(items), item['name']))
+        # progress shown by tractor
+        print('TR_PROGRESS %d%%' % (100 * (index + 1) // len(items)))
+        sys.stdout.flush()
+    if failed:
+        raise RuntimeError('failed exports : %s' % ' '.join(failed))
+
+    if frames is None:
+        for item in spec['items']:
+            if item.get('frames'):
+                stitch_item(item)
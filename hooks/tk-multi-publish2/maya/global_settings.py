@@ -107,7 +107,7 @@ class BasicFilePublishPlugin(HookBaseClass):
         settings["job_location"] = {
             "type": "int",
             "default": 1,
-            "description": "Send job to local or farm"
+            "description": "farm as an int, exports run on this workstation (0) or on the farm (1)"
         }
         settings["tpose_frame"] = {
             "type": "int",
@@ -147,7 +147,7 @@ class BasicFilePublishPlugin(HookBaseClass):
         settings["farm"] = {
             "type": "bool",
             "default": True,
-            "description": "Submitting job to farm",
+            "description": "Run the exports on the farm instead of this workstation",
         }
         settings["note"] = {
             "type": "bool",
@@ -202,10 +202,6 @@ class BasicFilePublishPlugin(HookBaseClass):
 
     def set_ui_settings(self, widget, settings):
         for setting_block in settings:
-            job_location = setting_block.get("job_location")
-            if job_location:
-                widget.job_location = job_location
-
             tpose_frame = setting_block.get("tpose_frame")
             if tpose_frame:
                 widget.tpose_frame = tpose_frame
@@ -231,7 +227,7 @@ class BasicFilePublishPlugin(HookBaseClass):
                 widget.cache_step = cache_step
 
             farm = setting_block.get( 'farm' )
-            if farm:
+            if farm is not None:
                 widget.farm = farm
 
             note = setting_block.get( 'note' )
@@ -463,6 +459,10 @@ class GlobalSettings(QtGui.QWidget):
     def note( self, value ):
         return self.add_note_chk.setChecked( value )
 
+    @property
+    def job_location( self ):
+        return int( self.farm )
+
     @property
     def farm_grp( self ):
         return self.farm_grp_edt.get_value( )
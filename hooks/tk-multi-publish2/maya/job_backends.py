@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Job backends of MayaToTractor.
+
+MayaToTractor describes its exports as a Job, a tree of Tasks whose commands
+run once their children are done, as in Tractor, and hands it to a backend :
+
+    tractor  spools the job to the Tractor engine
+    local    runs the commands on this workstation, LOCAL_JOB_WORKERS at a
+             time in a process pool, with a log per task in LOCAL_JOB_DIR,
+             retries, cancellation and completion callbacks
+
+The backend is tractor when the farm setting of the Global Settings plugin is
+on, local otherwise, or SGTK_JOB_BACKEND=local|tractor.
+"""
+
+import os
+import sys
+import time
+import errno
+import tempfile
+import signal
+import getpass
+import threading
+import subprocess
+import multiprocessing
+
+TRACTOR_HOSTNAME = os.environ.get('SGTK_TRACTOR_HOSTNAME', '10.0.20.83')
+TRACTOR_SITE_PACKAGES = {
+    'python3': "/westworld/inhouse/tool/rez-packages/tractor/2.2.0/platform-linux/arch-x86_64/lib/python3.6/site-packages",
+    'python2': "/westworld/inhouse/tool/rez-packages/tractor/2.2.0/platform-linux/arch-x86_64/lib/python2.7/site-packages",
+}
+
+LOCAL_JOB_DIR = os.path.join(os.path.expanduser('~'), '.sgtk_local_jobs')
+LOCAL_JOB_WORKERS = int(os.environ.get('SGTK_LOCAL_JOB_WORKERS', max(1, multiprocessing.cpu_count() // 4)))
+# attempts of a failing task after the first one
+LOCAL_JOB_RETRIES = 1
+
+# the publish plugins reload the modules, keep the running local backend
+try:
+    _backends
+except NameError:
+    _backends = {}
+
+# jobs are submitted from the publish pipeline threads, the tractor engine
+# client is shared by the process
+_spool_lock = threading.Lock()
+
+
+class Task(object):
+
+    def __init__(self, title, argv=None):
+        self.title = title
+        self.argv = argv
+        self.children = []
+
+    def addChild(self, task):
+        self.children.append(task)
+
+    def walk(self):
+        """
+        Tasks of the tree, children before their parent
+        """
+        for child in self.children:
+            for task in child.walk():
+                yield task
+        yield self
+
+
+class Job(object):
+
+    def __init__(self, title, service="convert", priority=50, owner=None):
+        self.title = title
+        self.service = service
+        self.priority = priority
+        self.owner = owner or os.environ.get('USER') or getpass.getuser()
+        self.tasks = []
+        # set by the local backend
+        self.id = None
+        self.status = None
+        self.log_dir = None
+        self.futures = {}
+        self.pid_paths = {}
+
+    def addChild(self, task):
+        self.tasks.append(task)
+
+
+class JobBackend(object):
+
+    def submit(self, job, callback=None):
+        """
+        Submits job, callback(job) is called once it is done where the
+        backend can tell
+        """
+        raise NotImplementedError
+
+    def cancel(self, job):
+        raise NotImplementedError
+
+
+class TractorBackend(JobBackend):
+
+    def __init__(self, hostname=TRACTOR_HOSTNAME):
+        self.hostname = hostname
+
+    def _get_author(self):
+        site_packages = TRACTOR_SITE_PACKAGES['python%d' % sys.version_info[0]]
+        if site_packages not in sys.path:
+            sys.path.append(site_packages)
+        import tractor.api.author as author
+        return author
+
+    def _create_task(self, author, task):
+        tractor_task = author.Task(title = str(task.title))
+        if task.argv:
+            tractor_task.addCommand(author.Command(argv=task.argv))
+        for child in task.children:
+            tractor_task.addChild(self._create_task(author, child))
+        return tractor_task
+
+    def submit(self, job, callback=None):
+        author = self._get_author()
+        tractor_job = author.Job()
+        tractor_job.title = str(job.title)
+        tractor_job.service = job.service
+        tractor_job.priority = job.priority
+        for task in job.tasks:
+            tractor_job.addChild(self._create_task(author, task))
+        with _spool_lock:
+            job.id = tractor_job.spool(hostname=self.hostname, owner=job.owner)
+        job.status = 'spooled'
+        return job
+
+    def cancel(self, job):
+        raise NotImplementedError('cancel tractor jobs from the tractor dashboard')
+
+
+def run_command(argv, log_path, pid_path):
+    """
+    Runs argv in a pool process, in its own process group so that it can be
+    cancelled. Returns the exit code.
+    """
+    with open(os.devnull) as devnull, open(log_path, 'a') as log_file:
+        log_file.write('%s %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), ' '.join(argv)))
+        log_file.flush()
+        proc = subprocess.Popen(argv, stdin=devnull, stdout=log_file, stderr=subprocess.STDOUT,
+                                preexec_fn=os.setsid)
+        with open(pid_path, 'w') as f:
+            f.write(str(proc.pid))
+        return proc.wait()
+
+
+class LocalBackend(JobBackend):
+
+    def __init__(self, max_workers=LOCAL_JOB_WORKERS, retries=LOCAL_JOB_RETRIES, job_dir=LOCAL_JOB_DIR):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.retries = retries
+        self.job_dir = job_dir
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job, callback=None):
+        try:
+            os.makedirs(self.job_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # job_dir is shared by the Maya sessions of the user, mkdtemp gives
+        # each job its own log directory
+        job.log_dir = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d_%H%M%S_'), dir=self.job_dir)
+        job.id = os.path.basename(job.log_dir)
+        job.status = 'running'
+        with self.lock:
+            self.jobs[job.id] = job
+
+        thread = threading.Thread(target=self._run, args=(job, callback))
+        thread.daemon = True
+        thread.start()
+        return job
+
+    def _log(self, job, message):
+        with open(os.path.join(job.log_dir, 'job.log'), 'a') as f:
+            f.write('%s %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+
+    def _task_paths(self, job, index, task):
+        name = '%03d_%s' % (index, ''.join(x if x.isalnum() else '_' for x in task.title))
+        return os.path.join(job.log_dir, name + '.log'), os.path.join(job.log_dir, name + '.pid')
+
+    def _run(self, job, callback):
+        """
+        Runs the tasks of job whose children are done, until all are done or
+        one fails all its attempts
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        tasks = [x for root in job.tasks for x in root.walk()]
+        indexes = dict((id(x), i) for i, x in enumerate(tasks))
+        pending = list(tasks)
+        done = set()
+        attempts = {}
+        running = job.futures
+        self._log(job, 'started %s, %d tasks' % (job.title, len(tasks)))
+
+        while job.status == 'running' and (pending or running):
+            for task in [x for x in pending if all(id(c) in done for c in x.children)]:
+                pending.remove(task)
+                if not task.argv:
+                    done.add(id(task))
+                    continue
+                attempts[id(task)] = attempts.get(id(task), 0) + 1
+                log_path, pid_path = self._task_paths(job, indexes[id(task)], task)
+                job.pid_paths[id(task)] = pid_path
+                running[self.executor.submit(run_command, task.argv, log_path, pid_path)] = task
+            if not running:
+                continue
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    exit_code = future.result()
+                except Exception as err:
+                    exit_code = err
+                if exit_code == 0:
+                    done.add(id(task))
+                    self._log(job, 'done %s' % task.title)
+                elif attempts[id(task)] <= self.retries and job.status == 'running':
+                    self._log(job, 'retrying %s, exit code %s' % (task.title, exit_code))
+                    pending.append(task)
+                elif job.status == 'running':
+                    self._log(job, 'failed %s, exit code %s' % (task.title, exit_code))
+                    job.status = 'failed'
+
+        if job.status == 'running':
+            job.status = 'done'
+        else:
+            self._terminate(job, running)
+        self._log(job, job.status)
+        if callback:
+            try:
+                callback(job)
+            except Exception as err:
+                self._log(job, 'completion callback failed : %s' % err)
+
+    def _terminate(self, job, running):
+        for future, task in list(running.items()):
+            if future.cancel():
+                continue
+            try:
+                with open(job.pid_paths[id(task)]) as f:
+                    os.killpg(int(f.read()), signal.SIGTERM)
+            except (IOError, OSError, ValueError):
+                # not started yet or already finished
+                pass
+
+    def cancel(self, job):
+        """
+        Stops job, its running commands are terminated
+        """
+        if job.status == 'running':
+            job.status = 'cancelled'
+            self._terminate(job, dict(job.futures))
+
+
+def get_backend(name):
+    """
+    Returns the backend called name, local backends are shared by the process
+    """
+    name = os.environ.get('SGTK_JOB_BACKEND', name)
+    if name == 'local':
+        if 'local' not in _backends:
+            _backends['local'] = LocalBackend()
+        return _backends['local']
+    return TractorBackend()
@@ -270,7 +270,8 @@ class MayaSessionComponentXMLPublishPlugin(HookBaseClass):
             start_frame, end_frame = _find_scene_animation_range()
 
             if start_frame and end_frame:
-                maya2scenegraphXML.maya2ScenegraphXML([component],publish_path  ,start_frame,end_frame)
+                maya2scenegraphXML.maya2ScenegraphXML([component],publish_path  ,start_frame,end_frame,
+                    foldStaticChannels=True)
             else:
                 maya2scenegraphXML.maya2ScenegraphXML([component],publish_path,1,1 )
             maya2scenegraphXML.deleteSgxmlAttrs([component])
@@ -9,16 +9,23 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import sys
 import pprint
 import maya.cmds as cmds
 import maya.mel as mel
 import sgtk
 from tank_vendor import six
 
+# to_tractor is in the maya hooks folder
+_maya_hooks = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _maya_hooks not in sys.path:
+    sys.path.append(_maya_hooks)
+import to_tractor
+
 HookBaseClass = sgtk.get_hook_baseclass()
 
 
-class MayaSessionShotCameraUSDPublishPlugin(HookBaseClass):
+class MayaSessionShotCameraUSDPublishPlugin(to_tractor.FarmBatchPlugin, HookBaseClass):
     """
     Plugin for publishing an open maya session.
 
@@ -351,6 +358,7 @@ def _to_tractor(instance,item,mel_command):
     tractor.create_script(mel_command)
     tractor.to_tractor(start_frame,end_frame,file_type)
 
+
 def _find_scene_animation_range():
     """
     Find the animation range from the current scene.
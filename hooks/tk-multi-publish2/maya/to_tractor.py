@@ -2,9 +2,47 @@
 
 import os 
 import sys
+import json
 import maya.cmds as cmds
 import sgtk
 
+# the publish plugins reload this module, add the paths once
+for _path in (os.path.dirname(os.path.dirname(os.path.dirname(__file__))), os.path.dirname(__file__)):
+    if _path not in sys.path:
+        sys.path.append(_path)
+import software_registry
+import publish_pipeline
+import job_backends
+
+
+RUNNER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export_runner.py')
+# frames exported by each tractor task of a per frame export
+FRAME_CHUNK_SIZE = 10
+# exports of one publish go to a single job which opens the scene once,
+# SGTK_FARM_BATCH=0 submits a job per item
+FARM_BATCH = os.environ.get('SGTK_FARM_BATCH', '1') == '1'
+# export each item of a batch in a process forked after the scene is loaded
+FARM_BATCH_FORK = os.environ.get('SGTK_FARM_BATCH_FORK') == '1'
+
+# the publish plugins reload this module, keep the batch being collected
+try:
+    _batch
+except NameError:
+    _batch = []
+
+
+def get_plugins(version, camera=False):
+    if version == "2022":
+        return ["mayaUsdPlugin.so", "AbcExport.so"]
+    if camera:
+        return ["pxrUsd.so", "AbcExport.so"]
+    return ["pxrUsd.so", "cvJiggle.so", "cvwrap.so", "iDeform.so", "weightDriver.so", "AbcExport.so"]
+
+
+def get_chunks(start_frame, end_frame, chunk_size):
+    return [(x, min(x + chunk_size - 1, end_frame))
+            for x in range(start_frame, end_frame + 1, chunk_size)]
+
 
 class MayaToTractor(object):
 
@@ -12,209 +50,100 @@ class MayaToTractor(object):
 
         self.item = item
         self._temp_file = os.path.splitext(item.properties["path"])[0]+".py"
+        self._spec = None
+        self._chunks = None
 
-    def create_add_frame_script(self,mel_command,sf,ef):
-        
-        version = cmds.about(version=1)
+    def _new_spec(self, plugins):
 
-        original = mel_command
-        mel_split  = original.split()
-        orignal_file = mel_split[-1]
-        original_path = os.path.dirname(orignal_file)
-        original_file_name =os.path.basename(orignal_file)
-        temp_path = os.path.join(original_path,os.path.basename(orignal_file).split(".")[0]+"_fr")
+        return {
+            'scene': cmds.file(query=True, sn=True),
+            'plugins': plugins,
+            'items': [],
+        }
 
-        script = ''
-        script += 'import maya.standalone\n'
-        script += 'maya.standalone.initialize()\n'
-        script += 'import maya.cmds as cmds\n'
-        script += 'import maya.mel as mel\n'
-        script += 'import os\n'
+    def _write_script(self):
+        """
+        Writes the export runner followed by the job spec, see export_runner.py
+        """
+        with open(RUNNER_PATH) as f:
+            runner = f.read()
 
-        script += '\n'
-        script += '\n'
+        with open( self._temp_file, 'w' ) as f:
+            f.write(runner)
+            f.write('\n\nSPEC = json.loads({!r})\n'.format(json.dumps(self._spec)))
+            f.write('\nif __name__ == "__main__":\n    main(SPEC, sys.argv[1:])\n')
 
-        script += 'cmds.file("{}",open=1,force=1,iv=1)\n'.format(cmds.file(query=True, sn=True))
+    def _select_mode(self):
 
         if not self.item.properties['name'].find("setgrp") == -1:
             cache_grp = [x for x in cmds.listRelatives(
                 self.item.properties['name'],ad=1) 
                          if not x.find("cache_grp") == -1]
             if cache_grp:
-                script += 'cache_grp = [x for x in cmds.listRelatives("{}",ad=1) if not x.find("cache_grp") == -1 ]\n'.format(self.item.properties['name'])
-                script += 'cmds.select(cache_grp)\n'
-            else:
-                script += 'cmds.select("{}")\n'.format(self.item.properties['name'])
-        else:
-            script += 'cmds.select("{}")\n'.format(self.item.properties['name'])
-
-        if version == "2022":
-            script += 'cmds.loadPlugin("mayaUsdPlugin.so")\n'
-        else:
-            script += 'cmds.loadPlugin("pxrUsd.so")\n'
-            script += 'cmds.loadPlugin("cvJiggle.so")\n'
-            script += 'cmds.loadPlugin("cvwrap.so")\n'
-            script += 'cmds.loadPlugin("iDeform.so")\n'
-            script += 'cmds.loadPlugin("weightDriver.so")\n'
-        script += 'cmds.loadPlugin("AbcExport.so")\n'
-        
+                return 'cache_grp'
+        return 'node'
+
+    def create_add_frame_script(self,mel_command,sf,ef,chunk_size=FRAME_CHUNK_SIZE):
+        """
+        Exports each frame to its own layer, in tasks of chunk_size frames,
+        and stitches the layers to the original output in a last task
+        """
+        mel_split  = mel_command.split()
+        original_file = mel_split[-1].strip('"')
+        original_name = os.path.basename(original_file).split(".")[0]
+        frame_dir = os.path.join(os.path.dirname(original_file), original_name + "_fr")
+
+        frames = {}
+        layers = []
         for frame in range(sf,ef+1):
-
-            mel_split  = original.split()
-            #if not frame == sf:
-            #    append_index = mel_split.index("usdExport") + 1
-            #    mel_split.insert(append_index,"-a")
-            #    mel_split.insert(append_index+1,"1")
+            mel_split  = mel_command.split()
             frame_index = mel_split.index("-fr")+1
             mel_split[frame_index] = "{}".format(frame)
             mel_split[frame_index + 1] = "{}".format(frame)
-            file_name = mel_split[-1]
-            frame_file_name = original_file_name.split(".")[0] + '_{}.usd"'.format(frame)
-            frame_file_name = os.path.join(temp_path,frame_file_name)
-            mel_split[-1] = frame_file_name
-            mel_command = " ".join(mel_split)
-            script += 'mel.eval(\'{}\')\n'.format(mel_command)
-        
-        
-        script += 'os.system("usdstitch {0}/*.usd -o {1}")\n'.format(temp_path[1:],orignal_file[1:-1])
-        
-
-        with open( self._temp_file, 'w' ) as f:
-            f.write(script)
+            layers.append(os.path.join(frame_dir, '{}_{}.usd'.format(original_name, frame)))
+            mel_split[-1] = '"{}"'.format(layers[-1])
+            frames[str(frame)] = " ".join(mel_split)
+
+        self._spec = self._new_spec(get_plugins(cmds.about(version=1)))
+        self._spec['items'].append({
+            'name': self.item.properties['name'],
+            'select': self._select_mode(),
+            'frames': frames,
+            'frame_dir': frame_dir,
+            'layers': layers,
+            'output': original_file,
+        })
+        self._chunks = get_chunks(sf, ef, max(1, chunk_size))
+        self._write_script()
 
     def create_script(self,mel_command):
 
-        version = cmds.about(version=1)
-        script = ''
-        script += 'import maya.standalone\n'
-        script += 'maya.standalone.initialize()\n'
-        script += 'import maya.cmds as cmds\n'
-        script += 'import maya.mel as mel\n'
-
-        script += '\n'
-        script += '\n'
-
-        script += 'cmds.file("{}",open=1,force=1,iv=1)\n'.format(cmds.file(query=True, sn=True))
-        script += 'cmds.select("{}")\n'.format(self.item.properties['name'])
-        if version == "2022":
-            script += 'cmds.loadPlugin("mayaUsdPlugin.so")\n'
-        else:
-            script += 'cmds.loadPlugin("pxrUsd.so")\n'
-            script += 'cmds.loadPlugin("cvJiggle.so")\n'
-            script += 'cmds.loadPlugin("cvwrap.so")\n'
-            script += 'cmds.loadPlugin("iDeform.so")\n'
-            script += 'cmds.loadPlugin("weightDriver.so")\n'
-        script += 'cmds.loadPlugin("AbcExport.so")\n'
-        script += 'mel.eval(\'{}\')\n'.format(mel_command)
-        
-        
-
-        with open( self._temp_file, 'w' ) as f:
-            f.write(script)
+        self._spec = self._new_spec(get_plugins(cmds.about(version=1)))
+        self._spec['items'].append({
+            'name': self.item.properties['name'],
+            'commands': [mel_command],
+        })
+        self._write_script()
 
     def create_camera_usd_script(self,mel_command):
 
-
-        version = cmds.about(version=1)
-        script = ''
-        script += 'import maya.standalone\n'
-        script += 'maya.standalone.initialize()\n'
-        script += 'import maya.cmds as cmds\n'
-        script += 'import maya.mel as mel\n'
-        
-        usd_attribute = ''
-        usd_attribute
-
-        script += '\n'
-        script += '\n'
-        
-        script += 'cmds.file("{}",open=1,force=1,iv=1)\n'.format(cmds.file(query=True, sn=True))
-        script += 'start = int(cmds.playbackOptions(q=True, min=True))\n'
-        script += 'end = int(cmds.playbackOptions(q=True, max=True))\n'
-        script += '''camera_shapes = [ x for x in cmds.listRelatives("{}",c=1,f=1,ad=1) 
-                                    if cmds.nodeType(x) == "camera"]\n'''.format(self.item.properties['name'])
-        script += 'for cam_shape in camera_shapes:\n'
-        script += '    cmds.addAttr(cam_shape,ln="frameRange",dt="double2")\n'
-        script += '    cmds.setAttr(cam_shape + ".frameRange",start ,end,type="double2")\n'
-        script += '    cmds.addAttr(cam_shape,ln="USD_UserExportedAttributesJson",dt="string")\n'
-        script += '''    cmds.setAttr(cam_shape+".USD_UserExportedAttributesJson",\
-'{"filmFit": {},\
-"filmFitOffset": {},\
-"horizontalFilmOffset": {}, \
-"focalLength": {},\
-"postScale": {},\
-"fStop": {},\
-"horizontalFilmAperture": {},\
-"overscan": {},\
-"verticalFilmOffset": {},\
-"lensSqueezeRatio": {},\
-"verticalFilmAperture": {},\
-"filmTranslate": {},\
-"preScale": {},\
-"focusDistance": {},\
-"frameRange": {},\
-"panZoomEnabled": {},\
-"pan": {},\
-"zoom": {},\
-"cameraScale": {}}',type="string")\n'''
-        script += 'cmds.select("{}")\n'.format(self.item.properties['name'])
-        if version == "2022":
-            script += 'cmds.loadPlugin("mayaUsdPlugin.so")\n'
-        else:
-            script += 'cmds.loadPlugin("pxrUsd.so")\n'
-        script += 'cmds.loadPlugin("AbcExport.so")\n'
-
-        script += 'for shape in camera_shapes:\n'
-        script += '    cmds.setAttr(shape + ".overscan", 1.0)\n'
-        script += '    if cmds.getAttr(shape + ".panZoomEnabled") == True:\n'
-        script += '        cmds.setAttr(shape + ".pan", 0.0, 0.0, typ="float2")\n'
-        script += '        cmds.setAttr(shape + ".zoom", 1.0)\n'
-        script += '        if cmds.getAttr(shape + ".renderPanZoom") == True:\n'
-        script += '            cmds.setAttr(shape + ".renderPanZoom", False)\n'
-        script += '            cmds.setAttr(shape + ".panZoomEnabled", False)\n'
-        script += 'mel.eval(\'{}\')\n'.format(mel_command)
-        
-        
-
-        with open( self._temp_file, 'w' ) as f:
-            f.write(script)
+        self._spec = self._new_spec(get_plugins(cmds.about(version=1), camera=True))
+        self._spec['items'].append({
+            'name': self.item.properties['name'],
+            'prepare': ['camera_usd_attributes', 'camera_reset_pan_zoom'],
+            'commands': [mel_command],
+        })
+        self._write_script()
 
     def create_camera_abc_script(self,mel_command):
 
-        script = ''
-        script += 'import maya.standalone\n'
-        script += 'maya.standalone.initialize()\n'
-        script += 'import maya.cmds as cmds\n'
-        script += 'import maya.mel as mel\n'
-        
-        usd_attribute = ''
-        usd_attribute
-
-        script += '\n'
-        script += '\n'
-        
-        script += 'cmds.file("{}",open=1,force=1,iv=1)\n'.format(cmds.file(query=True, sn=True))
-        script += 'start = int(cmds.playbackOptions(q=True, min=True))\n'
-        script += 'end = int(cmds.playbackOptions(q=True, max=True))\n'
-        script += '''camera_shapes = [ x for x in cmds.listRelatives("{}",c=1,f=1,ad=1) 
-                                    if cmds.nodeType(x) == "camera"]\n'''.format(self.item.properties['name'])
-        script += 'cmds.select("{}")\n'.format(self.item.properties['name'])
-        script += 'cmds.loadPlugin("AbcExport.so")\n'
-
-        script += 'for shape in camera_shapes:\n'
-        script += '    cmds.setAttr(shape + ".overscan", 1.0)\n'
-        script += '    if cmds.getAttr(shape + ".panZoomEnabled") == True:\n'
-        script += '        cmds.setAttr(shape + ".pan", 0.0, 0.0, typ="float2")\n'
-        script += '        cmds.setAttr(shape + ".zoom", 1.0)\n'
-        script += '        if cmds.getAttr(shape + ".renderPanZoom") == True:\n'
-        script += '            cmds.setAttr(shape + ".renderPanZoom", False)\n'
-        script += '            cmds.setAttr(shape + ".panZoomEnabled", False)\n'
-        script += 'mel.eval(\'{}\')\n'.format(mel_command)
-        
-        
-
-        with open( self._temp_file, 'w' ) as f:
-            f.write(script)
+        self._spec = self._new_spec(["AbcExport.so"])
+        self._spec['items'].append({
+            'name': self.item.properties['name'],
+            'prepare': ['camera_reset_pan_zoom'],
+            'commands': [mel_command],
+        })
+        self._write_script()
 
     def _get_default_command(self): 
         
@@ -222,21 +151,14 @@ class MayaToTractor(object):
         engine = sgtk.platform.current_engine()
         context = engine.context
         project = context.project
-        sg = engine.shotgun
         if version == "2022":
             version="2022.1"
 
-
-        filter_dict = [['code', 'is', 'Maya ' + version], ['projects', 'in', project]]
-        packages = sg.find("Software", filter_dict, ['sg_rez'])
-        if packages:
-            packages = packages[0]['sg_rez']
-            pkg_list = packages.split(',')
-        else:
-            filter_dict = [['code', 'is', "Maya " + version], ['projects', 'is', None]]
-            packages = sg.find("Software", filter_dict, ['sg_rez'])
-            packages = packages[0]['sg_rez']
-            pkg_list = packages.split(',')
+        # the farm runs linux
+        registry = software_registry.get_registry(engine.sgtk, project)
+        pkg_list = registry.get_packages('Maya ' + version, 'linux')
+        if not pkg_list:
+            raise Exception('No rez packages are set for the Software "Maya {}".'.format(version))
 
         #maya_ver = [pkg[:-4] for pkg in pkg_list if 'maya-' in pkg][0]
         #packages = [pkg for pkg in pkg_list if 'maya-' not in pkg]
@@ -244,18 +166,39 @@ class MayaToTractor(object):
         return command
 
     def to_tractor(self,start_frame,end_frame,file_type):
-        
-        version = cmds.about(version=1)
-        if version == "2022":
-            sys.path.append("/westworld/inhouse/tool/rez-packages/tractor/2.2.0/platform-linux/arch-x86_64/lib/python3.6/site-packages")
-        else:
-            sys.path.append("/westworld/inhouse/tool/rez-packages/tractor/2.2.0/platform-linux/arch-x86_64/lib/python2.7/site-packages")
 
-        import tractor.api.author as author
+        if FARM_BATCH and not self._chunks:
+            # entries left by a publish which failed before finalize
+            root = _get_root(self.item)
+            _batch[:] = [x for x in _batch if _get_root(x[0].item) is root and x[0].item is not self.item]
+            _batch.append((self, start_frame, end_frame, file_type))
+            return
+        self._spool(str(self.item.properties['name']), start_frame, end_frame, file_type)
+
+    def _get_job_location(self):
+        """
+        tractor if the farm setting of the Global Settings plugin is on or
+        there is no such plugin, local if it is off, when the export_shot
+        plugins export in the session
+        """
+        item = self.item
+        while item:
+            for task in getattr(item, 'tasks', []):
+                # the Global Settings plugin is the one with a farm setting
+                if 'farm' in task.settings:
+                    return 'tractor' if task.settings['farm'].value else 'local'
+            item = item.parent
+        return 'tractor'
+
+    def _on_job_done(self, job):
+
+        logger = sgtk.platform.current_engine().logger
+        if job.status == 'done':
+            logger.info("Local export job %s is done" % job.title)
+        else:
+            logger.error("Local export job %s %s, see the logs in %s" % (job.title, job.status, job.log_dir))
 
-        job = author.Job()
-        job.service = "convert"
-        job.priority = 50
+    def _spool(self,name,start_frame,end_frame,file_type):
         
         file_title = cmds.file(query=True, sn=True).split(".")[0].split("/")[-1]
         project_name =self.item.context.project['name']
@@ -267,32 +210,102 @@ class MayaToTractor(object):
         title.append(user_name)
         title.append(project_name)
         title.append(file_title)
-        title.append(self.item.properties['name'])
+        title.append(name)
         title.append("%d - %d"%(start_frame,end_frame))
         title.append(file_type)
         title = temp.join(title)
         title = "["+title+"]"
-        job.title = str(title)
+        job = job_backends.Job(str(title), owner=user_id)
 
         master_command = self._get_default_command()
         command = master_command[:] + ['--', 'mayapy']
-
         command.append(self._temp_file)
-        command = author.Command(argv=command)
 
-        task = author.Task(title = str(self.item.properties['name']))
-        task.addCommand(command)
+        if self._chunks:
+            # one task per chunk of frames, stitched once they are all done
+            task = job_backends.Task("stitch {}".format(name), command + ['--stitch'])
+            for chunk_start, chunk_end in self._chunks:
+                task.addChild(job_backends.Task(
+                    "{} {}-{}".format(name, chunk_start, chunk_end),
+                    command + ['--frames', str(chunk_start), str(chunk_end)]))
+        else:
+            task = job_backends.Task(name, command)
 
-        rm_command = ['/bin/rm','-f']
-        rm_command.append(self._temp_file)
-        rm_command = author.Command(argv=rm_command)
-        rm_task = author.Task(title = "rm tmp")
-        rm_task.addCommand(rm_command)
-        
+        rm_task = job_backends.Task("rm tmp", ['/bin/rm','-f', self._temp_file])
         rm_task.addChild(task)
-
-
         job.addChild(rm_task)
 
-        job.spool(hostname="10.0.20.83",owner=user_id)
-
+        backend = job_backends.get_backend(self._get_job_location())
+        pipeline = publish_pipeline.get_active_pipeline(self.item)
+        if pipeline is not None:
+            # spooled while the next items are published
+            pipeline.submit(self.item, "Farm submission of %s" % name, self._submit, backend, job)
+            return job
+        return self._submit(backend, job)
+
+    def _submit(self, backend, job, logger=None):
+
+        backend.submit(job, callback=self._on_job_done)
+        if logger:
+            logger.info("Submitted %s, job %s" % (job.title, job.id))
+        return job
+
+def _get_root(item):
+
+    while item.parent:
+        item = item.parent
+    return item
+
+
+# a reloaded class would not be a base of the plugins which inherit it
+try:
+    FarmBatchPlugin
+except NameError:
+    class FarmBatchPlugin(object):
+        """
+        Base of the publish plugins exporting with to_tractor, whose finalize
+        submits the exports collected during publish as one job
+        """
+
+        def finalize(self, settings, item):
+            submit_batch()
+            super(FarmBatchPlugin, self).finalize(settings, item)
+
+
+def submit_batch():
+    """
+    Submits the exports collected by to_tractor as one job, called by the
+    finalize of FarmBatchPlugin. The first call submits, the next ones find
+    the batch empty.
+    """
+    if not _batch:
+        return
+    batch = list(_batch)
+    del _batch[:]
+
+    first = batch[0][0]
+    if len(batch) == 1:
+        return first._spool(str(first.item.properties['name']), *batch[0][1:])
+
+    tractor = MayaToTractor(first.item)
+    scene_name = os.path.splitext(os.path.basename(cmds.file(query=True, sn=True)))[0]
+    tractor._temp_file = os.path.join(os.path.dirname(first._temp_file), scene_name + "_batch.py")
+    tractor._spec = tractor._new_spec([])
+    tractor._spec['fork'] = FARM_BATCH_FORK
+    for item_tractor, start_frame, end_frame, file_type in batch:
+        for plugin in item_tractor._spec['plugins']:
+            if plugin not in tractor._spec['plugins']:
+                tractor._spec['plugins'].append(plugin)
+        tractor._spec['items'] += item_tractor._spec['items']
+        # the item scripts are not run
+        if os.path.exists(item_tractor._temp_file):
+            os.remove(item_tractor._temp_file)
+    tractor._write_script()
+
+    file_types = []
+    for x in batch:
+        if x[3] not in file_types:
+            file_types.append(x[3])
+    return tractor._spool("%d items" % len(batch),
+                   min(x[1] for x in batch), max(x[2] for x in batch),
+                   " ".join(file_types))
@@ -84,7 +84,20 @@ class MayaUnrealTurntablePublishPlugin(HookBaseClass):
                 "description": "Template path for published work files. Should"
                                "correspond to a template defined in "
                                "templates.yml.",
-            }
+            },
+            # the Version created in publish links the publish
+            "Batch Registration": {
+                "type": "bool",
+                "default": False,
+                "description": "Register the publish in finalize with the "
+                               "other publishes of the session.",
+            },
+            "Background Publish": {
+                "type": "bool",
+                "default": False,
+                "description": "Copy and register the publish in a background "
+                               "thread.",
+            },
         }
 
         work_template_setting = {
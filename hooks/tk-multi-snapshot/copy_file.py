@@ -12,6 +12,14 @@ import tank
 from tank import Hook
 import shutil
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import file_transfer
+
+# snapshots are never hardlinked, they would follow the later saves of the
+# work file
+SNAPSHOT_STRATEGIES = ["reflink", "sendfile", "copy"]
 
 
 class CopyFile(Hook):
@@ -37,4 +45,10 @@ class CopyFile(Hook):
             os.makedirs(dirname, 0o777)
             os.umask(old_umask)
 
-        shutil.copy(source_path, target_path)
+        strategy = file_transfer.transfer_file(
+            source_path, target_path, SNAPSHOT_STRATEGIES, self.parent.logger
+        )
+        shutil.copymode(source_path, target_path)
+        self.parent.logger.debug(
+            "Copied '%s' to '%s' with %s." % (source_path, target_path, strategy)
+        )